@@ -1,17 +1,31 @@
 from dotenv import load_dotenv
 import os
+import io
 import json
+import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from flask import Flask, render_template, request, send_file, redirect, url_for, flash, jsonify
+from flask import Flask, Response, stream_with_context, render_template, request, send_file, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
-import docx
-import fitz  # PyMuPDF
-from pptx import Presentation
-from openpyxl import load_workbook
-import xlrd
+from pptx.chart.data import CategoryChartData
+from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION
+from pptx.util import Inches
 from config import llm_config, LLMProvider
 from llm_service import llm_service
+from extraction_cache import extraction_cache
+from llm_cache import llm_cache
+from template_cache import template_cache, TemplateNotFoundError
+from table_profiler import charts_from_documents
+from dedup import deduplicate_documents
+from extractive import extractive_summary
+from map_reduce import SUMMARY_PROMPT, input_budget_chars, reduce_text, split_text, summary_words
+from rate_limit import CallTimings
+from token_budget import (CHARS_PER_TOKEN, estimate_call, estimate_prompt, estimate_tokens, parallel_estimates,
+                          sequential_estimates, trim_to_tokens)
+from slide_parser import IncrementalSlideParser, SLIDES_SCHEMA, parse_slides, repair_json, validate_slides
+from jobs import Job, JobManager, QueueFullError, DONE, ERROR
+from extractor import extract_text_from_file, extract_documents, combine_documents, ExtractionOptions, DEFAULT_EXTRACTION_WORKERS
 import logging
 from logging.handlers import RotatingFileHandler
 import traceback
@@ -25,7 +39,28 @@ app.config['SECRET_KEY'] = 'a-super-secret-key-for-flash-messages'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ARCHIVE_FOLDER'] = 'archive'
 app.config['ALLOWED_EXTENSIONS'] = {'txt', 'pdf', 'docx', 'pptx', 'ppt', 'xlsx', 'xls'}
-app.config['TEMPLATE_PATH'] = os.path.join('static', 'template.pptx')
+app.config['TEMPLATE_PATH'] = template_cache.default_path  # template 'template'; gli altri in SLIDEGURU_TEMPLATE_DIR
+app.config['EXTRACTION_WORKERS'] = int(os.getenv('SLIDEGURU_EXTRACTION_WORKERS', DEFAULT_EXTRACTION_WORKERS))
+app.config['MAX_INPUT_CHARS'] = int(os.getenv('SLIDEGURU_MAX_INPUT_CHARS', 2000000))
+app.config['PDF_MAX_PAGES'] = int(os.getenv('SLIDEGURU_PDF_MAX_PAGES', 0)) or None
+app.config['PDF_SAMPLING'] = os.getenv('SLIDEGURU_PDF_SAMPLING', 'head')  # head, uniform, head_tail
+app.config['PDF_TIME_BUDGET'] = float(os.getenv('SLIDEGURU_PDF_TIME_BUDGET', 0)) or None
+app.config['SHEET_MAX_ROWS'] = int(os.getenv('SLIDEGURU_SHEET_MAX_ROWS', 10000))
+app.config['SHEET_MAX_CELLS'] = int(os.getenv('SLIDEGURU_SHEET_MAX_CELLS', 200000))
+app.config['PROFILE_TABLES'] = os.getenv('SLIDEGURU_PROFILE_TABLES', '1') != '0'
+app.config['LLM_STREAMING'] = os.getenv('SLIDEGURU_LLM_STREAMING', '1') != '0'
+app.config['STRUCTURED_OUTPUT'] = os.getenv('SLIDEGURU_STRUCTURED_OUTPUT', '1') != '0'
+app.config['LLM_CACHE'] = os.getenv('SLIDEGURU_LLM_CACHE', '1') != '0'
+app.config['DEDUP'] = os.getenv('SLIDEGURU_DEDUP', '1') != '0'
+app.config['DEDUP_THRESHOLD'] = float(os.getenv('SLIDEGURU_DEDUP_THRESHOLD', 0.8))  # similarità oltre cui un blocco è un duplicato
+app.config['MAP_REDUCE_WORKERS'] = int(os.getenv('SLIDEGURU_MAP_REDUCE_WORKERS', 4))
+app.config['EXTRACTIVE_RATIO'] = float(os.getenv('SLIDEGURU_EXTRACTIVE_RATIO', 0)) or None  # quota di token conservata, None = disattivato
+app.config['EXTRACTIVE_FIT'] = os.getenv('SLIDEGURU_EXTRACTIVE_FIT', '0') != '0'  # compressione estrattiva invece dei riassunti map-reduce
+app.config['MAX_REQUEST_COST'] = float(os.getenv('SLIDEGURU_MAX_REQUEST_COST', 0)) or None  # USD, None = nessun limite
+app.config['GENERATION_MODE'] = os.getenv('SLIDEGURU_GENERATION_MODE', 'single')  # single, outline
+app.config['OUTLINE_WORKERS'] = int(os.getenv('SLIDEGURU_OUTLINE_WORKERS', 6))
+app.config['JOB_WORKERS'] = int(os.getenv('SLIDEGURU_JOB_WORKERS', 2))
+app.config['JOB_MAX_PENDING'] = int(os.getenv('SLIDEGURU_JOB_MAX_PENDING', 20))
 
 # Logging su file
 if not os.path.exists('logs'):
@@ -34,6 +69,8 @@ file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=3
 file_handler.setLevel(logging.ERROR)
 file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
 app.logger.addHandler(file_handler)
+for module_name in ('extractor', 'extraction_cache', 'jobs', 'map_reduce', 'dedup', 'template_cache', 'llm_service'):
+    logging.getLogger(module_name).addHandler(file_handler)
 
 # Handler globale per errori 500
 @app.errorhandler(500)
@@ -45,6 +82,32 @@ def internal_error(error):
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['ARCHIVE_FOLDER'], exist_ok=True)
 
+# Coda dei job di generazione in background
+job_manager = JobManager(app.config['JOB_WORKERS'], app.config['JOB_MAX_PENDING'])
+
+# Scritture in archivio delle presentazioni già inviate al client
+archive_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slideguru-archive')
+
+PPTX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+# Stadi della pipeline di generazione, nell'ordine di esecuzione
+PIPELINE_STAGES = ['upload', 'extraction', 'generation', 'rendering']
+
+# Titolo della slide che riporta un errore di generazione al posto del contenuto
+GENERATION_ERROR_TITLE = "Errore generazione"
+
+# Modalità di generazione: tutta la presentazione in una chiamata, oppure scaletta e slide in parallelo
+GENERATION_MODES = ('single', 'outline')
+
+# Modalità scaletta: slide massime, token attesi per la scaletta e per ogni slide, slide ipotizzate nel preventivo
+OUTLINE_MAX_SLIDES = 40
+OUTLINE_OUTPUT_TOKENS = 600
+SLIDE_OUTPUT_TOKENS = 400
+OUTLINE_EXPECTED_SLIDES = 12
+
+# Caratteri che in una scaletta testuale indicano un residuo di JSON, non un titolo
+OUTLINE_JSON_CHARS = '[]{}"'
+
 # --- UTILITY ---
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -77,114 +140,466 @@ def save_files_to_session(files, session_path):
             saved_files.append(filepath)
     return saved_files
 
-def create_session_presentation(slides_content, session_path, session_name):
-    """Crea la presentazione nella cartella di sessione"""
-    prs = Presentation(app.config['TEMPLATE_PATH'])
+def add_chart_slide(prs, chart, slide_layout):
+    """Aggiunge una slide con un grafico nativo PowerPoint da una specifica di grafico"""
+    slide = prs.slides.add_slide(slide_layout)
+    slide.shapes.title.text = chart['title']
+    for placeholder in list(slide.placeholders):
+        if placeholder.placeholder_format.idx != 0:
+            placeholder._element.getparent().remove(placeholder._element)
+    
+    chart_data = CategoryChartData()
+    chart_data.categories = chart['categories']
+    for name, values in chart['series'].items():
+        chart_data.add_series(name, values)
+    chart_type = XL_CHART_TYPE.LINE_MARKERS if chart['type'] == 'line' else XL_CHART_TYPE.COLUMN_CLUSTERED
+    graphic_frame = slide.shapes.add_chart(
+        chart_type, Inches(0.5), Inches(1.5),
+        prs.slide_width - Inches(1), prs.slide_height - Inches(2),
+        chart_data
+    )
+    graphic_frame.chart.has_legend = len(chart['series']) > 1
+    if graphic_frame.chart.has_legend:
+        graphic_frame.chart.legend.position = XL_LEGEND_POSITION.BOTTOM
+        graphic_frame.chart.legend.include_in_layout = False
+    return slide
+
+def render_slides(slides_content, charts=None, template=None):
+    """Presentazione da una copia in memoria del template, con eventuali slide di grafici"""
+    presentation_template = template_cache.get(template)
+    prs = presentation_template.new_presentation()
+    # Layout risolti una volta per template: "Titolo e contenuto" e "Solo titolo"
+    content_layout = prs.slide_layouts[presentation_template.layouts['content']]
     for slide_text in slides_content:
-        slide_layout = prs.slide_layouts[1]  # Title and Content
-        slide = prs.slides.add_slide(slide_layout)
+        slide = prs.slides.add_slide(content_layout)
         slide.shapes.title.text = slide_text.get("title", "")
         slide.placeholders[1].text = slide_text.get("content", "")
     
-    output_filename = f"{session_name}_presentation.pptx"
-    output_path = os.path.join(session_path, output_filename)
-    prs.save(output_path)
+    # Grafici generati direttamente dagli aggregati dei fogli di calcolo, senza passare dall'LLM
+    chart_layout = prs.slide_layouts[presentation_template.layouts['title_only']]
+    for chart in charts or []:
+        add_chart_slide(prs, chart, chart_layout)
+    return prs
+
+def render_presentation(slides_content, charts=None, template=None):
+    """File PPTX renderizzato in memoria"""
+    buffer = io.BytesIO()
+    render_slides(slides_content, charts, template).save(buffer)
+    return buffer.getvalue()
+
+def presentation_path(session_path, session_name):
+    return os.path.join(session_path, f"{session_name}_presentation.pptx")
+
+def write_presentation(output_path, data):
+    """Unica scrittura su disco della presentazione; il file compare solo quando è completo"""
+    temp_path = f"{output_path}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, output_path)
+    except OSError as e:
+        app.logger.error(f"Errore nel salvataggio di {output_path}: {str(e)}")
+        raise
     return output_path
 
-def extract_text_from_file(filepath):
-    ext = filepath.rsplit('.', 1)[1].lower()
-    text = ""
+def create_session_presentation(slides_content, session_path, session_name, charts=None, template=None):
+    """Crea la presentazione nella cartella di sessione, con eventuali slide di grafici"""
+    return write_presentation(presentation_path(session_path, session_name),
+                              render_presentation(slides_content, charts, template))
+
+def get_extraction_options():
+    """Opzioni di estrazione derivate dalla configurazione dell'app"""
+    return ExtractionOptions(
+        max_chars=app.config['MAX_INPUT_CHARS'],
+        pdf_max_pages=app.config['PDF_MAX_PAGES'],
+        pdf_sampling=app.config['PDF_SAMPLING'],
+        pdf_time_budget=app.config['PDF_TIME_BUDGET'],
+        sheet_max_rows=app.config['SHEET_MAX_ROWS'],
+        sheet_max_cells=app.config['SHEET_MAX_CELLS'],
+        profile_tables=app.config['PROFILE_TABLES'],
+    )
+
+def save_session_metadata(session_path, **data):
+    """Aggiorna il file session.json con i metadati della sessione"""
+    metadata_path = os.path.join(session_path, 'session.json')
+    metadata = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+    metadata.update(data)
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    return metadata
+
+class PipelineError(Exception):
+    """Errore della pipeline con un messaggio destinato all'utente"""
+
+def requested_template():
+    """Template scelto nel form (None per quello predefinito), verificato prima di avviare la generazione"""
+    name = request.form.get('template') or None
+    if name and name not in template_cache.names():
+        raise TemplateNotFoundError(f"Template non trovato: {name}")
+    return name
+
+def valid_uploaded_files(files):
+    return [f for f in files if f and f.filename != '' and allowed_file(f.filename)]
+
+def start_session(job, valid_files):
+    """Crea la cartella di sessione e vi salva i file caricati (stadio 'upload')"""
+    with job.stage('upload'):
+        # Crea cartella di sessione basata sul primo file
+        first_filename = secure_filename(valid_files[0].filename)
+        session_path, session_name = create_session_folder(first_filename)
+        job.session_path, job.session_name = session_path, session_name
+        
+        # Salva tutti i file nella cartella di sessione
+        return save_files_to_session(valid_files, session_path)
+
+def run_generation_pipeline(job, saved_files, use_cache=True, mode=None, template=None, archive_async=False):
+    """Estrazione, generazione delle slide e rendering della presentazione.
+
+    Aggiorna lo stato degli stadi di `job` e restituisce il percorso del file
+    PPTX nella cartella di sessione. Con `use_cache=False` le slide vengono
+    rigenerate anche se la stessa richiesta è già in cache; `mode` è una delle
+    GENERATION_MODES (default `GENERATION_MODE`); `template` è il nome del
+    template PPTX (default quello predefinito). Con `archive_async=True` i byte
+    della presentazione restano in `job.result_data` e il file in archivio
+    viene scritto in background.
+    """
+    session_path, session_name = job.session_path, job.session_name
+    
+    with job.stage('extraction'):
+        # Estrai il contenuto di tutti i file (in parallelo, nell'ordine originale)
+        documents = extract_documents(saved_files, app.config['EXTRACTION_WORKERS'], get_extraction_options())
+        save_session_metadata(session_path, extraction_times=extraction_metadata(documents))
+        documents = [d for d in documents if d.text.strip()]  # Solo i file con contenuto
+        
+        if not documents:
+            # Rimuovi cartella vuota
+            shutil.rmtree(session_path, ignore_errors=True)
+            raise PipelineError('I file caricati non contengono testo leggibile')
+    
+    with job.stage('generation'):
+        slides_content = generate_slides(job, documents, use_cache, mode)
+    
+    with job.stage('rendering'):
+        # Crea presentazione nella cartella di sessione
+        data = render_presentation(slides_content, charts_from_documents(documents), template)
+        pptx_path = presentation_path(session_path, session_name)
+        if archive_async:
+            job.result_data = data
+            archive_writer.submit(write_presentation, pptx_path, data)
+        else:
+            write_presentation(pptx_path, data)
+    
+    save_session_metadata(session_path, stages=job.to_dict()['stages'])
+    return pptx_path
+
+def extraction_metadata(documents):
+    """Tempi e limiti dell'estrazione di ogni documento, per session.json"""
+    return [{
+        'file': os.path.basename(d.filepath),
+        'format': d.filepath.rsplit('.', 1)[1].lower(),
+        'seconds': round(d.seconds, 3),
+        'chunks': len(d.chunks),
+        'truncated': d.truncated,
+        'timed_out': d.timed_out,
+        'cached': d.cached,
+    } for d in documents]
+
+def generate_slides(job, documents, use_cache=True, mode=None):
+    """Slide dal testo dei documenti estratti, adattato al context window del modello corrente.
+
+    Usata sia dalla pipeline web sia dal batch; i tempi delle chiamate finiscono
+    in `job.metadata['llm_timings']` e in session.json.
+    """
+    if mode not in GENERATION_MODES:
+        mode = app.config['GENERATION_MODE']
+    if app.config['DEDUP']:
+        # Versioni diverse dello stesso documento: pagine, paragrafi e righe ripetuti vanno al modello una volta sola
+        documents, dedup_stats = deduplicate_documents(documents, app.config['DEDUP_THRESHOLD'])
+        job.metadata['dedup'] = dedup_stats
+        save_session_metadata(job.session_path, dedup=dedup_stats)
+        if dedup_stats['saved_tokens']:
+            job.emit('dedup', saved_tokens=dedup_stats['saved_tokens'], input_tokens=dedup_stats['input_tokens'])
+    combined_text = combine_documents(documents, app.config['MAX_INPUT_CHARS'])
+    use_cache = use_cache and app.config['LLM_CACHE']
+    # Attesa nei limitatori dei provider e tempo di generazione, misurati separatamente
+    timings = CallTimings()
+    combined_text = compress_extractive(job, combined_text)
+    combined_text = fit_to_context(job, combined_text, use_cache, timings, mode)
+    # Ogni slide viene notificata ai client appena il modello la completa
+    on_slide = lambda slide: job.emit('slide', title=slide.get('title', ''))
+    if mode == 'outline':
+        slides_content = generate_slide_content_outline(combined_text, on_slide, use_cache=use_cache, timings=timings)
+    elif app.config['LLM_STREAMING']:
+        slides_content = generate_slide_content_stream(
+            combined_text,
+            on_slide=on_slide,
+            use_cache=use_cache,
+            timings=timings
+        )
+    else:
+        slides_content = generate_slide_content(combined_text, use_cache=use_cache, timings=timings)
+    job.metadata['llm_timings'] = timings.to_dict()
+    save_session_metadata(job.session_path, llm_timings=job.metadata['llm_timings'])
+    return slides_content
+
+def generation_failed(slides_content):
+    """True se la generazione non ha prodotto slide ma solo il messaggio di errore"""
+    return any(slide.get('title') == GENERATION_ERROR_TITLE for slide in slides_content)
+
+def generation_budget(model_config):
+    """Caratteri di testo per chiamata, al netto di system prompt e istruzioni"""
+    # In modalità scaletta ogni slide riceve anche l'elenco completo dei titoli
+    titles = ['x' * 80] * OUTLINE_MAX_SLIDES
+    outline_overhead = len(build_expand_context('', titles)) + len(build_expand_prompt(titles, 0))
+    overhead = len(llm_config.get_system_prompt()) + max(len(build_slide_prompt('')), len(SUMMARY_PROMPT), outline_overhead)
+    return input_budget_chars(model_config, overhead)
+
+def estimate_generation(model_config, text, budget, mode='single'):
+    """Preventivo (token, costo, latenza) di tutte le chiamate necessarie a generare le slide dal testo"""
+    system_prompt = llm_config.get_system_prompt()
+    phases = []
+    if len(text) > budget:
+        chunks = split_text(text, budget)
+        words = summary_words(len(chunks), budget)
+        phases.append(parallel_estimates([
+            estimate_prompt(model_config, system_prompt,
+                            SUMMARY_PROMPT.format(index=i + 1, total=len(chunks), words=words, text=chunk),
+                            output_tokens=min(model_config.max_tokens, int(words * 1.5)))
+            for i, chunk in enumerate(chunks)
+        ], app.config['MAP_REDUCE_WORKERS']))
+        # Passata finale sui riassunti, al massimo grande quanto il budget
+        text_tokens = int(min(budget, len(chunks) * words * 7) / CHARS_PER_TOKEN)
+    else:
+        text_tokens = estimate_tokens(text)
+    
+    if mode == 'outline':
+        # Scaletta, poi OUTLINE_EXPECTED_SLIDES slide a ondate di OUTLINE_WORKERS
+        outline_input = estimate_tokens(system_prompt) + text_tokens + estimate_tokens(build_outline_prompt(''))
+        phases.append(estimate_call(model_config, outline_input, min(model_config.max_tokens, OUTLINE_OUTPUT_TOKENS)))
+        slide = estimate_call(model_config, outline_input + OUTLINE_OUTPUT_TOKENS, min(model_config.max_tokens, SLIDE_OUTPUT_TOKENS))
+        phases.append(parallel_estimates([slide] * OUTLINE_EXPECTED_SLIDES, app.config['OUTLINE_WORKERS']))
+    else:
+        phases.append(estimate_call(model_config, estimate_tokens(system_prompt) + text_tokens + estimate_tokens(build_slide_prompt(''))))
+    
+    estimate = sequential_estimates(phases)
+    estimate['mode'] = 'map_reduce' if len(text) > budget else 'single'
+    estimate['generation_mode'] = mode
+    return estimate
+
+def compress_extractive(job, text):
+    """Compressione estrattiva opzionale, senza chiamate al modello.
+
+    Con `EXTRACTIVE_RATIO` conserva quella quota di token; con `EXTRACTIVE_FIT`
+    riduce al context window del modello corrente i testi che non ci entrano,
+    al posto dei riassunti map-reduce.
+    """
+    max_tokens = None
+    if app.config['EXTRACTIVE_FIT']:
+        try:
+            budget = generation_budget(llm_service.resolve_model())
+        except ValueError:
+            budget = None
+        if budget and len(text) > budget:
+            max_tokens = int(budget / CHARS_PER_TOKEN)
+    if not app.config['EXTRACTIVE_RATIO'] and max_tokens is None:
+        return text
+    compressed, stats = extractive_summary(text, app.config['EXTRACTIVE_RATIO'] or 1.0, max_tokens)
+    job.metadata['extractive'] = stats
+    save_session_metadata(job.session_path, extractive=stats)
+    job.emit('extractive', input_tokens=stats['input_tokens'], output_tokens=stats['output_tokens'])
+    return compressed
+
+def fit_to_context(job, text, use_cache=True, timings=None, mode='single'):
+    """Riduce il testo con riassunti map-reduce se supera il context window del modello corrente.
+
+    Prima di qualsiasi chiamata calcola il preventivo di token, costo e latenza
+    (in `job.metadata['estimate']` e in session.json) e rifiuta i job oltre
+    `MAX_REQUEST_COST`.
+    """
     try:
-        if ext == 'txt':
-            with open(filepath, 'r', encoding='utf-8') as f:
-                text = f.read()
-        elif ext == 'pdf':
-            doc = fitz.open(filepath)
-            for page in doc:
-                text += page.get_text()
-        elif ext == 'docx':
-            doc = docx.Document(filepath)
-            for para in doc.paragraphs:
-                text += para.text + '\n'
-        elif ext in ['pptx', 'ppt']:
-            prs = Presentation(filepath)
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text += shape.text + '\n'
-        elif ext == 'xlsx':
-            wb = load_workbook(filepath, data_only=True)
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                text += f"\n--- {sheet_name} ---\n"
-                for row in ws.iter_rows(values_only=True):
-                    if any(cell is not None for cell in row):
-                        text += '\t'.join(str(cell) if cell is not None else '' for cell in row) + '\n'
-        elif ext == 'xls':
-            wb = xlrd.open_workbook(filepath)
-            for sheet_idx in range(wb.nsheets):
-                sheet = wb.sheet_by_index(sheet_idx)
-                text += f"\n--- {sheet.name} ---\n"
-                for row_idx in range(sheet.nrows):
-                    row = [str(sheet.cell_value(row_idx, col_idx)) for col_idx in range(sheet.ncols)]
-                    if any(cell.strip() for cell in row):
-                        text += '\t'.join(row) + '\n'
-    except Exception as e:
-        app.logger.error(f"Errore estrazione testo da {filepath}: {str(e)}")
-        text = f"Errore nella lettura del file {os.path.basename(filepath)}: {str(e)}"
+        model_config = llm_service.resolve_model()
+    except ValueError:
+        # Modello non disponibile: l'errore viene riportato dalla generazione
+        return text
+    system_prompt = llm_config.get_system_prompt()
+    budget = generation_budget(model_config)
+    
+    estimate = estimate_generation(model_config, text, budget, mode)
+    estimate['model'] = model_config.name
+    job.metadata['estimate'] = estimate
+    job.emit('estimate', **estimate)
+    save_session_metadata(job.session_path, estimate=estimate)
+    if app.config['MAX_REQUEST_COST'] and estimate['cost_usd'] > app.config['MAX_REQUEST_COST']:
+        raise PipelineError(f"Costo stimato di {estimate['cost_usd']:.4f} USD oltre il limite di "
+                            f"{app.config['MAX_REQUEST_COST']:.4f} USD ({estimate['input_tokens']} token in input)")
+    
+    # Margine finale sui token effettivi del prompt delle slide
+    if mode == 'outline':
+        titles = ['x' * 80] * OUTLINE_MAX_SLIDES
+        prompt_overhead = estimate_tokens(build_expand_context('', titles)) + estimate_tokens(build_expand_prompt(titles, 0))
+    else:
+        prompt_overhead = estimate_tokens(build_slide_prompt(''))
+    max_text_tokens = (model_config.context_window - model_config.max_tokens
+                       - estimate_tokens(system_prompt) - prompt_overhead)
+    if len(text) <= budget:
+        save_session_metadata(job.session_path, generation={'mode': 'single', 'generation_mode': mode, 'input_chars': len(text)})
+        return trim_to_tokens(text, max_text_tokens)
     
-    return text
+    start = time.perf_counter()
+    reduced, chunks, rounds = reduce_text(
+        text, budget,
+        lambda prompt: llm_service.generate_content(prompt, use_cache=use_cache, timings=timings),
+        app.config['MAP_REDUCE_WORKERS'],
+        on_chunk=lambda done, total: job.emit('map', done=done, total=total)
+    )
+    save_session_metadata(job.session_path, generation={
+        'mode': 'map_reduce',
+        'generation_mode': mode,
+        'input_chars': len(text),
+        'reduced_chars': len(reduced),
+        'budget_chars': budget,
+        'chunks': chunks,
+        'rounds': rounds,
+        'map_seconds': round(time.perf_counter() - start, 3),
+    })
+    return trim_to_tokens(reduced, max_text_tokens)
 
-def create_presentation(slides_content):
-    prs = Presentation(app.config['TEMPLATE_PATH'])
-    for slide_text in slides_content:
-        slide_layout = prs.slide_layouts[1]  # Title and Content
-        slide = prs.slides.add_slide(slide_layout)
-        slide.shapes.title.text = slide_text.get("title", "")
-        slide.placeholders[1].text = slide_text.get("content", "")
+def create_presentation(slides_content, template=None):
+    prs = render_slides(slides_content, template=template)
     output_path = os.path.join(app.config['UPLOAD_FOLDER'], "output.pptx")
     prs.save(output_path)
     return output_path
 
-def generate_slide_content(prompt_text):
+def build_slide_prompt(prompt_text):
+    return f"Analizza il seguente contenuto e genera una struttura di slide PowerPoint professionale:\n\n{prompt_text}\n\nRispondi SOLO con un JSON valido contenente una lista di oggetti con 'title' e 'content' per ogni slide."
+
+def build_outline_prompt(prompt_text):
+    return f"Analizza il seguente contenuto e proponi la scaletta di una presentazione PowerPoint professionale:\n\n{prompt_text}\n\nRispondi SOLO con un JSON valido contenente la lista ordinata dei titoli delle slide (al massimo {OUTLINE_MAX_SLIDES})."
+
+def build_expand_context(prompt_text, titles):
+    # Contenuto e scaletta, identici per tutte le slide: viaggiano con il system prompt come prefisso cacheable
+    outline = '\n'.join(f"{i + 1}. {title}" for i, title in enumerate(titles))
+    return f"Contenuto di riferimento:\n\n{prompt_text}\n\nScaletta della presentazione:\n{outline}"
+
+def build_expand_prompt(titles, index):
+    title = titles[index] if index < len(titles) else ''
+    return (f"Scrivi il contenuto della slide {index + 1} \"{title}\" in punti elenco concisi, senza ripetere "
+            f"gli argomenti delle altre slide. Rispondi solo con il testo della slide.")
+
+def parse_outline_response(response):
+    """Estrae la lista dei titoli dalla scaletta del modello (JSON, oppure un titolo per riga).
+
+    Il JSON passa dalla stessa riparazione delle slide (code fence, testo extra,
+    virgole finali); nell'elenco testuale si scartano le righe di code fence e
+    quelle con punteggiatura JSON, residui di un JSON non recuperabile.
+    """
     try:
-        prompt = f"Analizza il seguente contenuto e genera una struttura di slide PowerPoint professionale:\n\n{prompt_text}\n\nRispondi SOLO con un JSON valido contenente una lista di oggetti con 'title' e 'content' per ogni slide."
-        response = llm_service.generate_content(prompt)
-        
-        # Prova a pulire e parsificare il JSON
-        try:
-            # Rimuove eventuali backticks e testo extra
-            json_start = response.find('[')
-            json_end = response.rfind(']') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                slides_content = json.loads(json_str)
-            else:
-                # Se non trova JSON, prova a parsificare direttamente
-                slides_content = json.loads(response)
-        except json.JSONDecodeError:
-            # Se il parsing fallisce, crea slide con contenuto grezzo
-            slides_content = [
-                {"title": "Contenuto Generato", "content": response},
-                {"title": "Nota", "content": "Il modello non ha restituito un JSON valido. Contenuto mostrato in forma grezza."}
-            ]
-        
-        # Verifica che sia una lista di dizionari
-        if not isinstance(slides_content, list):
-            slides_content = [{"title": "Contenuto", "content": str(slides_content)}]
-        
-        # Verifica che ogni elemento abbia title e content
-        for slide in slides_content:
-            if not isinstance(slide, dict):
-                slide = {"title": "Slide", "content": str(slide)}
-            if 'title' not in slide:
-                slide['title'] = "Slide"
-            if 'content' not in slide:
-                slide['content'] = ""
-        
+        items = repair_json(response)
+    except ValueError:
+        items = [line.strip().lstrip('-*•0123456789.) ').strip() for line in response.splitlines()
+                 if not line.strip().startswith('```') and not any(ch in line for ch in OUTLINE_JSON_CHARS)]
+    if isinstance(items, dict):
+        lists = [value for value in items.values() if isinstance(value, list)]
+        items = lists[0] if lists else [items]
+    if not isinstance(items, list):
+        return []
+    titles = []
+    for item in items:
+        title = item.get('title', '') if isinstance(item, dict) else str(item)
+        if title.strip():
+            titles.append(title.strip())
+    return titles[:OUTLINE_MAX_SLIDES]
+
+def parse_slides_response(response):
+    """Estrae la lista di slide dalla risposta testuale del modello.
+
+    Il JSON viene riparato localmente (code fence, testo extra, virgole finali,
+    risposte troncate): solo se non contiene alcuna slide si mostra il testo grezzo.
+    """
+    try:
+        slides_content = parse_slides(response)
+    except ValueError:
+        slides_content = []
+    if slides_content:
         return slides_content
+    return [
+        {"title": "Contenuto Generato", "content": response},
+        {"title": "Nota", "content": "Il modello non ha restituito un JSON valido. Contenuto mostrato in forma grezza."}
+    ]
+
+def slides_schema():
+    return SLIDES_SCHEMA if app.config['STRUCTURED_OUTPUT'] else None
+
+def generate_slide_content(prompt_text, use_cache=True, timings=None):
+    try:
+        response = llm_service.generate_content(build_slide_prompt(prompt_text), use_cache=use_cache, timings=timings,
+                                                schema=slides_schema())
+        return parse_slides_response(response)
     except Exception as e:
-        return [{"title": "Errore generazione", "content": f"Errore: {str(e)}"}]
+        return [{"title": GENERATION_ERROR_TITLE, "content": f"Errore: {str(e)}"}]
+
+def generate_slide_content_stream(prompt_text, on_slide=None, use_cache=True, timings=None):
+    """Come generate_slide_content, ma in streaming: `on_slide(slide)` viene chiamata
+    per ogni slide appena il suo oggetto JSON è completo"""
+    parser = IncrementalSlideParser()
+    try:
+        for token in llm_service.generate_content_stream(build_slide_prompt(prompt_text), use_cache=use_cache, timings=timings,
+                                                         schema=slides_schema()):
+            for slide in validate_slides(parser.feed(token)):
+                if on_slide:
+                    on_slide(slide)
+    except Exception as e:
+        if not parser.slides:
+            return [{"title": GENERATION_ERROR_TITLE, "content": f"Errore: {str(e)}"}]
+        # Mantiene le slide già ricevute prima dell'interruzione
+        return validate_slides(parser.slides) + [{"title": GENERATION_ERROR_TITLE, "content": f"Generazione interrotta: {str(e)}"}]
+    
+    if parser.slides:
+        return validate_slides(parser.slides)
+    return parse_slides_response(parser.text)
+
+def generate_slide_content_outline(prompt_text, on_slide=None, use_cache=True, timings=None):
+    """Generazione in due fasi: la scaletta dei titoli, poi il contenuto di ogni slide in parallelo.
+
+    Al più `OUTLINE_WORKERS` slide vengono generate contemporaneamente;
+    `on_slide(slide)` le riceve nell'ordine della scaletta. Se la scaletta non
+    è utilizzabile si torna alla generazione in una sola chiamata.
+    """
+    try:
+        outline = llm_service.generate_content(build_outline_prompt(prompt_text), use_cache=use_cache, timings=timings)
+    except Exception as e:
+        return [{"title": GENERATION_ERROR_TITLE, "content": f"Errore: {str(e)}"}]
+    titles = parse_outline_response(outline)
+    if not titles:
+        return generate_slide_content(prompt_text, use_cache=use_cache, timings=timings)
+    
+    context = build_expand_context(prompt_text, titles)
+    
+    def expand(index):
+        return llm_service.generate_content(build_expand_prompt(titles, index), use_cache=use_cache,
+                                            timings=timings, context=context)
+    
+    slides = [None] * len(titles)
+    notified = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(app.config['OUTLINE_WORKERS'], len(titles))),
+                            thread_name_prefix='slideguru-outline') as executor:
+        futures = {executor.submit(expand, i): i for i in range(len(titles))}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                content = future.result().strip()
+            except Exception as e:
+                content = f"Errore: {str(e)}"
+            slides[index] = {"title": titles[index], "content": content}
+            # Notifica solo le slide che completano la sequenza dall'inizio
+            while notified < len(slides) and slides[notified] is not None:
+                if on_slide:
+                    on_slide(slides[notified])
+                notified += 1
+    return slides
 
 # --- ROUTES ---
 @app.route("/", methods=['GET', 'POST'])
@@ -201,52 +616,105 @@ def index():
             return redirect(request.url)
         
         # Filtra solo i file validi
-        valid_files = [f for f in files if f and f.filename != '' and allowed_file(f.filename)]
+        valid_files = valid_uploaded_files(files)
         
         if not valid_files:
             flash('Fornire almeno 1 file di input in uno dei formati validi (PDF, DOCX, TXT)')
             return redirect(request.url)
         
         try:
-            # Crea cartella di sessione basata sul primo file
-            first_filename = secure_filename(valid_files[0].filename)
-            session_path, session_name = create_session_folder(first_filename)
-            
-            # Salva tutti i file nella cartella di sessione
-            saved_files = save_files_to_session(valid_files, session_path)
+            template = requested_template()
+            job = Job(PIPELINE_STAGES)
+            saved_files = start_session(job, valid_files)
+            pptx_path = run_generation_pipeline(job, saved_files, use_cache=not request.form.get('no_cache'),
+                                                mode=request.form.get('mode'), template=template, archive_async=True)
             
-            # Estrai testo da tutti i file
-            texts = []
-            for filepath in saved_files:
-                text = extract_text_from_file(filepath)
-                if text.strip():  # Solo se il file ha contenuto
-                    texts.append(text)
-            
-            if not texts:
-                flash('I file caricati non contengono testo leggibile')
-                # Rimuovi cartella vuota
-                shutil.rmtree(session_path, ignore_errors=True)
-                return redirect(request.url)
-            
-            # Genera le slide
-            combined_text = '\n\n--- NUOVO DOCUMENTO ---\n\n'.join(texts)
-            slides_content = generate_slide_content(combined_text)
-            
-            # Crea presentazione nella cartella di sessione
-            pptx_path = create_session_presentation(slides_content, session_path, session_name)
-            
-            # Crea anche una copia temporanea per il download immediato
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{session_name}_presentation.pptx")
-            shutil.copy2(pptx_path, temp_path)
-            
-            return send_file(temp_path, as_attachment=True, download_name=f"{session_name}_presentation.pptx")
+            # La presentazione parte dalla memoria mentre la copia in archivio viene scritta in background
+            return send_file(io.BytesIO(job.result_data), mimetype=PPTX_MIMETYPE, as_attachment=True,
+                             download_name=os.path.basename(pptx_path))
             
+        except (PipelineError, TemplateNotFoundError) as e:
+            flash(str(e))
+            return redirect(request.url)
         except Exception as e:
             app.logger.error(f"Errore nella generazione: {str(e)}")
             flash(f'Errore nella generazione della presentazione: {str(e)}')
             return redirect(request.url)
     
-    return render_template('index.html')
+    return render_template('index.html', templates=template_cache.names())
+
+@app.route("/api/jobs", methods=['POST'])
+def submit_job():
+    """Avvia la generazione in background e restituisce subito l'ID del job"""
+    valid_files = valid_uploaded_files(request.files.getlist('file'))
+    if not valid_files:
+        return jsonify({"status": "error", "message": "Fornire almeno 1 file di input in uno dei formati validi"}), 400
+    try:
+        template = requested_template()
+    except TemplateNotFoundError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    
+    job = Job(PIPELINE_STAGES)
+    try:
+        saved_files = start_session(job, valid_files)
+        job_manager.submit(job, run_generation_pipeline, saved_files, use_cache=not request.form.get('no_cache'),
+                           mode=request.form.get('mode'), template=template)
+    except QueueFullError as e:
+        shutil.rmtree(job.session_path, ignore_errors=True)
+        return jsonify({"status": "error", "message": str(e)}), 503
+    except Exception as e:
+        app.logger.error(f"Errore nell'avvio del job: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+    
+    return jsonify({
+        "status": "success",
+        "job_id": job.id,
+        "status_url": url_for('job_status', job_id=job.id),
+    }), 202
+
+@app.route("/api/jobs/<job_id>", methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job non trovato"}), 404
+    result = job.to_dict()
+    if job.status == DONE:
+        result['download_url'] = url_for('download_job', job_id=job_id)
+    return jsonify(result)
+
+@app.route("/api/jobs/<job_id>/events", methods=['GET'])
+def job_events(job_id):
+    """Server-sent events con l'avanzamento del job (stadi, slide generate, fine)"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job non trovato"}), 404
+    
+    def stream():
+        index = 0
+        while True:
+            events, _ = job.wait_events(index, timeout=15)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            index += len(events)
+            for event in events:
+                if event['event'] == DONE:
+                    event = dict(event, download_url=url_for('download_job', job_id=job_id))
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event['event'] in (DONE, ERROR):
+                    return
+    
+    # url_for richiede il contesto della richiesta anche durante lo streaming
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route("/api/jobs/<job_id>/download", methods=['GET'])
+def download_job(job_id):
+    job = job_manager.get(job_id)
+    if not job or job.status != DONE or not job.result_path:
+        return jsonify({"status": "error", "message": "Presentazione non disponibile"}), 404
+    return send_file(os.path.abspath(job.result_path), mimetype=PPTX_MIMETYPE, as_attachment=True,
+                     download_name=os.path.basename(job.result_path))
 
 @app.route("/config")
 def config_page():
@@ -279,6 +747,9 @@ def set_model():
     model_id = data.get('model_id')
     if model_id and model_id in llm_config.models:
         llm_config.set_current_model(model_id)
+        if llm_config.models[model_id].provider == LLMProvider.LOCAL:
+            # Il caricamento del modello locale avviene ora, non durante la prima generazione
+            llm_service.preload_model(model_id)
         return jsonify({"status": "success", "message": f"Modello impostato su {llm_config.models[model_id].name}"})
     return jsonify({"status": "error", "message": "Modello non trovato"})
 
@@ -385,9 +856,9 @@ def get_config():
 
 @app.route("/api/refresh_models", methods=['GET'])
 def refresh_models():
-    # Endpoint per refresh dinamico della lista modelli
+    # Endpoint per refresh dinamico della lista modelli (interroga di nuovo gli endpoint locali)
     available_cloud = llm_service.available_cloud_models()
-    available_local = llm_service.available_local_models()
+    available_local = llm_service.available_local_models(refresh=True)
     return jsonify({
         'available_cloud': {k: v.__dict__ for k, v in available_cloud.items()},
         'available_local': {k: v.__dict__ for k, v in available_local.items()}
@@ -446,6 +917,39 @@ def set_system_prompt():
     llm_config.set_system_prompt(prompt)
     return jsonify({"status": "success", "message": "Prompt aggiornato"})
 
+@app.route("/api/estimate", methods=['POST'])
+def api_estimate():
+    """Preventivo di token, costo e latenza per generare le slide da un testo, senza chiamare il modello"""
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+    if not text.strip():
+        return jsonify({"status": "error", "message": "Testo mancante"}), 400
+    try:
+        model_config = llm_service.resolve_model(data.get('model_id'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    mode = data.get('mode') if data.get('mode') in GENERATION_MODES else app.config['GENERATION_MODE']
+    estimate = estimate_generation(model_config, text, generation_budget(model_config), mode)
+    estimate['model'] = model_config.name
+    return jsonify({"status": "success", "estimate": estimate})
+
+@app.route("/api/cache_stats", methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "status": "success",
+        "extraction": extraction_cache.stats(),
+        "llm": llm_cache.stats(),
+        "local_models": llm_service.discovery_stats(),
+        "resilience": llm_service.resilience_stats(),
+        "warmup": llm_service.warmup_stats(),
+        "prompt_cache": llm_service.prompt_cache_stats(),
+        "templates": template_cache.stats(),
+    })
+
+@app.route("/api/templates", methods=['GET'])
+def list_templates():
+    return jsonify({"status": "success", "templates": template_cache.names()})
+
 # --- START SERVER ---
 if __name__ == "__main__":
     app.run(debug=False, port=8080)
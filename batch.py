@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Generazione in batch delle presentazioni senza passare dal server web:
+una presentazione per ogni documento di una cartella o di un manifest.
+
+L'estrazione procede a gruppi di `--extraction-workers` file nel pool di
+processi condiviso, mentre fino a `--llm-workers` documenti sono in
+generazione. Ogni documento completato (o fallito) viene registrato nel file
+di checkpoint: rilanciando lo stesso comando i documenti già generati, e non
+modificati da allora, vengono saltati.
+
+Uso:
+    python batch.py report/                            # file supportati della cartella
+    python batch.py report/ --recursive --llm-workers 4
+    python batch.py manifest.txt                       # un percorso per riga (relativo al manifest)
+    python batch.py report/ --checkpoint notte.jsonl --summary notte.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from template_cache import template_cache
+from app import (app, PIPELINE_STAGES, GENERATION_MODES, allowed_file, create_session_folder, create_session_presentation,
+                 extraction_metadata, generate_slides, generation_failed, get_extraction_options, save_session_metadata)
+from extractor import extract_documents
+from table_profiler import charts_from_documents
+from jobs import Job
+
+def collect_inputs(source, recursive=False):
+    """Percorsi dei documenti da una cartella o da un manifest (un percorso per riga, oppure lista JSON)"""
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files) if allowed_file(name))
+            if not recursive:
+                break
+        return [os.path.abspath(path) for path in paths]
+
+    with open(source, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if source.endswith('.json'):
+        entries = json.loads(content)
+    else:
+        entries = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith('#')]
+    base_dir = os.path.dirname(os.path.abspath(source))
+    return [os.path.abspath(os.path.join(base_dir, entry)) for entry in entries]
+
+def file_signature(path):
+    """Dimensione e data di modifica: un file modificato dopo il checkpoint viene rigenerato"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def load_checkpoint(path):
+    """Ultimo esito registrato per ogni documento"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # riga incompleta di un'esecuzione interrotta
+            entries[entry['file']] = entry
+    return entries
+
+class Checkpoint:
+    """File JSON Lines con l'esito di ogni documento, scritto riga per riga"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = load_checkpoint(path)
+        self._lock = threading.Lock()
+
+    def done(self, filepath):
+        entry = self.entries.get(filepath)
+        try:
+            return bool(entry) and entry['status'] == 'done' and entry['signature'] == file_signature(filepath)
+        except OSError:
+            return False
+
+    def record(self, entry):
+        with self._lock:
+            self.entries[entry['file']] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 3)
+
+def generate_deck(document, use_cache=True, mode=None, template=None):
+    """Generazione e rendering della presentazione di un documento già estratto, nella sua cartella di sessione"""
+    session_path, session_name = create_session_folder(os.path.basename(document.filepath))
+    job = Job(PIPELINE_STAGES, session_name, session_path)
+    shutil.copy2(document.filepath, session_path)
+    save_session_metadata(session_path, extraction_times=extraction_metadata([document]))
+
+    with job.stage('generation'):
+        slides_content = generate_slides(job, [document], use_cache, mode)
+    if generation_failed(slides_content):
+        raise RuntimeError(slides_content[-1].get('content', 'Generazione non riuscita'))
+
+    with job.stage('rendering'):
+        pptx_path = create_session_presentation(slides_content, session_path, session_name,
+                                                charts_from_documents([document]), template)
+    save_session_metadata(session_path, stages=job.to_dict()['stages'])
+    return pptx_path, len(slides_content), job
+
+def run_batch(paths, checkpoint, extraction_workers, llm_workers, use_cache=True, mode=None, template=None, log=print):
+    """Elabora i documenti e restituisce il riepilogo di throughput e latenze"""
+    extraction_workers, llm_workers = max(1, extraction_workers), max(1, llm_workers)
+    todo = [path for path in paths if not checkpoint.done(path)]
+    skipped = len(paths) - len(todo)
+    log(f"📄 {len(paths)} documenti, {skipped} già generati, {len(todo)} da elaborare")
+
+    results = []
+    lock = threading.Lock()
+    options = get_extraction_options()
+    start = time.perf_counter()
+
+    def finish(entry):
+        checkpoint.record(entry)
+        with lock:
+            results.append(entry)
+            mark = '✅' if entry['status'] == 'done' else '❌'
+            detail = f"{entry['slides']} slide" if entry['status'] == 'done' else entry['error']
+            log(f"{mark} [{len(results)}/{len(todo)}] {os.path.basename(entry['file'])}: {detail} ({entry['seconds']}s)")
+
+    readable = []
+    for path in todo:
+        if not os.path.isfile(path) or not allowed_file(path):
+            error = 'File non trovato' if not os.path.isfile(path) else 'Formato non supportato'
+            finish({'file': path, 'status': 'error', 'error': error, 'seconds': 0.0})
+        else:
+            readable.append(path)
+
+    def process(document, extraction_seconds):
+        doc_start = time.perf_counter()
+        entry = {'file': document.filepath, 'extraction_seconds': round(extraction_seconds, 3)}
+        try:
+            entry['signature'] = file_signature(document.filepath)
+            errors = [chunk.text for chunk in document.chunks if chunk.kind == 'error']
+            if errors or not document.text.strip():
+                raise RuntimeError(errors[0] if errors else 'Il file non contiene testo leggibile')
+            pptx_path, slides, job = generate_deck(document, use_cache, mode, template)
+            stages = job.to_dict()['stages']
+            entry.update(status='done', pptx=pptx_path, slides=slides,
+                         generation_seconds=stages['generation']['seconds'],
+                         rendering_seconds=stages['rendering']['seconds'],
+                         llm_timings=job.metadata.get('llm_timings'),
+                         dedup_saved_tokens=(job.metadata.get('dedup') or {}).get('saved_tokens', 0))
+        except Exception as e:
+            entry.update(status='error', error=str(e))
+        entry['seconds'] = round(extraction_seconds + time.perf_counter() - doc_start, 3)
+        finish(entry)
+
+    with ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix='slideguru-batch') as executor:
+        pending = set()
+        for i in range(0, len(readable), extraction_workers):
+            # Non estrarre troppo in anticipo rispetto alla generazione
+            while len(pending) >= 2 * llm_workers:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            group = readable[i:i + extraction_workers]
+            for document in extract_documents(group, extraction_workers, options):
+                pending.add(executor.submit(process, document, document.seconds))
+        wait(pending)
+
+    return summarize(results, skipped, time.perf_counter() - start)
+
+def summarize(results, skipped, wall_seconds):
+    """Throughput, latenze per stadio (p50/p95/max) e tempi delle chiamate ai modelli"""
+    done = [r for r in results if r['status'] == 'done']
+    llm = {'calls': 0, 'queue_wait_seconds': 0.0, 'generation_seconds': 0.0, 'rate_limited': 0,
+           'input_tokens': 0, 'cached_tokens': 0}
+    for r in done:
+        for key in llm:
+            llm[key] += (r.get('llm_timings') or {}).get(key, 0)
+
+    def stats(key, entries):
+        values = [r[key] for r in entries if r.get(key) is not None]
+        return {'p50': percentile(values, 50), 'p95': percentile(values, 95), 'max': percentile(values, 100)}
+
+    return {
+        'documents': len(results) + skipped,
+        'done': len(done),
+        'failed': len(results) - len(done),
+        'skipped': skipped,
+        'slides': sum(r['slides'] for r in done),
+        'dedup_saved_tokens': sum(r.get('dedup_saved_tokens', 0) for r in done),
+        'wall_seconds': round(wall_seconds, 3),
+        'documents_per_minute': round(len(results) / wall_seconds * 60, 2) if wall_seconds and results else 0.0,
+        'latency_seconds': {
+            'document': stats('seconds', results),
+            'extraction': stats('extraction_seconds', results),
+            'generation': stats('generation_seconds', done),
+            'rendering': stats('rendering_seconds', done),
+        },
+        'llm_timings': {key: round(value, 3) for key, value in llm.items()},
+        'failures': {r['file']: r['error'] for r in results if r['status'] != 'done'},
+    }
+
+def print_summary(summary):
+    print("\n📊 Riepilogo batch")
+    print(f"   Documenti: {summary['documents']} (generati {summary['done']}, falliti {summary['failed']}, "
+          f"saltati {summary['skipped']}), {summary['slides']} slide")
+    print(f"   Tempo totale: {summary['wall_seconds']:.1f}s, {summary['documents_per_minute']} documenti/minuto")
+    for stage, values in summary['latency_seconds'].items():
+        if values['p50'] is not None:
+            print(f"   {stage:<11} p50 {values['p50']:.2f}s  p95 {values['p95']:.2f}s  max {values['max']:.2f}s")
+    llm = summary['llm_timings']
+    print(f"   Chiamate LLM: {llm['calls']}, attesa in coda {llm['queue_wait_seconds']:.1f}s, "
+          f"generazione {llm['generation_seconds']:.1f}s, rate limit {llm['rate_limited']}")
+    if llm['input_tokens']:
+        print(f"   Token in input: {llm['input_tokens']:.0f}, di cui dalla cache del provider {llm['cached_tokens']:.0f}")
+    if summary['dedup_saved_tokens']:
+        print(f"   Token risparmiati dalla deduplicazione: {summary['dedup_saved_tokens']}")
+    for path, error in summary['failures'].items():
+        print(f"   ❌ {path}: {error}")
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"deve essere almeno 1: {value}")
+    return number
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una presentazione per ogni documento di una cartella o di un manifest")
+    parser.add_argument('source', help="Cartella di documenti oppure manifest (.txt con un percorso per riga, o .json)")
+    parser.add_argument('--recursive', action='store_true', help="Include le sottocartelle")
+    parser.add_argument('--output', default=app.config['ARCHIVE_FOLDER'], help="Cartella delle sessioni generate")
+    parser.add_argument('--checkpoint', help="File di checkpoint (default: batch_checkpoint.jsonl nella cartella di output)")
+    parser.add_argument('--extraction-workers', type=positive_int, default=app.config['EXTRACTION_WORKERS'])
+    parser.add_argument('--llm-workers', type=positive_int, default=app.config['JOB_WORKERS'], help="Documenti in generazione contemporaneamente")
+    parser.add_argument('--mode', choices=GENERATION_MODES, default=app.config['GENERATION_MODE'])
+    parser.add_argument('--template', choices=template_cache.names(), help="Template PPTX (default: quello predefinito)")
+    parser.add_argument('--no-cache', action='store_true', help="Rigenera ignorando la cache delle risposte")
+    parser.add_argument('--summary', help="Salva il riepilogo in formato JSON")
+    args = parser.parse_args(argv)
+
+    app.config['ARCHIVE_FOLDER'] = args.output
+    os.makedirs(args.output, exist_ok=True)
+    paths = collect_inputs(args.source, args.recursive)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output, 'batch_checkpoint.jsonl'))
+
+    summary = run_batch(paths, checkpoint, args.extraction_workers, args.llm_workers,
+                        use_cache=not args.no_cache, mode=args.mode, template=args.template)
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark della compressione estrattiva (extractive.py): throughput in MB/s
+e token conservati, su testo sintetico di dimensione crescente oppure sul
+testo estratto da un documento.
+
+Uso:
+    python benchmark_compression.py                    # testo sintetico da 1, 4 e 16 MB
+    python benchmark_compression.py --sizes 2 8        # dimensioni in MB
+    python benchmark_compression.py report.pdf         # testo estratto da un file
+    python benchmark_compression.py --ratio 0.3
+"""
+
+import os
+import time
+import random
+import argparse
+from extractive import extractive_summary
+
+TOPICS = ["fatturato", "margine", "clienti", "costi", "personale", "investimenti", "mercato", "prodotto", "rischi", "piano"]
+
+def create_sample_text(size_mb, seed=0):
+    """Testo sintetico con sezioni titolate e frasi di lunghezza variabile"""
+    rng = random.Random(seed)
+    vocabulary = [f"{topic}{i}" for topic in TOPICS for i in range(400)] + "il la dei nel con per una che sono".split()
+    parts = []
+    size = 0
+    section = 0
+    while size < size_mb * 1024 * 1024:
+        section += 1
+        parts.append(f"\n{section}. {rng.choice(TOPICS).capitalize()} della divisione {section}\n")
+        for _ in range(rng.randint(3, 8)):
+            sentences = (f"{' '.join(rng.choices(vocabulary, k=rng.randint(8, 30))).capitalize()}." for _ in range(rng.randint(2, 6)))
+            parts.append(' '.join(sentences) + '\n\n')
+            size += len(parts[-1])
+    return ''.join(parts)
+
+def measure(text, ratio, repeat):
+    """Miglior tempo su `repeat` esecuzioni, con le statistiche dell'ultima"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, stats = extractive_summary(text, ratio)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput compressione estrattiva")
+    parser.add_argument('file', nargs='?', help="Documento da cui estrarre il testo (default: testo sintetico)")
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 16], help="Dimensioni (MB) del testo sintetico")
+    parser.add_argument('--ratio', type=float, default=0.5, help="Quota di token conservata")
+    parser.add_argument('--repeat', type=int, default=3, help="Esecuzioni per misura (si riporta la migliore)")
+    args = parser.parse_args()
+
+    if args.file:
+        from extractor import extract_text_from_file
+        samples = [(os.path.basename(args.file), extract_text_from_file(args.file))]
+    else:
+        print(f"📄 Creazione testo sintetico ({', '.join(f'{size:g}' for size in args.sizes)} MB)...")
+        samples = [(f"sintetico {size:g} MB", create_sample_text(size)) for size in args.sizes]
+
+    print(f"🚀 Benchmark compressione estrattiva (ratio {args.ratio})\n")
+    print(f"{'Testo':<20}{'MB':>8}{'Frasi':>10}{'Tempo (s)':>12}{'MB/s':>10}{'Token':>12}{'Conservati':>12}")
+    for name, text in samples:
+        size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+        elapsed, stats = measure(text, args.ratio, args.repeat)
+        print(f"{name:<20}{size_mb:>8.1f}{stats['sentences']:>10}{elapsed:>12.2f}{size_mb / elapsed:>10.1f}"
+              f"{stats['input_tokens']:>12}{stats['output_tokens']:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark della memoria di picco nell'estrazione di fogli di calcolo (XLSX/XLS):
+confronta la lettura originale (modello completo del workbook, cella per cella)
+con il lettore in streaming di extractor.py.
+
+Uso:
+    python benchmark_extraction.py                  # genera un XLSX sintetico
+    python benchmark_extraction.py --rows 200000    # XLSX sintetico più grande
+    python benchmark_extraction.py report.xls       # file esistente (XLSX o XLS)
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import multiprocessing
+from openpyxl import Workbook, load_workbook
+import xlrd
+
+def legacy_extract(filepath):
+    """Estrazione dei fogli di calcolo come implementata prima del lettore in streaming"""
+    ext = filepath.rsplit('.', 1)[1].lower()
+    text = ""
+    if ext == 'xlsx':
+        wb = load_workbook(filepath, data_only=True)
+        for sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+            text += f"\n--- {sheet_name} ---\n"
+            for row in ws.iter_rows(values_only=True):
+                if any(cell is not None for cell in row):
+                    text += '\t'.join(str(cell) if cell is not None else '' for cell in row) + '\n'
+    elif ext == 'xls':
+        wb = xlrd.open_workbook(filepath)
+        for sheet_idx in range(wb.nsheets):
+            sheet = wb.sheet_by_index(sheet_idx)
+            text += f"\n--- {sheet.name} ---\n"
+            for row_idx in range(sheet.nrows):
+                row = [str(sheet.cell_value(row_idx, col_idx)) for col_idx in range(sheet.ncols)]
+                if any(cell.strip() for cell in row):
+                    text += '\t'.join(row) + '\n'
+    return text
+
+def streaming_extract(filepath):
+    from extractor import extract_document, ExtractionOptions
+    # Senza limiti per foglio, per confrontare la lettura dello stesso contenuto
+    return extract_document(filepath, ExtractionOptions(sheet_max_rows=None, sheet_max_cells=None)).text
+
+def create_sample_xlsx(path, rows, cols):
+    """Crea un XLSX sintetico con righe numeriche e qualche riga vuota"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Dati")
+    ws.append([f"Colonna {c}" for c in range(cols)])
+    for r in range(rows):
+        if r % 50 == 0:
+            ws.append([])
+        else:
+            ws.append([r * c * 1.5 if c % 3 else f"voce {r}-{c}" for c in range(cols)])
+    wb.save(path)
+
+def _measure(func, filepath, queue):
+    start = time.perf_counter()
+    text = func(filepath)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    queue.put((elapsed, peak, len(text)))
+
+def measure(func, filepath):
+    """Esegue l'estrazione in un processo separato per misurarne la memoria di picco"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(func, filepath, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memoria estrazione XLSX/XLS")
+    parser.add_argument('file', nargs='?', help="File XLSX/XLS da misurare (default: XLSX sintetico)")
+    parser.add_argument('--rows', type=int, default=50000, help="Righe del file sintetico")
+    parser.add_argument('--cols', type=int, default=20, help="Colonne del file sintetico")
+    args = parser.parse_args()
+
+    filepath = args.file
+    temp_dir = None
+    if not filepath:
+        temp_dir = tempfile.mkdtemp()
+        filepath = os.path.join(temp_dir, 'benchmark.xlsx')
+        print(f"📄 Creazione XLSX sintetico ({args.rows} righe x {args.cols} colonne)...")
+        create_sample_xlsx(filepath, args.rows, args.cols)
+
+    size_mb = os.path.getsize(filepath) / (1024 * 1024)
+    print(f"🚀 Benchmark estrazione: {os.path.basename(filepath)} ({size_mb:.1f} MB)\n")
+    print(f"{'Lettore':<12}{'Tempo (s)':>12}{'Picco RSS (MB)':>18}{'Caratteri':>14}")
+    for name, func in (('originale', legacy_extract), ('streaming', streaming_extract)):
+        elapsed, peak_kb, chars = measure(func, filepath)
+        print(f"{name:<12}{elapsed:>12.2f}{peak_kb / 1024:>18.1f}{chars:>14}")
+
+    if temp_dir:
+        os.remove(filepath)
+        os.rmdir(temp_dir)
+
+if __name__ == "__main__":
+    main()
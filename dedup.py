@@ -0,0 +1,160 @@
+import re
+import time
+import zlib
+import hashlib
+import logging
+from dataclasses import replace
+import numpy as np
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Similarità (Jaccard stimata sugli shingle) oltre la quale due blocchi sono considerati duplicati
+DEFAULT_THRESHOLD = 0.8
+
+# Blocchi più corti di così non vengono mai scartati (titoli, celle, righe brevi)
+MIN_UNIT_CHARS = 40
+
+# Parole per shingle e dimensione della firma MinHash, divisa in bande per il locality-sensitive hashing
+SHINGLE_WORDS = 5
+NUM_HASHES = 64
+LSH_BANDS = 16
+MINHASH_BLOCK = 4096
+
+# Chunk tabellari: divisi per riga, e righe o blocchi di righe si scartano solo se ripetono quelli di un altro documento
+TABULAR_KINDS = ('table_row', 'rows', 'sheet')
+SKIPPED_KINDS = ('error', 'timeout')
+
+# Primo di Mersenne 2^31 - 1: a * x + b resta entro 64 bit
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_HASH_A = _rng.integers(1, _PRIME, NUM_HASHES, dtype=np.uint64)
+_HASH_B = _rng.integers(0, _PRIME, NUM_HASHES, dtype=np.uint64)
+_WORDS = re.compile(r"\w+")
+_PARAGRAPH_BREAK = re.compile(r"(\n\s*\n)")
+
+def _normalize(text):
+    return ' '.join(_WORDS.findall(text.lower()))
+
+def minhash(words):
+    """Firma MinHash degli shingle di `SHINGLE_WORDS` parole (un solo shingle per i testi più corti)"""
+    count = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(count)}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles)) % _PRIME
+    signature = np.full(NUM_HASHES, _PRIME, dtype=np.uint64)
+    # A blocchi, per non allocare NUM_HASHES x shingle valori sulle pagine lunghe
+    for i in range(0, len(hashes), MINHASH_BLOCK):
+        block = hashes[i:i + MINHASH_BLOCK]
+        np.minimum(signature, ((np.outer(_HASH_A, block) + _HASH_B[:, None]) % _PRIME).min(axis=1), out=signature)
+    return signature
+
+class SimilarityIndex:
+    """Blocchi già visti: hash esatto del testo normalizzato e bande LSH delle firme MinHash.
+
+    Ogni blocco viene confrontato solo con quelli che condividono almeno una
+    banda, quindi il costo complessivo resta circa lineare nel numero di blocchi.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._exact = {}
+        self._buckets = {}
+        self._signatures = []
+        self._owners = []
+
+    def match(self, normalized, owner, other_owner_only=False):
+        """'exact' o 'near' se il blocco ripete uno già visto, altrimenti None (e lo aggiunge all'indice)"""
+        key = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+        seen = self._exact.get(key)
+        if seen is not None and not (other_owner_only and seen == owner):
+            return 'exact'
+        signature = minhash(normalized.split())
+        rows = NUM_HASHES // LSH_BANDS
+        bands = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+        candidates = {i for band in bands for i in self._buckets.get(band, ())}
+        for i in candidates:
+            if other_owner_only and self._owners[i] == owner:
+                continue
+            if np.count_nonzero(self._signatures[i] == signature) / NUM_HASHES >= self.threshold:
+                return 'near'
+        self._exact.setdefault(key, owner)
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._owners.append(owner)
+        for band in bands:
+            self._buckets.setdefault(band, []).append(index)
+        return None
+
+def _split_units(text, tabular):
+    """Coppie (blocco, separatore successivo): righe per i chunk tabellari, paragrafi per gli altri"""
+    if tabular:
+        lines = text.split('\n')
+        return [(line, '\n' if i < len(lines) - 1 else '') for i, line in enumerate(lines)]
+    parts = _PARAGRAPH_BREAK.split(text)
+    return [(parts[i], parts[i + 1] if i + 1 < len(parts) else '') for i in range(0, len(parts), 2)]
+
+def deduplicate_documents(documents, threshold=DEFAULT_THRESHOLD, min_chars=MIN_UNIT_CHARS):
+    """Rimuove pagine, paragrafi e righe quasi duplicati tra tutti i documenti, nell'ordine di caricamento.
+
+    Si conserva sempre la prima occorrenza. Prima si confrontano i chunk interi
+    (pagine, fogli, slide), poi i singoli paragrafi e righe di quelli rimasti.
+    Restituisce (documenti deduplicati, riepilogo con i token risparmiati).
+    """
+    start = time.perf_counter()
+    chunk_index = SimilarityIndex(threshold)
+    unit_index = SimilarityIndex(threshold)
+    stats = {'chunks_dropped': 0, 'units_dropped': 0, 'exact': 0, 'near': 0}
+    input_tokens = output_tokens = 0
+    result = []
+
+    def count(match):
+        stats[match] += 1
+
+    for owner, document in enumerate(documents):
+        chunks = []
+        for chunk in document.chunks:
+            if chunk.kind in SKIPPED_KINDS or not chunk.text.strip():
+                chunks.append(chunk)
+                continue
+            tabular = chunk.kind in TABULAR_KINDS
+            units = _split_units(chunk.text, tabular)
+            normalized = _normalize(chunk.text)
+            if len(units) > 1 and len(normalized) >= min_chars:
+                match = chunk_index.match(normalized, owner, other_owner_only=tabular)
+                if match:
+                    count(match)
+                    stats['chunks_dropped'] += 1
+                    if chunk.data:
+                        chunks.append(replace(chunk, text=''))  # i dati restano per i grafici
+                    continue
+
+            kept = []
+            for unit, separator in units:
+                normalized = _normalize(unit)
+                if len(normalized) >= min_chars:
+                    match = unit_index.match(normalized, owner, other_owner_only=tabular)
+                    if match:
+                        count(match)
+                        stats['units_dropped'] += 1
+                        continue
+                kept.append(unit + separator)
+            text = ''.join(kept)
+            if text.strip() or chunk.data:
+                chunks.append(replace(chunk, text=text) if text != chunk.text else chunk)
+            else:
+                stats['chunks_dropped'] += 1
+        deduplicated = replace(document, chunks=chunks)
+        input_tokens += estimate_tokens(document.text)
+        output_tokens += estimate_tokens(deduplicated.text)
+        result.append(deduplicated)
+
+    stats.update(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        saved_tokens=input_tokens - output_tokens,
+        seconds=round(time.perf_counter() - start, 3),
+    )
+    if stats['saved_tokens']:
+        logger.info(f"Deduplicazione: {stats['chunks_dropped']} chunk e {stats['units_dropped']} blocchi rimossi, "
+                    f"{stats['saved_tokens']} token risparmiati")
+    return result, stats
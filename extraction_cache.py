@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join('cache', 'extraction')
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv('SLIDEGURU_EXTRACTION_CACHE_MB', 200)) * 1024 * 1024
+
+def file_hash(filepath, block_size=1024 * 1024):
+    """Calcola lo SHA-256 del contenuto di un file leggendolo a blocchi"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """Cache persistente su disco dei risultati di estrazione, indirizzata per contenuto.
+
+    Ogni voce è un file JSON in `cache_dir`; quando la dimensione totale supera
+    `max_bytes` vengono rimosse le voci usate meno di recente (LRU).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # chiave -> dimensione in byte, dalla meno alla più recente
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        """Ricostruisce l'indice LRU dai file presenti su disco"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def make_key(self, filepath, *parts):
+        """Chiave della cache: hash del contenuto del file più le parti aggiuntive (es. versione)"""
+        digest = hashlib.sha256(file_hash(filepath).encode())
+        for part in parts:
+            digest.update(f"|{part}".encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Restituisce il valore in cache per `key`, oppure None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                os.utime(self._path(key))  # aggiorna l'ordine LRU anche dopo un riavvio
+            except (OSError, ValueError) as e:
+                logger.error(f"Voce di cache non leggibile {key}: {str(e)}")
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Salva `value` (serializzabile in JSON) e applica l'eviction LRU"""
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            tmp_path = self._path(key) + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logger.error(f"Impossibile scrivere la voce di cache {key}: {str(e)}")
+                return
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Rimuove una singola voce"""
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Svuota la cache"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        """Statistiche di utilizzo della cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+# Istanza globale della cache di estrazione
+extraction_cache = ExtractionCache()
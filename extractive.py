@@ -0,0 +1,195 @@
+import re
+import time
+import numpy as np
+from token_budget import CHARS_PER_TOKEN, estimate_tokens
+
+# Quota di token da conservare quando non è indicato un obiettivo
+DEFAULT_RATIO = 0.5
+
+# Righe brevi senza punteggiatura finale, isolate dal testo che le circonda, trattate come titoli di sezione
+HEADING_MAX_CHARS = 80
+HEADING_MAX_WORDS = 12
+
+# Quota massima dell'obiettivo di token riservata ai titoli; oltre, i titoli competono con le frasi
+HEADING_BUDGET_SHARE = 0.25
+
+# Parole troppo comuni per distinguere una frase dall'altra (oltre a quelle più corte di 3 lettere)
+STOPWORDS = frozenset("""
+alla alle agli allo anche come con cui dal dalla dalle dei del della delle dello degli gli il la le lo
+nel nella nelle nello negli non per più che questa queste questi questo sono sul sulla sulle sui una uno
+essere stato stata sono tra fra anche ogni loro suo sua suoi sue quale quali dove quando ancora molto
+the and for are was were with that this these those from have has had not but its their which will
+""".split())
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+(?=[\"«(\[]?[A-ZÀ-Ý0-9])")
+_WORDS = re.compile(r"\w+")
+_STRUCTURE = re.compile(r"^(#+\s|---.*---$|\[Parte \d+\]$)")
+_BULLET = re.compile(r"^([-*•▪–]\s|\d+[.)]\s)")
+_TERMINAL = ('.', ',', ';', ':', '!', '?', '…')
+_SENTENCE_CLOSE = ('.', ':', '!', '?', '…')
+
+def _is_heading(line, previous, following):
+    """Titolo: marcatore di struttura, oppure riga breve isolata dal testo che la circonda.
+
+    `previous` e `following` sono le righe adiacenti ('' se vuote, assenti o,
+    per la precedente, già riconosciute come titolo). La riga precedente deve
+    chiudere una frase, la successiva non deve iniziare in minuscolo e la riga
+    non deve finire con un articolo o una preposizione: altrimenti è un pezzo
+    di un paragrafo andato a capo.
+    """
+    if _STRUCTURE.match(line):
+        return True
+    if (len(line) > HEADING_MAX_CHARS or line.endswith(_TERMINAL)
+            or not (line[:1].isupper() or line[:1].isdigit())):
+        return False
+    words = line.split()
+    last = words[-1]
+    if len(words) > HEADING_MAX_WORDS or (last.islower() and (len(last) <= 2 or last in STOPWORDS)):
+        return False
+    if previous and not previous.endswith(_SENTENCE_CLOSE):
+        return False
+    return not following[:1].islower()
+
+def split_sentences(text):
+    """Divide il testo in blocchi: titoli, separatori e paragrafi divisi in frasi.
+
+    Le righe di uno stesso paragrafo andato a capo vengono riunite prima della
+    divisione in frasi; punti elenco e righe dopo una frase conclusa aprono un
+    nuovo blocco. Restituisce (blocchi, unità, titoli) dove ogni blocco è
+    ('break', None), ('heading', indice) oppure ('text', indici delle frasi)
+    nella lista `unità`, e `titoli` indica quali unità sono titoli.
+    """
+    lines = [line.strip() for line in text.split('\n')]
+    blocks = []
+    units = []
+    headings = []
+    paragraph = []
+
+    def flush():
+        if paragraph:
+            parts = [part for part in _SENTENCE_END.split(' '.join(paragraph)) if part.strip()]
+            blocks.append(('text', list(range(len(units), len(units) + len(parts)))))
+            units.extend(parts)
+            headings.extend([False] * len(parts))
+            paragraph.clear()
+
+    for i, line in enumerate(lines):
+        if not line:
+            flush()
+            if blocks and blocks[-1][0] != 'break':
+                blocks.append(('break', None))
+            continue
+        previous = lines[i - 1] if i and blocks and blocks[-1][0] != 'heading' else ''
+        following = lines[i + 1] if i + 1 < len(lines) else ''
+        if _is_heading(line, previous, following):
+            flush()
+            blocks.append(('heading', len(units)))
+            units.append(line)
+            headings.append(True)
+            continue
+        if paragraph and (_BULLET.match(line) or paragraph[-1].endswith(_SENTENCE_CLOSE)):
+            flush()
+        paragraph.append(line)
+    flush()
+    return blocks, units, np.array(headings, dtype=bool)
+
+def score_sentences(sentences):
+    """Centralità TF-IDF: similarità coseno di ogni frase con il centroide del documento.
+
+    La matrice frasi x termini resta sparsa (coordinate riga, colonna, peso) e
+    tutti i calcoli sono vettoriali, quindi il costo è lineare nel numero di parole.
+    """
+    tokens = [_WORDS.findall(sentence.lower()) for sentence in sentences]
+    lengths = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+    scores = np.zeros(len(sentences))
+    if not lengths.sum():
+        return scores
+    index = {}
+    columns = np.fromiter((index.setdefault(word, len(index)) for t in tokens for word in t), dtype=np.int64, count=lengths.sum())
+    vocabulary = list(index)
+    rows = np.repeat(np.arange(len(sentences)), lengths)
+
+    # Frequenza di ogni coppia (frase, termine)
+    pairs, counts = np.unique(rows * len(vocabulary) + columns, return_counts=True)
+    rows, columns = pairs // len(vocabulary), pairs % len(vocabulary)
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    useful = np.fromiter((len(word) > 2 and word not in STOPWORDS and not word.isdigit() for word in vocabulary),
+                         dtype=bool, count=len(vocabulary))
+    weights = (1 + np.log(counts)) * (idf * useful)[columns]
+
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=len(sentences)))
+    weights = weights / np.maximum(norms, 1e-12)[rows]
+    centroid = np.bincount(columns, weights=weights, minlength=len(vocabulary))
+    centroid /= max(np.linalg.norm(centroid), 1e-12)
+    return np.bincount(rows, weights=weights * centroid[columns], minlength=len(sentences))
+
+def _select(units, headings, target):
+    """Unità da conservare entro `target` token (stimati dai caratteri).
+
+    I titoli entrano per primi, in ordine, finché restano entro
+    `HEADING_BUDGET_SHARE` dell'obiettivo; gli altri competono con le frasi
+    per centralità. Restituisce (maschera delle unità scelte, punteggi).
+    """
+    sizes = np.ceil(np.fromiter(map(len, units), dtype=np.int64, count=len(units)) / CHARS_PER_TOKEN)
+    scores = score_sentences(units)
+    keep = np.zeros(len(units), dtype=bool)
+    heading_indexes = np.flatnonzero(headings)
+    keep[heading_indexes[np.cumsum(sizes[heading_indexes]) <= target * HEADING_BUDGET_SHARE]] = True
+
+    # Le unità migliori finché entrano nel budget rimasto dopo i titoli conservati
+    order = np.argsort(-scores, kind='stable')
+    order = order[~keep[order]]
+    fits = np.cumsum(sizes[order]) <= max(0, target - sizes[keep].sum())
+    keep[order[fits]] = True
+    return keep, scores
+
+def _render(blocks, units, keep):
+    lines = []
+    for kind, value in blocks:
+        if kind == 'heading':
+            if keep[value]:
+                lines.append(units[value])
+        elif kind == 'break':
+            if lines and lines[-1]:
+                lines.append('')
+        else:
+            kept = [units[i] for i in value if keep[i]]
+            if kept:
+                lines.append(' '.join(kept))
+    return '\n'.join(lines).strip()
+
+def extractive_summary(text, ratio=DEFAULT_RATIO, max_tokens=None):
+    """Riassunto estrattivo: le frasi più centrali fino a `ratio` dei token, e comunque entro `max_tokens`.
+
+    Anche titoli di sezione e separatori contano nel budget (vedi `_select`);
+    le unità scelte mantengono l'ordine del documento. Restituisce (testo
+    compresso, statistiche).
+    """
+    start = time.perf_counter()
+    input_tokens = estimate_tokens(text)
+    target = int(input_tokens * ratio) if max_tokens is None else min(max_tokens, int(input_tokens * ratio))
+    blocks, units, headings = split_sentences(text)
+    stats = {'input_tokens': input_tokens, 'sentences': int((~headings).sum())}
+
+    if input_tokens <= target or not units:
+        stats.update(output_tokens=input_tokens, kept_sentences=stats['sentences'], kept_headings=int(headings.sum()),
+                     seconds=round(time.perf_counter() - start, 3))
+        return text, stats
+
+    keep, scores = _select(units, headings, target)
+    compressed = _render(blocks, units, keep)
+    output_tokens = estimate_tokens(compressed)
+    # La stima per caratteri può restare sotto quella per parole e simboli: si tolgono le unità meno centrali
+    while output_tokens > target and keep.any():
+        kept = np.flatnonzero(keep)
+        kept = kept[np.argsort(scores[kept], kind='stable')]
+        sizes = np.ceil(np.fromiter((len(units[i]) for i in kept), dtype=np.int64, count=len(kept)) / CHARS_PER_TOKEN)
+        drop = kept[:int(np.searchsorted(np.cumsum(sizes), output_tokens - target)) + 1]
+        keep[drop] = False
+        compressed = _render(blocks, units, keep)
+        output_tokens = estimate_tokens(compressed)
+
+    stats.update(output_tokens=output_tokens, kept_sentences=int((keep & ~headings).sum()),
+                 kept_headings=int((keep & headings).sum()), seconds=round(time.perf_counter() - start, 3))
+    return compressed, stats
@@ -0,0 +1,565 @@
+import os
+import json
+import math
+import time
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import docx
+import fitz  # PyMuPDF
+from pptx import Presentation
+from openpyxl import load_workbook
+import xlrd
+from extraction_cache import extraction_cache
+from table_profiler import profile_table, format_profile, PROFILE_MIN_ROWS
+
+logger = logging.getLogger(__name__)
+
+# Versione dell'estrattore: va incrementata quando cambia l'output, per invalidare la cache
+EXTRACTOR_VERSION = 4
+
+# Numero massimo di processi di estrazione (bounded pool condiviso tra le richieste)
+DEFAULT_EXTRACTION_WORKERS = min(4, os.cpu_count() or 1)
+
+# Dimensione dei blocchi letti dai file di testo
+TXT_BLOCK_SIZE = 64 * 1024
+
+DOCUMENT_SEPARATOR = '\n\n--- NUOVO DOCUMENTO ---\n\n'
+
+# Politiche di campionamento delle pagine per i PDF molto lunghi
+PDF_SAMPLING_POLICIES = ('head', 'uniform', 'head_tail')
+
+# Righe di foglio di calcolo raggruppate in un singolo chunk
+SHEET_BATCH_ROWS = 500
+
+# Namespace XML di Office Open XML usati dagli estrattori rapidi DOCX/PPTX
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+P_NS = '{http://schemas.openxmlformats.org/presentationml/2006/main}'
+R_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+# Numero minimo di pagine per shard quando un PDF viene diviso tra più worker
+PDF_MIN_SHARD_PAGES = 25
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+@dataclass
+class TextChunk:
+    """Porzione di testo estratta da un documento, con la sua provenienza"""
+    source: str      # nome del file di origine
+    kind: str        # 'text', 'page', 'paragraph', 'shape', 'table_row', 'sheet', 'rows', 'table', 'error' o 'timeout'
+    location: Any    # pagina/slide (1-based), nome del foglio o indice del blocco
+    text: str
+    data: Optional[dict] = None  # dati strutturati (es. profilo di un foglio per i chunk 'table')
+
+@dataclass
+class ExtractionOptions:
+    """Parametri dell'estrazione (fanno parte della chiave di cache)"""
+    max_chars: Optional[int] = None          # budget di caratteri per documento
+    pdf_max_pages: Optional[int] = None      # numero massimo di pagine lette per PDF
+    pdf_sampling: str = 'head'               # politica di scelta delle pagine oltre il limite
+    pdf_time_budget: Optional[float] = None  # secondi massimi di estrazione per PDF
+    pdf_shard_threshold: int = 100           # pagine oltre le quali il PDF viene diviso tra i worker
+    sheet_max_rows: Optional[int] = 10000    # righe non vuote lette per foglio
+    sheet_max_cells: Optional[int] = 200000  # celle lette per foglio
+    profile_tables: bool = True              # riassume i fogli numerici con aggregati invece delle righe
+    xml_fast_path: bool = True               # legge DOCX/PPTX direttamente dall'XML invece che con le librerie
+
+@dataclass
+class ExtractedDocument:
+    """Risultato dell'estrazione di un file"""
+    filepath: str
+    chunks: List[TextChunk] = field(default_factory=list)
+    seconds: float = 0.0
+    truncated: bool = False
+    cached: bool = False
+    timed_out: bool = False
+
+    @property
+    def text(self):
+        for chunk in self.chunks:
+            if chunk.kind == 'error':
+                return chunk.text
+        return ''.join(chunk.text for chunk in self.chunks)
+
+def select_pdf_pages(page_count, max_pages=None, sampling='head'):
+    """Indici (0-based, ordinati) delle pagine da leggere secondo la politica di campionamento"""
+    if not max_pages or page_count <= max_pages:
+        return list(range(page_count))
+    if sampling == 'uniform':
+        step = page_count / max_pages
+        return sorted({int(i * step) for i in range(max_pages)})
+    if sampling == 'head_tail':
+        tail = max_pages // 2
+        return list(range(max_pages - tail)) + list(range(page_count - tail, page_count))
+    return list(range(max_pages))
+
+def _iter_pdf_pages(doc, source, pages, deadline=None):
+    """Emette un chunk per ogni pagina richiesta, fermandosi alla scadenza `deadline`"""
+    for page_idx in pages:
+        if deadline is not None and time.time() > deadline:
+            yield TextChunk(source, 'timeout', page_idx + 1, '')
+            return
+        yield TextChunk(source, 'page', page_idx + 1, doc[page_idx].get_text())
+
+def _capped_rows(rows, options):
+    """Salta le righe vuote e si ferma ai limiti di righe/celle per foglio.
+
+    Dopo l'ultima riga emette None se il foglio è stato troncato.
+    """
+    row_count = 0
+    cell_count = 0
+    for row in rows:
+        if not row:
+            continue
+        if (options.sheet_max_rows is not None and row_count >= options.sheet_max_rows) or \
+                (options.sheet_max_cells is not None and cell_count + len(row) > options.sheet_max_cells):
+            yield None
+            return
+        row_count += 1
+        cell_count += len(row)
+        yield row
+
+def _iter_sheet_rows(source, sheet_name, rows, options):
+    """Converte le righe di un foglio in chunk da SHEET_BATCH_ROWS righe.
+
+    `rows` è un iterabile di liste di stringhe già private delle celle vuote
+    finali. Con `profile_tables` i fogli con colonne numeriche e almeno
+    PROFILE_MIN_ROWS righe diventano un unico chunk 'table' con il digest degli
+    aggregati (e il profilo in `data`) invece delle righe.
+    """
+    rows = _capped_rows(rows, options)
+    if options.profile_tables:
+        table = list(rows)
+        truncated = bool(table) and table[-1] is None
+        if truncated:
+            table.pop()
+        if len(table) >= PROFILE_MIN_ROWS:
+            profile = profile_table(sheet_name, table)
+            if profile:
+                yield TextChunk(source, 'table', sheet_name, format_profile(profile, truncated), profile)
+                return
+        rows = iter(table + [None] if truncated else table)
+
+    yield TextChunk(source, 'sheet', sheet_name, f"\n--- {sheet_name} ---\n")
+    batch = []
+    row_count = 0
+    for row in rows:
+        if row is None:
+            batch.append(f"[... foglio troncato dopo {row_count} righe ...]")
+            break
+        batch.append('\t'.join(row))
+        row_count += 1
+        if len(batch) >= SHEET_BATCH_ROWS:
+            yield TextChunk(source, 'rows', sheet_name, '\n'.join(batch) + '\n')
+            batch = []
+    if batch:
+        yield TextChunk(source, 'rows', sheet_name, '\n'.join(batch) + '\n')
+
+def _trim_row(values, is_empty):
+    """Rimuove le celle vuote in coda; restituisce una lista vuota per le righe vuote"""
+    end = len(values)
+    while end and is_empty(values[end - 1]):
+        end -= 1
+    return values[:end]
+
+def _iter_xlsx_chunks(filepath, source, options):
+    # read_only: openpyxl legge le righe in streaming dal file XML del foglio
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = (
+                ['' if cell is None else str(cell) for cell in _trim_row(row, lambda cell: cell is None)]
+                for row in ws.iter_rows(values_only=True)
+            )
+            yield from _iter_sheet_rows(source, ws.title, rows, options)
+    finally:
+        wb.close()
+
+def _iter_xls_chunks(filepath, source, options):
+    # on_demand: xlrd carica un foglio alla volta e lo rilascia dopo la lettura
+    wb = xlrd.open_workbook(filepath, on_demand=True)
+    try:
+        for sheet_idx in range(wb.nsheets):
+            sheet = wb.sheet_by_index(sheet_idx)
+            rows = (
+                _trim_row([str(value) for value in sheet.row_values(row_idx)], lambda cell: not cell.strip())
+                for row_idx in range(sheet.nrows)
+            )
+            yield from _iter_sheet_rows(source, sheet.name, rows, options)
+            wb.unload_sheet(sheet_idx)
+    finally:
+        wb.release_resources()
+
+def _iter_docx_library(filepath, source):
+    doc = docx.Document(filepath)
+    for para_idx, para in enumerate(doc.paragraphs):
+        yield TextChunk(source, 'paragraph', para_idx, para.text + '\n')
+
+def _iter_pptx_library(filepath, source):
+    prs = Presentation(filepath)
+    for slide_number, slide in enumerate(prs.slides, start=1):
+        for shape in slide.shapes:
+            if hasattr(shape, "text"):
+                yield TextChunk(source, 'shape', slide_number, shape.text + '\n')
+
+def _with_fallback(fast, slow, filepath, source):
+    """Usa l'estrattore rapido; se fallisce prima di aver prodotto chunk, ripiega sulla libreria"""
+    produced = False
+    try:
+        for chunk in fast(filepath, source):
+            produced = True
+            yield chunk
+        return
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        if produced:
+            raise
+        logger.info(f"Estrazione XML non riuscita per {source}, uso la libreria: {str(e)}")
+    yield from slow(filepath, source)
+
+def _part_targets(archive, rels_path, base_dir):
+    """Mappa Id -> percorso nel pacchetto dalle relazioni di una parte OOXML"""
+    targets = {}
+    for rel in ET.fromstring(archive.read(rels_path)).iter(f'{PKG_REL_NS}Relationship'):
+        target = rel.get('Target', '')
+        path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base_dir, target))
+        targets[rel.get('Id')] = (rel.get('Type', ''), path)
+    return targets
+
+def _paragraph_text(elem, text_tag, tab_tag, break_tags):
+    parts = []
+    for node in elem.iter():
+        if node.tag == text_tag:
+            parts.append(node.text or '')
+        elif node.tag == tab_tag:
+            parts.append('\t')
+        elif node.tag in break_tags:
+            parts.append('\n')
+    return ''.join(parts)
+
+def _iter_xml_blocks(stream, ns, paragraph_tag, cell_tag, row_tag, table_tag, shape_tag=None):
+    """Scorre un XML OOXML con iterparse ed emette blocchi di testo nell'ordine del documento.
+
+    Restituisce tuple (tipo, testo): 'paragraph' per i paragrafi fuori da
+    forme e tabelle, 'shape' per il testo di una forma (anche raggruppata),
+    'table_row' per ogni riga di tabella (celle separate da tab). Il contenuto
+    alternativo (mc:Fallback) viene ignorato per non duplicare il testo.
+    """
+    text_tag, tab_tag = f'{ns}t', f'{ns}tab'
+    break_tags = {f'{ns}br', f'{ns}cr'}
+    buffers = []   # paragrafi raccolti per ogni forma/cella aperta
+    rows = []      # celle della riga di tabella corrente (una per tabella annidata)
+    fallback_depth = 0
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        tag = elem.tag
+        if tag == MC_FALLBACK:
+            fallback_depth += 1 if event == 'start' else -1
+            if event == 'end':
+                elem.clear()
+            continue
+        if fallback_depth:
+            continue
+        if event == 'start':
+            if tag in (cell_tag, shape_tag):
+                buffers.append([])
+            elif tag == row_tag:
+                rows.append([])
+            continue
+        if tag == paragraph_tag:
+            text = _paragraph_text(elem, text_tag, tab_tag, break_tags)
+            elem.clear()
+            if buffers:
+                buffers[-1].append(text)
+            else:
+                yield 'paragraph', text
+        elif tag == cell_tag:
+            cell = ' '.join(p.strip() for p in buffers.pop() if p.strip())
+            if rows:
+                rows[-1].append(cell)
+        elif tag == row_tag:
+            cells = rows.pop()
+            if any(cells):
+                yield 'table_row', '\t'.join(cells)
+        elif tag == shape_tag:
+            text = '\n'.join(buffers.pop())
+            if text.strip():
+                yield 'shape', text
+            elem.clear()
+        elif tag == table_tag:
+            elem.clear()
+
+def _iter_docx_xml(filepath, source):
+    with zipfile.ZipFile(filepath) as archive:
+        document_path = 'word/document.xml'
+        for rel_type, path in _part_targets(archive, '_rels/.rels', '').values():
+            if rel_type.endswith('/officeDocument'):
+                document_path = path
+        with archive.open(document_path) as stream:
+            blocks = _iter_xml_blocks(stream, W_NS, f'{W_NS}p', f'{W_NS}tc', f'{W_NS}tr', f'{W_NS}tbl')
+            for index, (kind, text) in enumerate(blocks):
+                yield TextChunk(source, kind, index, text + '\n')
+
+def _iter_pptx_xml(filepath, source):
+    with zipfile.ZipFile(filepath) as archive:
+        presentation = ET.fromstring(archive.read('ppt/presentation.xml'))
+        targets = _part_targets(archive, 'ppt/_rels/presentation.xml.rels', 'ppt')
+        slide_ids = presentation.find(f'{P_NS}sldIdLst')
+        slide_paths = [targets[sld.get(f'{R_NS}id')][1] for sld in (slide_ids if slide_ids is not None else [])]
+        for slide_number, slide_path in enumerate(slide_paths, start=1):
+            with archive.open(slide_path) as stream:
+                blocks = _iter_xml_blocks(stream, A_NS, f'{A_NS}p', f'{A_NS}tc', f'{A_NS}tr', f'{A_NS}tbl', f'{P_NS}sp')
+                for kind, text in blocks:
+                    if kind == 'paragraph' and not text.strip():
+                        continue
+                    yield TextChunk(source, 'table_row' if kind == 'table_row' else 'shape', slide_number, text + '\n')
+
+def _pdf_deadline(options):
+    return time.time() + options.pdf_time_budget if options.pdf_time_budget else None
+
+def iter_chunks(filepath, options=None):
+    """Estrae il contenuto di un file come generatore di TextChunk.
+
+    Il file viene letto pagina per pagina (o riga per riga) senza costruire
+    l'intero testo in memoria. In caso di errore viene emesso un chunk di tipo
+    'error' con il messaggio per l'utente; se il budget di tempo dei PDF si
+    esaurisce viene emesso un chunk vuoto di tipo 'timeout'.
+    """
+    options = options or ExtractionOptions()
+    ext = filepath.rsplit('.', 1)[1].lower()
+    source = os.path.basename(filepath)
+    try:
+        if ext == 'txt':
+            with open(filepath, 'r', encoding='utf-8') as f:
+                block = 0
+                while True:
+                    data = f.read(TXT_BLOCK_SIZE)
+                    if not data:
+                        break
+                    yield TextChunk(source, 'text', block, data)
+                    block += 1
+        elif ext == 'pdf':
+            with fitz.open(filepath) as doc:
+                pages = select_pdf_pages(doc.page_count, options.pdf_max_pages, options.pdf_sampling)
+                yield from _iter_pdf_pages(doc, source, pages, _pdf_deadline(options))
+        elif ext == 'docx':
+            if options.xml_fast_path:
+                yield from _with_fallback(_iter_docx_xml, _iter_docx_library, filepath, source)
+            else:
+                yield from _iter_docx_library(filepath, source)
+        elif ext in ['pptx', 'ppt']:
+            if options.xml_fast_path:
+                yield from _with_fallback(_iter_pptx_xml, _iter_pptx_library, filepath, source)
+            else:
+                yield from _iter_pptx_library(filepath, source)
+        elif ext == 'xlsx':
+            yield from _iter_xlsx_chunks(filepath, source, options)
+        elif ext == 'xls':
+            yield from _iter_xls_chunks(filepath, source, options)
+    except Exception as e:
+        logger.error(f"Errore estrazione testo da {filepath}: {str(e)}")
+        yield TextChunk(source, 'error', None, f"Errore nella lettura del file {source}: {str(e)}")
+
+def _build_document(filepath, chunks, max_chars=None):
+    """Raccoglie i chunk di un file fermandosi a `max_chars` caratteri"""
+    document = ExtractedDocument(filepath)
+    total = 0
+    for chunk in chunks:
+        if chunk.kind == 'timeout':
+            # Le pagine già lette (anche da altri shard) restano valide
+            document.timed_out = True
+            document.truncated = True
+            continue
+        if max_chars is not None and total + len(chunk.text) > max_chars and chunk.kind != 'error':
+            remaining = max_chars - total
+            if remaining > 0:
+                document.chunks.append(TextChunk(chunk.source, chunk.kind, chunk.location, chunk.text[:remaining], chunk.data))
+            document.truncated = True
+            break
+        document.chunks.append(chunk)
+        total += len(chunk.text)
+    if hasattr(chunks, 'close'):
+        chunks.close()
+    return document
+
+def extract_document(filepath, options=None):
+    """Estrae un file in un ExtractedDocument rispettando le opzioni"""
+    options = options or ExtractionOptions()
+    return _build_document(filepath, iter_chunks(filepath, options), options.max_chars)
+
+def _cache_key(filepath, options):
+    try:
+        return extraction_cache.make_key(filepath, EXTRACTOR_VERSION, json.dumps(asdict(options), sort_keys=True))
+    except OSError as e:
+        logger.error(f"Impossibile calcolare l'hash di {filepath}: {str(e)}")
+        return None
+
+def _load_cached(filepath, key):
+    value = extraction_cache.get(key) if key else None
+    if value is None:
+        return None
+    # La cache è indirizzata per contenuto: lo stesso file può arrivare con un altro nome
+    source = os.path.basename(filepath)
+    chunks = [TextChunk(**dict(chunk, source=source)) for chunk in value['chunks']]
+    return ExtractedDocument(filepath, chunks, truncated=value['truncated'], cached=True)
+
+def _store_cached(key, document):
+    # Errori ed estrazioni interrotte dal budget di tempo non vengono messi in cache,
+    # così un nuovo tentativo rilegge il file
+    if not key or document.timed_out or any(chunk.kind == 'error' for chunk in document.chunks):
+        return
+    extraction_cache.put(key, {
+        'chunks': [asdict(chunk) for chunk in document.chunks],
+        'truncated': document.truncated,
+    })
+
+def extract_text_from_file(filepath):
+    options = ExtractionOptions()
+    key = _cache_key(filepath, options)
+    document = _load_cached(filepath, key)
+    if document is None:
+        document = extract_document(filepath, options)
+        _store_cached(key, document)
+    return document.text
+
+def combine_documents(documents, max_chars=None, separator=DOCUMENT_SEPARATOR):
+    """Unisce il testo dei documenti non vuoti rispettando il budget di caratteri"""
+    parts = []
+    total = 0
+    for document in documents:
+        text = document.text
+        if not text.strip():
+            continue
+        if parts:
+            if max_chars is not None and total + len(separator) >= max_chars:
+                break
+            parts.append(separator)
+            total += len(separator)
+        if max_chars is not None and total + len(text) > max_chars:
+            parts.append(text[:max(0, max_chars - total)])
+            break
+        parts.append(text)
+        total += len(text)
+    return ''.join(parts)
+
+def _timed_extract(filepath, options=None):
+    """Estrae i chunk di un file misurando il tempo impiegato (eseguita nei worker)"""
+    start = time.perf_counter()
+    document = extract_document(filepath, options)
+    document.seconds = time.perf_counter() - start
+    return document
+
+def _extract_pdf_shard(filepath, pages, deadline=None):
+    """Estrae un intervallo di pagine di un PDF con un proprio fitz.open (eseguita nei worker)"""
+    source = os.path.basename(filepath)
+    with fitz.open(filepath) as doc:
+        return list(_iter_pdf_pages(doc, source, pages, deadline))
+
+def plan_pdf_shards(filepath, options, max_workers):
+    """Divide le pagine selezionate di un PDF in intervalli contigui, uno per worker.
+
+    Restituisce None se il file non è un PDF o è troppo corto per essere diviso.
+    """
+    if filepath.rsplit('.', 1)[1].lower() != 'pdf' or max_workers <= 1:
+        return None
+    try:
+        with fitz.open(filepath) as doc:
+            page_count = doc.page_count
+    except Exception:
+        return None  # l'errore verrà riportato dall'estrazione normale
+    pages = select_pdf_pages(page_count, options.pdf_max_pages, options.pdf_sampling)
+    if len(pages) < options.pdf_shard_threshold:
+        return None
+    shard_size = max(PDF_MIN_SHARD_PAGES, math.ceil(len(pages) / max_workers))
+    return [pages[i:i + shard_size] for i in range(0, len(pages), shard_size)]
+
+def get_extraction_pool(max_workers=None):
+    """Restituisce il pool di processi condiviso, creandolo alla prima richiesta.
+
+    I worker restano vivi tra una richiesta e l'altra, così PyMuPDF, openpyxl e
+    python-docx vengono importati una sola volta per processo.
+    """
+    global _pool, _pool_workers
+    max_workers = max_workers or DEFAULT_EXTRACTION_WORKERS
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_workers = max_workers
+        return _pool
+
+def shutdown_extraction_pool():
+    """Chiude il pool di processi di estrazione"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+def _error_document(filepath, error):
+    logger.error(f"Errore estrazione testo da {filepath}: {str(error)}")
+    if isinstance(error, BrokenProcessPool):
+        # Il worker è morto (es. crash nativo di una libreria): ricrea il pool alla prossima richiesta
+        shutdown_extraction_pool()
+    source = os.path.basename(filepath)
+    return ExtractedDocument(filepath, [TextChunk(source, 'error', None, f"Errore nella lettura del file {source}: {str(error)}")])
+
+def extract_documents(filepaths, max_workers=None, options=None, use_cache=True):
+    """Estrae il contenuto di più file in parallelo.
+
+    Restituisce una lista di ExtractedDocument nello stesso ordine di
+    `filepaths`, con i limiti definiti in `options`. I PDF lunghi vengono
+    divisi per intervalli di pagine tra i worker; l'ordine e la pagina di
+    provenienza dei chunk sono preservati. Gli errori per singolo file
+    mantengono il testo di errore per l'utente. I file già visti (stesso
+    contenuto) vengono letti dalla cache di estrazione.
+    """
+    max_workers = max_workers or DEFAULT_EXTRACTION_WORKERS
+    options = options or ExtractionOptions()
+    keys = [_cache_key(fp, options) if use_cache else None for fp in filepaths]
+    documents = [_load_cached(fp, key) for fp, key in zip(filepaths, keys)]
+    pending = [i for i, document in enumerate(documents) if document is None]
+
+    shards = {i: plan_pdf_shards(filepaths[i], options, max_workers) for i in pending}
+    if max_workers <= 1 or (len(pending) <= 1 and not any(shards.values())):
+        for i in pending:
+            documents[i] = _timed_extract(filepaths[i], options)
+    else:
+        pool = get_extraction_pool(max_workers)
+        futures = {}
+        for i in pending:
+            fp = filepaths[i]
+            if shards[i]:
+                deadline = _pdf_deadline(options)
+                futures[i] = (time.perf_counter(), [pool.submit(_extract_pdf_shard, fp, pages, deadline) for pages in shards[i]])
+            else:
+                futures[i] = (None, [pool.submit(_timed_extract, fp, options)])
+        for i, (start, shard_futures) in futures.items():
+            fp = filepaths[i]
+            try:
+                if start is None:
+                    documents[i] = shard_futures[0].result()
+                else:
+                    chunks = [chunk for future in shard_futures for chunk in future.result()]
+                    documents[i] = _build_document(fp, chunks, options.max_chars)
+                    documents[i].seconds = time.perf_counter() - start
+            except Exception as e:
+                documents[i] = _error_document(fp, e)
+
+    for i in pending:
+        _store_cached(keys[i], documents[i])
+
+    for document in documents:
+        ext = document.filepath.rsplit('.', 1)[1].lower()
+        logger.info(f"Estrazione {os.path.basename(document.filepath)} [{ext}]: {document.seconds:.2f}s, {len(document.chunks)} chunk{' (cache)' if document.cached else ''}")
+    return documents
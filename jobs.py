@@ -0,0 +1,146 @@
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Stati di un job e dei suoi stadi
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+class QueueFullError(Exception):
+    """Troppi job in attesa: la richiesta va ripetuta più tardi"""
+
+class Job:
+    """Esecuzione della pipeline di generazione, con stato e avanzamento per stadio"""
+
+    def __init__(self, stages, session_name=None, session_path=None):
+        self.id = uuid.uuid4().hex
+        self.session_name = session_name
+        self.session_path = session_path
+        self.status = PENDING
+        self.error = None
+        self.result_path = None
+        self.result_data = None  # byte della presentazione, solo per le risposte servite dalla memoria
+        self.metadata = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self.stages = {name: {'status': PENDING, 'seconds': None} for name in stages}
+        self.events = []
+        self._lock = threading.Lock()
+        self._events_cond = threading.Condition()
+
+    def emit(self, event, **data):
+        """Registra un evento di avanzamento (stadio, slide, fine) per i client in ascolto"""
+        with self._events_cond:
+            self.events.append(dict(data, event=event))
+            self._events_cond.notify_all()
+
+    def wait_events(self, index, timeout=None):
+        """Attende eventi successivi a `index`; restituisce (nuovi eventi, job terminato)"""
+        with self._events_cond:
+            if len(self.events) <= index and self.finished_at is None:
+                self._events_cond.wait(timeout)
+            return self.events[index:], self.finished_at is not None
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager che marca uno stadio come in corso, poi completato o fallito"""
+        start = time.perf_counter()
+        with self._lock:
+            self.status = RUNNING
+            self.stages.setdefault(name, {})['status'] = RUNNING
+        self.emit('stage', stage=name, status=RUNNING, progress=self.progress)
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.stages[name].update(status=ERROR, seconds=round(time.perf_counter() - start, 3))
+            self.emit('stage', stage=name, status=ERROR, progress=self.progress)
+            raise
+        with self._lock:
+            self.stages[name].update(status=DONE, seconds=round(time.perf_counter() - start, 3))
+        self.emit('stage', stage=name, status=DONE, progress=self.progress)
+
+    def finish(self, result_path=None, error=None):
+        with self._lock:
+            self.result_path = result_path
+            self.error = error
+            self.status = ERROR if error else DONE
+            self.finished_at = time.time()
+        if error:
+            self.emit(ERROR, error=error)
+        else:
+            self.emit(DONE, progress=100)
+
+    @property
+    def progress(self):
+        """Percentuale di stadi completati"""
+        done = sum(1 for stage in self.stages.values() if stage['status'] == DONE)
+        return round(100 * done / len(self.stages)) if self.stages else 100
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'progress': self.progress,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'session_name': self.session_name,
+                'error': self.error,
+                'slides': [e['title'] for e in self.events if e['event'] == 'slide'],
+                'metadata': dict(self.metadata),
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+            }
+
+class JobManager:
+    """Coda di job eseguiti da un pool limitato di thread"""
+
+    def __init__(self, max_workers=2, max_pending=20, ttl=3600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='slideguru-job')
+
+    def submit(self, job, func, *args, **kwargs):
+        """Accoda `func(job, *args, **kwargs)`; il valore restituito è il percorso del risultato"""
+        with self._lock:
+            self._cleanup()
+            pending = sum(1 for j in self._jobs.values() if j.status in (PENDING, RUNNING))
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Troppi job in coda ({pending}), riprova tra qualche istante")
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        try:
+            job.finish(result_path=func(job, *args, **kwargs))
+        except Exception as e:
+            logger.error(f"Errore nel job {job.id}: {str(e)}")
+            job.finish(error=str(e))
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _cleanup(self):
+        """Rimuove i job terminati da più di `ttl` secondi"""
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and now - j.finished_at > self.ttl]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'workers': self.max_workers, 'max_pending': self.max_pending, 'jobs': counts}
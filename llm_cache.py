@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from extraction_cache import ExtractionCache
+
+DEFAULT_LLM_CACHE_DIR = os.path.join('cache', 'llm')
+DEFAULT_LLM_CACHE_MAX_BYTES = int(os.getenv('SLIDEGURU_LLM_CACHE_MB', 50)) * 1024 * 1024
+DEFAULT_LLM_CACHE_TTL = int(os.getenv('SLIDEGURU_LLM_CACHE_TTL', 7 * 24 * 3600))
+DEFAULT_LLM_CACHE_MEMORY_ENTRIES = int(os.getenv('SLIDEGURU_LLM_CACHE_MEMORY_ENTRIES', 128))
+
+class LLMResponseCache:
+    """Cache delle risposte dei modelli a due livelli.
+
+    Un LRU in memoria (`memory_entries` voci) davanti a una cache su disco
+    con eviction per dimensione; le voci su disco scadono dopo `ttl` secondi.
+    La chiave copre provider, modello, temperatura, max_tokens, system prompt
+    e prompt: basta una differenza per ottenere una nuova generazione.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_LLM_CACHE_DIR, max_bytes=DEFAULT_LLM_CACHE_MAX_BYTES,
+                 ttl=DEFAULT_LLM_CACHE_TTL, memory_entries=DEFAULT_LLM_CACHE_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bypassed = 0
+        self._memory = OrderedDict()  # chiave -> (creazione, risposta), dalla meno alla più recente
+        self._lock = threading.Lock()
+        self._disk = ExtractionCache(cache_dir, max_bytes)
+
+    @staticmethod
+    def make_key(model_config, system_prompt, prompt, schema=None):
+        """Hash dei parametri che determinano la risposta del modello"""
+        params = [
+            str(getattr(model_config.provider, 'value', model_config.provider)),
+            model_config.name,
+            model_config.temperature,
+            model_config.max_tokens,
+            system_prompt,
+            prompt,
+        ]
+        if schema is not None:
+            params.append(schema)  # le chiavi delle richieste senza schema restano invariate
+        return hashlib.sha256(json.dumps(params, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Restituisce la risposta in cache per `key`, oppure None se assente o scaduta"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+        value = self._disk.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            if now - value['created'] > self.ttl:
+                self.expired += 1
+                self.misses += 1
+                self._disk.delete(key)
+                return None
+            self._remember(key, value['created'], value['response'])
+            self.disk_hits += 1
+            return value['response']
+
+    def put(self, key, response):
+        """Salva una risposta in entrambi i livelli"""
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, response)
+        self._disk.put(key, {'created': created, 'response': response})
+
+    def _remember(self, key, created, response):
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        """Svuota entrambi i livelli"""
+        with self._lock:
+            self._memory.clear()
+        self._disk.clear()
+
+    def stats(self):
+        """Statistiche di utilizzo: hit per livello, hit rate e occupazione del disco"""
+        disk = self._disk.stats()
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+                'expired': self.expired,
+                'bypassed': self.bypassed,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk['entries'],
+                'size_bytes': disk['size_bytes'],
+                'max_bytes': disk['max_bytes'],
+                'evictions': disk['evictions'],
+                'ttl': self.ttl,
+            }
+
+# Istanza globale della cache delle risposte LLM
+llm_cache = LLMResponseCache()
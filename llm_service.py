@@ -1,37 +1,209 @@
+import os
 import json
+import time
+import hashlib
+import logging
+import threading
 import requests
-from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Iterator
 from openai import OpenAI
 from anthropic import Anthropic
 import google.generativeai as genai
 from config import LLMProvider, llm_config, ModelConfig
+from llm_cache import llm_cache
+from token_budget import TokenBudgetError, estimate_prompt, estimate_tokens, record_latency
+from resilience import CircuitBreaker, LatencyWindow
+from rate_limit import RateLimiter, RateLimitedError, CallTimings, parse_retry_after, rate_limit_info
+
+logger = logging.getLogger(__name__)
+
+# Dimensione dei pool di connessioni keep-alive verso gli endpoint HTTP (Ollama, LM Studio)
+HTTP_POOL_CONNECTIONS = int(os.getenv('SLIDEGURU_HTTP_POOL_CONNECTIONS', 4))
+HTTP_POOL_MAXSIZE = int(os.getenv('SLIDEGURU_HTTP_POOL_MAXSIZE', 10))
+
+# Scoperta dei modelli locali: validità dell'elenco, timeout delle sonde ed esclusione degli endpoint non raggiungibili
+LOCAL_DISCOVERY_TTL = float(os.getenv('SLIDEGURU_LOCAL_DISCOVERY_TTL', 30))
+LOCAL_PROBE_TIMEOUT = float(os.getenv('SLIDEGURU_LOCAL_PROBE_TIMEOUT', 5))
+LOCAL_ENDPOINT_COOLOFF = float(os.getenv('SLIDEGURU_LOCAL_ENDPOINT_COOLOFF', 60))
+
+# Failover: modelli di riserva in ordine di preferenza (ID separati da virgola)
+FALLBACK_MODELS = [m.strip() for m in os.getenv('SLIDEGURU_FALLBACK_MODELS', '').split(',') if m.strip()]
+
+# Hedging: secondo modello in parallelo oltre il percentile di latenza (attesa fissa finché mancano campioni)
+HEDGING = os.getenv('SLIDEGURU_HEDGING', '0') != '0'
+HEDGE_PERCENTILE = float(os.getenv('SLIDEGURU_HEDGE_PERCENTILE', 95))
+HEDGE_DEFAULT_DELAY = float(os.getenv('SLIDEGURU_HEDGE_DELAY', 20))
+
+# Circuit breaker: errori consecutivi prima di escludere un endpoint e durata dell'esclusione
+BREAKER_FAILURES = int(os.getenv('SLIDEGURU_BREAKER_FAILURES', 3))
+BREAKER_RESET_TIMEOUT = float(os.getenv('SLIDEGURU_BREAKER_RESET', 30))
+
+# Limiti per provider (richieste al minuto, chiamate contemporanee; 0 = illimitato), applicati
+# per endpoint: ogni server locale ha il proprio limite. Override: SLIDEGURU_RPM_<PROVIDER>, SLIDEGURU_CONCURRENCY_<PROVIDER>
+RATE_LIMIT_DEFAULTS = {'openai': (500, 8), 'anthropic': (50, 4), 'google': (60, 8), 'local': (0, 2)}
+RATE_LIMITS = {
+    provider: (int(os.getenv(f'SLIDEGURU_RPM_{provider.upper()}', rpm)),
+               int(os.getenv(f'SLIDEGURU_CONCURRENCY_{provider.upper()}', concurrency)))
+    for provider, (rpm, concurrency) in RATE_LIMIT_DEFAULTS.items()
+}
+
+# Ripetizioni dopo un rate limit e attesa massima accettata (oltre si passa al modello di riserva)
+RATE_LIMIT_RETRIES = int(os.getenv('SLIDEGURU_RATE_LIMIT_RETRIES', 2))
+RATE_LIMIT_MAX_WAIT = float(os.getenv('SLIDEGURU_RATE_LIMIT_MAX_WAIT', 60))
+
+# Permanenza in memoria dei modelli Ollama dopo ogni richiesta (durata Ollama, es. '30m'; '-1' = sempre)
+OLLAMA_KEEP_ALIVE = os.getenv('SLIDEGURU_OLLAMA_KEEP_ALIVE', '30m')
+
+# Marca il system prompt come prefisso cacheable presso i provider che lo richiedono esplicitamente (Anthropic)
+PROMPT_CACHING = os.getenv('SLIDEGURU_PROMPT_CACHING', '1') != '0'
+
+# Intervallo (s) del heartbeat che tiene caricato il modello locale corrente (0 = disattivato)
+LOCAL_HEARTBEAT_INTERVAL = float(os.getenv('SLIDEGURU_LOCAL_HEARTBEAT', 0))
+
+# Attesa massima (s) per il caricamento di un modello locale in memoria
+LOCAL_WARMUP_TIMEOUT = float(os.getenv('SLIDEGURU_LOCAL_WARMUP_TIMEOUT', 300))
+
+def _usage_value(usage, *path):
+    """Campo numerico dell'usage di un provider (oggetto SDK o dizionario), 0 se assente"""
+    for name in path:
+        if usage is None:
+            return 0
+        usage = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return usage or 0
+
+def _key_fingerprint(api_key):
+    """Impronta della chiave API, per non usare la chiave in chiaro come chiave di dizionario"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else None
+
+class ClientRegistry:
+    """Client riutilizzabili tra le richieste.
+
+    Mantiene una `requests.Session` keep-alive per ogni endpoint (schema+host)
+    e gli oggetti SDK per (provider, modello, chiave API), così le chiamate
+    successive riusano connessioni TCP/TLS già aperte.
+    """
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._sdk = {}
+        self._lock = threading.Lock()
+
+    def session(self, endpoint):
+        """Sessione HTTP persistente per l'endpoint indicato"""
+        parts = urlsplit(endpoint)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[origin] = session
+            return session
+
+    def sdk(self, provider, api_key, factory, model=None):
+        """Oggetto SDK per (provider, modello, chiave), creato con `factory()` al primo uso"""
+        key = (provider, model, _key_fingerprint(api_key))
+        with self._lock:
+            client = self._sdk.get(key)
+            if client is None:
+                client = factory()
+                self._sdk[key] = client
+            return client
+
+    def retain(self, api_keys):
+        """Scarta gli oggetti SDK creati con chiavi non più in uso (`api_keys`: provider -> chiave)"""
+        active = {provider: _key_fingerprint(key) for provider, key in api_keys.items()}
+        with self._lock:
+            self._sdk = {key: client for key, client in self._sdk.items() if active.get(key[0]) == key[2]}
+
+    def close(self):
+        """Chiude tutte le sessioni HTTP"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': sorted(self._sessions), 'sdk_clients': len(self._sdk)}
 
 class LLMService:
     def __init__(self):
         self.openai_client = None
         self.anthropic_client = None
-        self.google_model = None
+        self.google_key = None
+        self.clients = ClientRegistry()
+        # Cache della scoperta dei modelli locali
+        self._local_models = None
+        self._local_models_key = None
+        self._local_models_at = 0.0
+        self._endpoint_models = {}
+        self._unhealthy = {}
+        self._unknown_refresh = {}  # modello sconosciuto -> istante da cui si può interrogare di nuovo
+        self._discovery_running = False
+        self._discovery_lock = threading.Lock()
+        # Failover, hedging e circuit breaker
+        self.fallback_models = list(FALLBACK_MODELS)
+        self.hedging = HEDGING
+        self._breakers = {}
+        self._latencies = {}
+        self._limiters = {}
+        self._resilience_lock = threading.Lock()
+        self._dispatch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='slideguru-llm')
+        # Preriscaldamento dei modelli locali: ultimo uso e ultimo caricamento per (endpoint, modello)
+        self._local_activity = {}
+        self._warmups = {}
+        self._warmup_lock = threading.Lock()
+        self._heartbeat_stop = None
+        # Token in input e letti dalla cache dei provider: per thread (ultima chiamata) e per modello
+        self._usage_local = threading.local()
+        self._prompt_cache = {}
         self._initialize_clients()
+        if LOCAL_HEARTBEAT_INTERVAL > 0:
+            self.start_heartbeat(LOCAL_HEARTBEAT_INTERVAL)
     
     def _initialize_clients(self):
-        """Inizializza i client per le diverse API"""
+        """Inizializza i client per le diverse API.
+
+        I client esistenti vengono riusati se la chiave non è cambiata; altrimenti
+        quelli nuovi sostituiscono i precedenti con una singola assegnazione, così
+        le richieste già in corso terminano con il client con cui sono partite.
+        """
+        api_keys = {provider: llm_config.get_api_key(provider)
+                    for provider in (LLMProvider.OPENAI, LLMProvider.ANTHROPIC, LLMProvider.GOOGLE)}
+        
         # OpenAI
-        openai_key = llm_config.get_api_key(LLMProvider.OPENAI)
-        if openai_key:
-            self.openai_client = OpenAI(api_key=openai_key)
+        openai_key = api_keys[LLMProvider.OPENAI]
+        self.openai_client = self.clients.sdk(
+            LLMProvider.OPENAI, openai_key, lambda: OpenAI(api_key=openai_key)) if openai_key else None
         
         # Anthropic
-        anthropic_key = llm_config.get_api_key(LLMProvider.ANTHROPIC)
-        if anthropic_key:
-            self.anthropic_client = Anthropic(api_key=anthropic_key)
+        anthropic_key = api_keys[LLMProvider.ANTHROPIC]
+        self.anthropic_client = self.clients.sdk(
+            LLMProvider.ANTHROPIC, anthropic_key, lambda: Anthropic(api_key=anthropic_key)) if anthropic_key else None
         
         # Google
-        google_key = llm_config.get_api_key(LLMProvider.GOOGLE)
-        if google_key:
+        google_key = api_keys[LLMProvider.GOOGLE]
+        if google_key and google_key != self.google_key:
             genai.configure(api_key=google_key)
+        self.google_key = google_key
+        
+        self.clients.retain(api_keys)
+    
+    def _google_model(self, model_config):
+        """Modello Gemini riutilizzato per (modello, chiave)"""
+        return self.clients.sdk(LLMProvider.GOOGLE, self.google_key,
+                                lambda: genai.GenerativeModel(model_config.name), model=model_config.name)
     
-    def generate_content(self, prompt: str, model_id: Optional[str] = None) -> str:
-        """Genera contenuto usando il modello specificato o quello corrente"""
+    def resolve_model(self, model_id: Optional[str] = None) -> ModelConfig:
+        """Restituisce la configurazione del modello specificato o di quello corrente"""
         if model_id is None:
             model_id = llm_config.current_model
         
@@ -40,31 +212,421 @@ class LLMService:
         
         # Se non trovato nei modelli statici, controlla i modelli locali dinamici
         if not model_config and (model_id.startswith('local_') or model_id.startswith('ollama_') or model_id.startswith('lmstudio_')):
-            local_models = self.available_local_models()
-            model_config = local_models.get(model_id)
+            model_config = self.available_local_models().get(model_id)
+            if not model_config and self._claim_unknown_refresh(model_id):
+                # Modello non ancora noto: nuova interrogazione, senza gli endpoint in cool-off
+                model_config = self.refresh_local_models().get(model_id)
         
         if not model_config:
             raise ValueError(f"Modello {model_id} non trovato")
+        return model_config
+    
+    def _claim_unknown_refresh(self, model_id):
+        """True al più una volta per `LOCAL_ENDPOINT_COOLOFF` secondi per lo stesso modello sconosciuto"""
+        now = time.time()
+        with self._discovery_lock:
+            if self._unknown_refresh.get(model_id, 0) > now:
+                return False
+            self._unknown_refresh[model_id] = now + LOCAL_ENDPOINT_COOLOFF
+            return True
+    
+    def _candidates(self, model_id=None):
+        """Modello richiesto seguito dai modelli di riserva configurati (quelli risolvibili)"""
+        primary_id = model_id or llm_config.current_model
+        candidates = [self.resolve_model(primary_id)]
+        for fallback_id in self.fallback_models:
+            if fallback_id == primary_id:
+                continue
+            try:
+                candidates.append(self.resolve_model(fallback_id))
+            except ValueError:
+                continue
+        return candidates
+    
+    def _endpoint_key(self, model_config):
+        """Endpoint a cui si riferisce il circuit breaker: il provider cloud o l'URL del server locale"""
+        if model_config.provider == LLMProvider.LOCAL:
+            return self._local_target(model_config)[0]
+        return str(getattr(model_config.provider, 'value', model_config.provider))
+    
+    def _breaker(self, model_config):
+        key = self._endpoint_key(model_config)
+        with self._resilience_lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(key, BREAKER_FAILURES, BREAKER_RESET_TIMEOUT)
+                self._breakers[key] = breaker
+            return breaker
+    
+    def _limiter(self, model_config):
+        """Limitatore di frequenza e concorrenza dell'endpoint del modello"""
+        key = self._endpoint_key(model_config)
+        with self._resilience_lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                provider = str(getattr(model_config.provider, 'value', model_config.provider))
+                limiter = RateLimiter(key, *RATE_LIMITS.get(provider, (0, 0)))
+                self._limiters[key] = limiter
+            return limiter
+    
+    def _latency_window(self, model_config):
+        with self._resilience_lock:
+            return self._latencies.setdefault(model_config.name, LatencyWindow())
+    
+    def _hedge_delay(self, model_config):
+        """Attesa prima di interpellare un modello di riserva: percentile delle latenze osservate"""
+        delay = self._latency_window(model_config).percentile(HEDGE_PERCENTILE)
+        return delay if delay is not None else HEDGE_DEFAULT_DELAY
+    
+    def _generate(self, system_prompt, prompt, model_config, schema=None):
+        """Chiamata al provider del modello.
+
+        Il system prompt viaggia come parte separata, identica tra le chiamate,
+        così i provider possono riusarne il prefisso in cache; `schema` richiede
+        un output JSON strutturato dove supportato.
+        """
+        if model_config.provider == LLMProvider.OPENAI:
+            return self._generate_openai(system_prompt, prompt, model_config, schema)
+        elif model_config.provider == LLMProvider.ANTHROPIC:
+            return self._generate_anthropic(system_prompt, prompt, model_config)
+        elif model_config.provider == LLMProvider.GOOGLE:
+            return self._generate_google(system_prompt, prompt, model_config)
+        elif model_config.provider == LLMProvider.LOCAL:
+            return self._generate_local(system_prompt, prompt, model_config, schema)
+        else:
+            raise ValueError(f"Provider {model_config.provider} non supportato")
+    
+    def _open_stream(self, system_prompt, prompt, model_config, schema=None):
+        """Stream dei token dal provider del modello"""
+        if model_config.provider == LLMProvider.OPENAI:
+            return self._stream_openai(system_prompt, prompt, model_config, schema)
+        elif model_config.provider == LLMProvider.ANTHROPIC:
+            return self._stream_anthropic(system_prompt, prompt, model_config)
+        elif model_config.provider == LLMProvider.GOOGLE:
+            return self._stream_google(system_prompt, prompt, model_config)
+        elif model_config.provider == LLMProvider.LOCAL:
+            return self._stream_local(system_prompt, prompt, model_config, schema)
+        else:
+            raise ValueError(f"Provider {model_config.provider} non supportato")
+    
+    def _call_model(self, model_config, system_prompt, prompt, estimate, timings=None, schema=None):
+        """Singola chiamata a un modello attraverso il limitatore del suo endpoint.
+
+        Dopo un rate limit attende il Retry-After (o il backoff) e ripete fino a
+        `RATE_LIMIT_RETRIES` volte; attesa in coda e tempo di generazione sono
+        accumulati separatamente in `timings`.
+        """
+        limiter = self._limiter(model_config)
+        timings = timings or CallTimings()
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            with limiter.acquire() as waited:
+                start = time.perf_counter()
+                self._take_usage()
+                try:
+                    response = self._generate(system_prompt, prompt, model_config, schema)
+                except Exception as e:
+                    timings.add(queue_wait=waited, generation=time.perf_counter() - start, calls=1, **self._take_usage())
+                    limited, retry_after = rate_limit_info(e)
+                    if not limited:
+                        raise
+                    pause = limiter.on_rate_limited(retry_after)
+                    timings.add(rate_limited=1)
+                    if attempt == RATE_LIMIT_RETRIES or pause > RATE_LIMIT_MAX_WAIT:
+                        raise
+                    continue
+                elapsed = time.perf_counter() - start
+                timings.add(queue_wait=waited, generation=elapsed, calls=1, **self._take_usage())
+                limiter.on_success()
+            self._latency_window(model_config).add(elapsed)
+            if response:
+                record_latency(model_config, estimate['input_tokens'], estimate_tokens(response), elapsed)
+            return response
+    
+    def _attempts(self, candidates, system_prompt, prompt, errors):
+        """Candidati che entrano nel context window, con il relativo preventivo"""
+        attempts = []
+        for model_config in candidates:
+            try:
+                attempts.append((model_config, self.preflight(model_config, system_prompt, prompt)))
+            except TokenBudgetError as e:
+                errors.append(str(e))
+        if not attempts and errors:
+            raise TokenBudgetError('; '.join(errors))
+        return attempts
+    
+    def _dispatch(self, candidates, system_prompt, prompt, timings=None, schema=None):
+        """Prova i candidati in ordine, saltando gli endpoint con circuito aperto.
+
+        Con l'hedging attivo, se il modello in corso supera il percentile
+        `HEDGE_PERCENTILE` delle sue latenze parte in parallelo il candidato
+        successivo e vince la prima risposta valida. Restituisce (modello, risposta).
+        """
+        errors = []
+        queue = self._attempts(candidates, system_prompt, prompt, errors)
         
-        # Prepara il prompt finale con il system prompt
-        system_prompt = llm_config.get_system_prompt()
-        full_prompt = f"{system_prompt}\n\n{prompt}"
+        if not self.hedging:
+            # Failover sequenziale nel thread chiamante
+            for model_config, estimate in queue:
+                breaker = self._breaker(model_config)
+                if not breaker.allow():
+                    errors.append(f"{model_config.name}: endpoint {breaker.name} temporaneamente escluso")
+                    continue
+                try:
+                    response = self._call_model(model_config, system_prompt, prompt, estimate, timings, schema)
+                except Exception as e:
+                    breaker.record_failure()
+                    errors.append(f"{model_config.name}: {str(e)}")
+                    continue
+                breaker.record_success()
+                return model_config, response
+            raise Exception('; '.join(errors) or "Nessun modello disponibile")
+        
+        pending = {}
+        
+        def launch():
+            while queue:
+                model_config, estimate = queue.pop(0)
+                breaker = self._breaker(model_config)
+                if not breaker.allow():
+                    errors.append(f"{model_config.name}: endpoint {breaker.name} temporaneamente escluso")
+                    continue
+                future = self._dispatch_executor.submit(self._call_model, model_config, system_prompt, prompt, estimate, timings, schema)
+                # Esito registrato anche per le chiamate ancora in corso quando un'altra ha già risposto
+                future.add_done_callback(lambda f, b=breaker: b.record_failure() if f.exception() else b.record_success())
+                pending[future] = model_config
+                return model_config
+            return None
+        
+        current = launch()
+        while pending:
+            timeout = self._hedge_delay(current) if self.hedging and queue else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                current = launch() or current
+                continue
+            for future in done:
+                model_config = pending.pop(future)
+                try:
+                    return model_config, future.result()
+                except Exception as e:
+                    errors.append(f"{model_config.name}: {str(e)}")
+            if not pending:
+                current = launch() or current
+        raise Exception('; '.join(errors) or "Nessun modello disponibile")
+    
+    def generate_content(self, prompt: str, model_id: Optional[str] = None, use_cache: bool = True,
+                         timings: Optional[CallTimings] = None, schema: Optional[Dict[str, Any]] = None,
+                         context: Optional[str] = None) -> str:
+        """Genera contenuto usando il modello specificato o quello corrente.
+
+        Con `use_cache` una richiesta identica a una precedente (stesso modello,
+        parametri, system prompt e prompt) viene servita dalla cache senza
+        chiamare il provider. Se il modello fallisce, o con l'hedging risponde
+        troppo lentamente, subentrano i modelli di riserva `SLIDEGURU_FALLBACK_MODELS`.
+        Con `schema` (JSON schema) i provider che lo supportano restituiscono JSON valido.
+        `context` sono istruzioni o contenuti comuni a più chiamate: vanno nella
+        parte di sistema, riusabile dalla cache dei prompt del provider.
+        """
+        candidates = self._candidates(model_id)
+        system_prompt = self._system_part(context)
+        
+        if use_cache:
+            cached = llm_cache.get(llm_cache.make_key(candidates[0], system_prompt, prompt, schema))
+            if cached is not None:
+                return cached
+        else:
+            llm_cache.record_bypass()
         
         try:
-            if model_config.provider == LLMProvider.OPENAI:
-                return self._generate_openai(full_prompt, model_config)
-            elif model_config.provider == LLMProvider.ANTHROPIC:
-                return self._generate_anthropic(full_prompt, model_config)
-            elif model_config.provider == LLMProvider.GOOGLE:
-                return self._generate_google(full_prompt, model_config)
-            elif model_config.provider == LLMProvider.LOCAL:
-                return self._generate_local(full_prompt, model_config)
-            else:
-                raise ValueError(f"Provider {model_config.provider} non supportato")
+            model_config, response = self._dispatch(candidates, system_prompt, prompt, timings, schema)
+        except TokenBudgetError:
+            raise
         except Exception as e:
             raise Exception(f"Errore nella generazione del contenuto: {str(e)}")
+        
+        if response:
+            llm_cache.put(llm_cache.make_key(model_config, system_prompt, prompt, schema), response)
+        return response
+    
+    @staticmethod
+    def _system_part(context=None):
+        """System prompt seguito dalle istruzioni stabili della richiesta: il prefisso cacheable"""
+        system_prompt = llm_config.get_system_prompt()
+        return f"{system_prompt}\n\n{context}" if context else system_prompt
+    
+    def _report_usage(self, model_config, input_tokens=0, cached_tokens=0, cache_write_tokens=0):
+        """Registra i token in input della chiamata e quanti sono stati letti (o scritti) nella cache del provider"""
+        usage = {'input_tokens': input_tokens or 0, 'cached_tokens': cached_tokens or 0, 'cache_write_tokens': cache_write_tokens or 0}
+        self._usage_local.last = usage
+        with self._resilience_lock:
+            totals = self._prompt_cache.setdefault(model_config.name, dict.fromkeys(('calls', *usage), 0))
+            totals['calls'] += 1
+            for key, value in usage.items():
+                totals[key] += value
     
-    def _generate_openai(self, prompt: str, model_config) -> str:
+    def _take_usage(self):
+        """Usage dell'ultima chiamata del thread corrente (vuoto se il provider non lo riporta)"""
+        usage = getattr(self._usage_local, 'last', None)
+        self._usage_local.last = None
+        return usage or {}
+    
+    def prompt_cache_stats(self):
+        """Token in input e token serviti dalla cache dei prompt dei provider, per modello"""
+        with self._resilience_lock:
+            totals = {name: dict(values) for name, values in self._prompt_cache.items()}
+        for values in totals.values():
+            values['cached_ratio'] = round(values['cached_tokens'] / values['input_tokens'], 3) if values['input_tokens'] else 0.0
+        return {'enabled': PROMPT_CACHING, 'models': totals}
+    
+    def preflight(self, model_config, system_prompt, prompt):
+        """Stima token, costo e latenza prima della chiamata; rifiuta i prompt oltre il context window"""
+        estimate = estimate_prompt(model_config, system_prompt, prompt)
+        if not estimate['fits']:
+            raise TokenBudgetError(
+                f"Prompt di circa {estimate['input_tokens']} token oltre il limite di {estimate['max_input_tokens']} "
+                f"del modello {model_config.name}"
+            )
+        return estimate
+    
+    def generate_content_stream(self, prompt: str, model_id: Optional[str] = None, use_cache: bool = True,
+                                timings: Optional[CallTimings] = None, schema: Optional[Dict[str, Any]] = None,
+                                context: Optional[str] = None) -> Iterator[str]:
+        """Come generate_content, ma restituisce i frammenti di testo man mano che arrivano.
+
+        Si passa a un modello di riserva solo se lo stream fallisce prima del primo frammento.
+        """
+        candidates = self._candidates(model_id)
+        system_prompt = self._system_part(context)
+        
+        if use_cache:
+            cached = llm_cache.get(llm_cache.make_key(candidates[0], system_prompt, prompt, schema))
+            if cached is not None:
+                # Risposta già nota: un unico frammento con il testo completo
+                yield cached
+                return
+        else:
+            llm_cache.record_bypass()
+        
+        errors = []
+        for model_config, estimate in self._attempts(candidates, system_prompt, prompt, errors):
+            breaker = self._breaker(model_config)
+            if not breaker.allow():
+                errors.append(f"{model_config.name}: endpoint {breaker.name} temporaneamente escluso")
+                continue
+            
+            limiter = self._limiter(model_config)
+            timings = timings or CallTimings()
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                parts = []
+                error = None
+                first_token = None
+                with limiter.acquire() as waited:
+                    start = time.perf_counter()
+                    self._take_usage()
+                    try:
+                        for token in self._open_stream(system_prompt, prompt, model_config, schema):
+                            if token:
+                                if first_token is None:
+                                    first_token = time.perf_counter() - start
+                                parts.append(token)
+                                yield token
+                    except Exception as e:
+                        error = e
+                    elapsed = time.perf_counter() - start
+                    timings.add(queue_wait=waited, generation=elapsed, calls=1, first_token=first_token, **self._take_usage())
+                if error is None:
+                    break
+                # Rate limit prima del primo frammento: attesa e nuovo tentativo sullo stesso modello
+                limited, retry_after = rate_limit_info(error)
+                if not limited or parts:
+                    break
+                pause = limiter.on_rate_limited(retry_after)
+                timings.add(rate_limited=1)
+                if attempt == RATE_LIMIT_RETRIES or pause > RATE_LIMIT_MAX_WAIT:
+                    break
+            
+            if error is not None:
+                breaker.record_failure()
+                if parts:
+                    raise Exception(f"Errore nella generazione del contenuto: {str(error)}")
+                errors.append(f"{model_config.name}: {str(error)}")
+                continue
+            
+            limiter.on_success()
+            breaker.record_success()
+            self._latency_window(model_config).add(elapsed)
+            # Solo le risposte ricevute per intero finiscono in cache
+            if parts:
+                response = ''.join(parts)
+                record_latency(model_config, estimate['input_tokens'], estimate_tokens(response), elapsed)
+                llm_cache.put(llm_cache.make_key(model_config, system_prompt, prompt, schema), response)
+            return
+        
+        raise Exception(f"Errore nella generazione del contenuto: {'; '.join(errors) or 'nessun modello disponibile'}")
+    
+    def resilience_stats(self):
+        """Stato di failover, hedging, circuit breaker e limitatori"""
+        with self._resilience_lock:
+            breakers = dict(self._breakers)
+            latencies = dict(self._latencies)
+            limiters = dict(self._limiters)
+        return {
+            'fallback_models': list(self.fallback_models),
+            'hedging': self.hedging,
+            'breakers': {key: breaker.to_dict() for key, breaker in breakers.items()},
+            'latency_p95': {name: window.percentile(95) for name, window in latencies.items()},
+            'rate_limits': {key: limiter.stats() for key, limiter in limiters.items()},
+        }
+    
+    @staticmethod
+    def _raise_if_overloaded(response, backend_name, endpoint):
+        """Solleva RateLimitedError se il server locale risponde 429/503 (coda piena o modello in caricamento)"""
+        if response.status_code in (429, 503):
+            raise RateLimitedError(f"{backend_name} sovraccarico su {endpoint}: {response.status_code}",
+                                   parse_retry_after(response.headers.get('Retry-After')))
+    
+    @staticmethod
+    def _openai_format(schema):
+        # JSON mode: disponibile su tutti i modelli chat recenti, a differenza degli schemi stretti
+        return {"response_format": {"type": "json_object"}} if schema else {}
+    
+    @staticmethod
+    def _local_format(payload, backend, schema):
+        """Aggiunge al payload la richiesta di output strutturato nel formato del backend locale"""
+        if schema:
+            if backend == "ollama":
+                payload["format"] = schema
+            else:
+                payload["response_format"] = {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}}
+        return payload
+    
+    @staticmethod
+    def _chat_messages(system_prompt, prompt):
+        # System prompt come primo messaggio: prefisso identico tra le chiamate (cache automatica di OpenAI e server locali)
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        return messages + [{"role": "user", "content": prompt}]
+    
+    @staticmethod
+    def _anthropic_system(system_prompt):
+        """System prompt Anthropic come blocco di testo con cache_control"""
+        if not system_prompt:
+            return {}
+        block = {"type": "text", "text": system_prompt}
+        if PROMPT_CACHING:
+            block["cache_control"] = {"type": "ephemeral"}
+        return {"system": [block]}
+    
+    def _report_openai_usage(self, model_config, usage):
+        self._report_usage(model_config, _usage_value(usage, 'prompt_tokens'),
+                           _usage_value(usage, 'prompt_tokens_details', 'cached_tokens'))
+    
+    def _report_anthropic_usage(self, model_config, usage):
+        # input_tokens esclude i token letti o scritti nella cache
+        cached = _usage_value(usage, 'cache_read_input_tokens')
+        written = _usage_value(usage, 'cache_creation_input_tokens')
+        self._report_usage(model_config, _usage_value(usage, 'input_tokens') + cached + written, cached, written)
+    
+    def _generate_openai(self, system_prompt: str, prompt: str, model_config, schema=None) -> str:
         """Genera contenuto usando OpenAI"""
         if not self.openai_client:
             raise Exception("Client OpenAI non inizializzato. Verifica la chiave API.")
@@ -72,15 +634,17 @@ class LLMService:
         try:
             response = self.openai_client.chat.completions.create(
                 model=model_config.name,
-                messages=[{"role": "user", "content": prompt}],
+                messages=self._chat_messages(system_prompt, prompt),
                 max_tokens=model_config.max_tokens,
-                temperature=model_config.temperature
+                temperature=model_config.temperature,
+                **self._openai_format(schema)
             )
+            self._report_openai_usage(model_config, getattr(response, 'usage', None))
             return response.choices[0].message.content
         except Exception as e:
             raise Exception(f"Errore OpenAI: {str(e)}")
     
-    def _generate_anthropic(self, prompt: str, model_config) -> str:
+    def _generate_anthropic(self, system_prompt: str, prompt: str, model_config) -> str:
         """Genera contenuto usando Anthropic"""
         if not self.anthropic_client:
             raise Exception("Client Anthropic non inizializzato. Verifica la chiave API.")
@@ -90,75 +654,108 @@ class LLMService:
                 model=model_config.name,
                 max_tokens=model_config.max_tokens,
                 temperature=model_config.temperature,
-                messages=[{"role": "user", "content": prompt}]
+                messages=[{"role": "user", "content": prompt}],
+                **self._anthropic_system(system_prompt)
             )
+            self._report_anthropic_usage(model_config, getattr(response, 'usage', None))
             return response.content[0].text
         except Exception as e:
             raise Exception(f"Errore Anthropic: {str(e)}")
     
-    def _generate_google(self, prompt: str, model_config) -> str:
+    def _generate_google(self, system_prompt: str, prompt: str, model_config) -> str:
         """Genera contenuto usando Google Gemini"""
         try:
-            model = genai.GenerativeModel(model_config.name)
+            model = self._google_model(model_config)
             response = model.generate_content(
-                prompt,
+                self._google_prompt(system_prompt, prompt),
                 generation_config=genai.types.GenerationConfig(
                     max_output_tokens=model_config.max_tokens,
                     temperature=model_config.temperature
                 )
             )
+            self._report_google_usage(model_config, getattr(response, 'usage_metadata', None))
             return response.text
         except Exception as e:
             raise Exception(f"Errore Google: {str(e)}")
     
-    def _generate_local(self, prompt: str, model_config) -> str:
+    @staticmethod
+    def _google_prompt(system_prompt, prompt):
+        # La versione dell'SDK in uso non accetta system_instruction: il system prompt resta in testa al prompt
+        return f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+    
+    def _report_google_usage(self, model_config, usage):
+        self._report_usage(model_config, _usage_value(usage, 'prompt_token_count'),
+                           _usage_value(usage, 'cached_content_token_count'))
+    
+    def _report_local_usage(self, model_config, backend, data):
+        if backend == "ollama":
+            # Ollama conta solo i token del prompt effettivamente valutati: il prefisso riusato dalla cache KV ne è escluso
+            self._report_usage(model_config, data.get("prompt_eval_count"))
+        else:
+            self._report_openai_usage(model_config, data.get("usage"))
+    
+    def _local_target(self, model_config):
+        """Restituisce (endpoint, backend) per un modello locale"""
+        # Usa l'endpoint specifico del modello se disponibile, altrimenti quello configurato
+        endpoint = model_config.base_url if model_config.base_url else llm_config.local_endpoint
+        
+        # Determina il backend dal tipo di modello o dalla configurazione
+        if "ollama" in model_config.description.lower():
+            backend = "ollama"
+        elif "lm studio" in model_config.description.lower():
+            backend = "lmstudio"
+        else:
+            backend = llm_config.local_backend
+        return endpoint, backend
+    
+    def _generate_local(self, system_prompt: str, prompt: str, model_config, schema=None) -> str:
         """Genera contenuto usando modelli locali (Ollama/LM Studio)"""
         try:
-            # Usa l'endpoint specifico del modello se disponibile, altrimenti quello configurato
-            endpoint = model_config.base_url if model_config.base_url else llm_config.local_endpoint
-            
-            # Determina il backend dal tipo di modello o dalla configurazione
-            if "ollama" in model_config.description.lower():
-                backend = "ollama"
-            elif "lm studio" in model_config.description.lower():
-                backend = "lmstudio"
-            else:
-                backend = llm_config.local_backend
+            endpoint, backend = self._local_target(model_config)
+            self._touch_local(endpoint, model_config.name)
             
             if backend == "ollama":
-                response = requests.post(
+                response = self.clients.session(endpoint).post(
                     f"{endpoint}/api/generate",
-                    json={
+                    json=self._local_format({
                         "model": model_config.name,
+                        "system": system_prompt,
                         "prompt": prompt,
                         "stream": False,
+                        "keep_alive": OLLAMA_KEEP_ALIVE,
                         "options": {
                             "temperature": model_config.temperature,
                             "num_predict": model_config.max_tokens
                         }
-                    },
+                    }, backend, schema),
                     timeout=120
                 )
                 
+                self._raise_if_overloaded(response, "Ollama", endpoint)
                 if response.status_code == 200:
-                    return response.json()["response"]
+                    data = response.json()
+                    self._report_local_usage(model_config, backend, data)
+                    return data["response"]
                 else:
                     raise Exception(f"Errore API Ollama su {endpoint}: {response.status_code}")
             
             elif backend == "lmstudio":
-                response = requests.post(
+                response = self.clients.session(endpoint).post(
                     f"{endpoint}/v1/chat/completions",
-                    json={
+                    json=self._local_format({
                         "model": model_config.name,
-                        "messages": [{"role": "user", "content": prompt}],
+                        "messages": self._chat_messages(system_prompt, prompt),
                         "max_tokens": model_config.max_tokens,
                         "temperature": model_config.temperature
-                    },
+                    }, backend, schema),
                     timeout=120
                 )
                 
+                self._raise_if_overloaded(response, "LM Studio", endpoint)
                 if response.status_code == 200:
-                    return response.json()["choices"][0]["message"]["content"]
+                    data = response.json()
+                    self._report_local_usage(model_config, backend, data)
+                    return data["choices"][0]["message"]["content"]
                 else:
                     raise Exception(f"Errore API LM Studio su {endpoint}: {response.status_code}")
             
@@ -168,6 +765,225 @@ class LLMService:
         except Exception as e:
             raise Exception(f"Errore modello locale: {str(e)}")
     
+    def _stream_openai(self, system_prompt: str, prompt: str, model_config, schema=None) -> Iterator[str]:
+        """Streaming dei token da OpenAI"""
+        if not self.openai_client:
+            raise Exception("Client OpenAI non inizializzato. Verifica la chiave API.")
+        
+        try:
+            stream = self.openai_client.chat.completions.create(
+                model=model_config.name,
+                messages=self._chat_messages(system_prompt, prompt),
+                max_tokens=model_config.max_tokens,
+                temperature=model_config.temperature,
+                stream=True,
+                # L'ultimo chunk riporta l'usage, compresi i token letti dalla cache
+                extra_body={"stream_options": {"include_usage": True}},
+                **self._openai_format(schema)
+            )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    self._report_openai_usage(model_config, chunk.usage)
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
+        except Exception as e:
+            raise Exception(f"Errore OpenAI: {str(e)}")
+    
+    def _stream_anthropic(self, system_prompt: str, prompt: str, model_config) -> Iterator[str]:
+        """Streaming dei token da Anthropic"""
+        if not self.anthropic_client:
+            raise Exception("Client Anthropic non inizializzato. Verifica la chiave API.")
+        
+        try:
+            stream = self.anthropic_client.messages.create(
+                model=model_config.name,
+                max_tokens=model_config.max_tokens,
+                temperature=model_config.temperature,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                **self._anthropic_system(system_prompt)
+            )
+            for event in stream:
+                if event.type == "message_start":
+                    self._report_anthropic_usage(model_config, getattr(event.message, 'usage', None))
+                elif event.type == "content_block_delta":
+                    yield event.delta.text
+        except Exception as e:
+            raise Exception(f"Errore Anthropic: {str(e)}")
+    
+    def _stream_google(self, system_prompt: str, prompt: str, model_config) -> Iterator[str]:
+        """Streaming dei token da Google Gemini"""
+        try:
+            model = self._google_model(model_config)
+            response = model.generate_content(
+                self._google_prompt(system_prompt, prompt),
+                generation_config=genai.types.GenerationConfig(
+                    max_output_tokens=model_config.max_tokens,
+                    temperature=model_config.temperature
+                ),
+                stream=True
+            )
+            for chunk in response:
+                yield chunk.text
+            self._report_google_usage(model_config, getattr(response, 'usage_metadata', None))
+        except Exception as e:
+            raise Exception(f"Errore Google: {str(e)}")
+    
+    def _stream_local(self, system_prompt: str, prompt: str, model_config, schema=None) -> Iterator[str]:
+        """Streaming dei token da modelli locali (Ollama: NDJSON, LM Studio: SSE)"""
+        try:
+            endpoint, backend = self._local_target(model_config)
+            self._touch_local(endpoint, model_config.name)
+            
+            if backend == "ollama":
+                response = self.clients.session(endpoint).post(
+                    f"{endpoint}/api/generate",
+                    json=self._local_format({
+                        "model": model_config.name,
+                        "system": system_prompt,
+                        "prompt": prompt,
+                        "stream": True,
+                        "keep_alive": OLLAMA_KEEP_ALIVE,
+                        "options": {
+                            "temperature": model_config.temperature,
+                            "num_predict": model_config.max_tokens
+                        }
+                    }, backend, schema),
+                    stream=True,
+                    timeout=120
+                )
+                self._raise_if_overloaded(response, "Ollama", endpoint)
+                if response.status_code != 200:
+                    raise Exception(f"Errore API Ollama su {endpoint}: {response.status_code}")
+                with response:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        yield data.get("response", "")
+                        if data.get("done"):
+                            self._report_local_usage(model_config, backend, data)
+                            break
+            
+            elif backend == "lmstudio":
+                response = self.clients.session(endpoint).post(
+                    f"{endpoint}/v1/chat/completions",
+                    json=self._local_format({
+                        "model": model_config.name,
+                        "messages": self._chat_messages(system_prompt, prompt),
+                        "max_tokens": model_config.max_tokens,
+                        "temperature": model_config.temperature,
+                        "stream": True
+                    }, backend, schema),
+                    stream=True,
+                    timeout=120
+                )
+                self._raise_if_overloaded(response, "LM Studio", endpoint)
+                if response.status_code != 200:
+                    raise Exception(f"Errore API LM Studio su {endpoint}: {response.status_code}")
+                with response:
+                    for line in response.iter_lines():
+                        if not line.startswith(b"data: "):
+                            continue
+                        payload = line[len(b"data: "):]
+                        if payload.strip() == b"[DONE]":
+                            break
+                        choices = json.loads(payload).get("choices") or [{}]
+                        yield choices[0].get("delta", {}).get("content") or ""
+            
+            else:
+                raise Exception(f"Backend locale non supportato: {backend}")
+        
+        except Exception as e:
+            raise Exception(f"Errore modello locale: {str(e)}")
+    
+    def _touch_local(self, endpoint, model_name):
+        with self._warmup_lock:
+            self._local_activity[(endpoint, model_name)] = time.time()
+    
+    def warm_up(self, model_id: Optional[str] = None) -> Dict[str, Any]:
+        """Carica in memoria un modello locale prima della prima richiesta.
+
+        Ollama carica il modello con una richiesta senza prompt (e `keep_alive`),
+        LM Studio con una generazione di un solo token. I modelli cloud sono ignorati.
+        """
+        model_config = self.resolve_model(model_id)
+        if model_config.provider != LLMProvider.LOCAL:
+            return {'status': 'skipped', 'model': model_config.name}
+        endpoint, backend = self._local_target(model_config)
+        start = time.perf_counter()
+        try:
+            if backend == "ollama":
+                response = self.clients.session(endpoint).post(
+                    f"{endpoint}/api/generate",
+                    json={"model": model_config.name, "keep_alive": OLLAMA_KEEP_ALIVE},
+                    timeout=LOCAL_WARMUP_TIMEOUT
+                )
+            elif backend == "lmstudio":
+                response = self.clients.session(endpoint).post(
+                    f"{endpoint}/v1/chat/completions",
+                    json={"model": model_config.name, "messages": [{"role": "user", "content": "ok"}], "max_tokens": 1},
+                    timeout=LOCAL_WARMUP_TIMEOUT
+                )
+            else:
+                raise Exception(f"Backend locale non supportato: {backend}")
+            response.raise_for_status()
+            result = {'status': 'warm', 'model': model_config.name, 'seconds': round(time.perf_counter() - start, 3)}
+        except Exception as e:
+            result = {'status': 'error', 'model': model_config.name, 'error': str(e)}
+        result['at'] = time.time()
+        with self._warmup_lock:
+            self._warmups[f"{endpoint} {model_config.name}"] = result
+            if result['status'] == 'warm':
+                self._local_activity[(endpoint, model_config.name)] = time.time()
+        return result
+    
+    def preload_model(self, model_id: Optional[str] = None):
+        """Preriscaldamento in background, senza bloccare chi ha selezionato il modello"""
+        def run():
+            try:
+                self.warm_up(model_id)
+            except ValueError as e:
+                logger.warning(f"Preriscaldamento non eseguito: {e}")
+        
+        threading.Thread(target=run, name='slideguru-warmup', daemon=True).start()
+    
+    def start_heartbeat(self, interval=LOCAL_HEARTBEAT_INTERVAL):
+        """Riscalda periodicamente il modello locale corrente se resta inattivo per `interval` secondi"""
+        self.stop_heartbeat()
+        stop = threading.Event()
+        
+        def run():
+            while not stop.wait(interval):
+                try:
+                    model_config = self.resolve_model()
+                except ValueError:
+                    continue
+                if model_config.provider != LLMProvider.LOCAL:
+                    continue
+                endpoint = self._local_target(model_config)[0]
+                with self._warmup_lock:
+                    idle = time.time() - self._local_activity.get((endpoint, model_config.name), 0)
+                if idle >= interval:
+                    self.warm_up(llm_config.current_model)
+        
+        self._heartbeat_stop = stop
+        threading.Thread(target=run, name='slideguru-heartbeat', daemon=True).start()
+    
+    def stop_heartbeat(self):
+        if self._heartbeat_stop:
+            self._heartbeat_stop.set()
+            self._heartbeat_stop = None
+    
+    def warmup_stats(self):
+        """Esito dell'ultimo preriscaldamento per ogni modello locale"""
+        with self._warmup_lock:
+            return {
+                'keep_alive': OLLAMA_KEEP_ALIVE,
+                'heartbeat': self._heartbeat_stop is not None,
+                'models': {key: dict(result) for key, result in self._warmups.items()},
+            }
+    
     def test_connection(self, provider: LLMProvider) -> Dict[str, Any]:
         """Testa la connessione a un provider"""
         try:
@@ -195,14 +1011,14 @@ class LLMService:
                 backend = llm_config.local_backend
                 try:
                     if backend == "ollama":
-                        response = requests.get(f"{endpoint}/api/tags", timeout=5)
+                        response = self.clients.session(endpoint).get(f"{endpoint}/api/tags", timeout=5)
                         if response.status_code == 200:
                             models = response.json().get("models", [])
                             return {"status": "success", "message": f"Connesso a Ollama. Modelli disponibili: {len(models)}"}
                         else:
                             return {"status": "error", "message": "Ollama non raggiungibile"}
                     elif backend == "lmstudio":
-                        response = requests.get(f"{endpoint}/v1/internal/model/all", timeout=5)
+                        response = self.clients.session(endpoint).get(f"{endpoint}/v1/internal/model/all", timeout=5)
                         if response.status_code == 200:
                             models = response.json().get("data", [])
                             return {"status": "success", "message": f"Connesso a LM Studio. Modelli disponibili: {len(models)}"}
@@ -234,14 +1050,14 @@ class LLMService:
                 backend = llm_config.local_backend
                 try:
                     if backend == "ollama":
-                        response = requests.get(f"{endpoint}/api/tags", timeout=5)
+                        response = self.clients.session(endpoint).get(f"{endpoint}/api/tags", timeout=5)
                         if response.status_code == 200:
                             models = [model["name"] for model in response.json().get("models", [])]
                             return {"status": "success", "models": models}
                         else:
                             return {"status": "error", "message": "Ollama non raggiungibile"}
                     elif backend == "lmstudio":
-                        response = requests.get(f"{endpoint}/v1/internal/model/all", timeout=5)
+                        response = self.clients.session(endpoint).get(f"{endpoint}/v1/internal/model/all", timeout=5)
                         if response.status_code == 200:
                             models = [model["modelId"] for model in response.json().get("data", [])]
                             return {"status": "success", "models": models}
@@ -267,10 +1083,8 @@ class LLMService:
                     available[model_id] = model
         return available
 
-    def available_local_models(self):
-        """Restituisce tutti i modelli locali disponibili su tutti gli endpoint configurati."""
-        available = {}
-        
+    def _local_endpoints(self):
+        """Coppie (backend, endpoint) da interrogare per la scoperta dei modelli locali"""
         # Controlla TUTTI gli endpoint per entrambi i backend
         all_endpoints = {
             "ollama": llm_config.local_endpoints.get("ollama", ["http://localhost:11434"]),
@@ -281,60 +1095,124 @@ class LLMService:
         current_backend = llm_config.local_backend
         if llm_config.local_endpoint not in all_endpoints[current_backend]:
             all_endpoints[current_backend].append(llm_config.local_endpoint)
+        return [(backend, endpoint) for backend, endpoints in all_endpoints.items() for endpoint in endpoints]
+    
+    def _probe_local_endpoint(self, backend, endpoint):
+        """Interroga un endpoint Ollama o LM Studio e restituisce i suoi modelli"""
+        available = {}
+        endpoint_id = endpoint.split('/')[-1].replace(':', '_')
+        if backend == "ollama":
+            response = self.clients.session(endpoint).get(f"{endpoint}/api/tags", timeout=LOCAL_PROBE_TIMEOUT)
+            response.raise_for_status()
+            for model in response.json().get("models", []):
+                model_name = model["name"]
+                # Crea un ID unico per ogni combinazione modello+endpoint
+                model_id = f"ollama_{model_name.replace(':', '_')}_{endpoint_id}"
+                description = f"Ollama: {model_name} su {endpoint}"
+                available[model_id] = self._local_model_config(model_name, description, endpoint)
+        else:
+            response = self.clients.session(endpoint).get(f"{endpoint}/v1/internal/model/all", timeout=LOCAL_PROBE_TIMEOUT)
+            response.raise_for_status()
+            for model in response.json().get("data", []):
+                model_name = model["modelId"]
+                model_id = f"lmstudio_{model_name.replace('/', '_').replace(':', '_')}_{endpoint_id}"
+                description = f"LM Studio: {model_name} su {endpoint}"
+                available[model_id] = self._local_model_config(model_name, description, endpoint)
+        return available
+    
+    @staticmethod
+    def _local_model_config(model_name, description, endpoint):
+        # Crea una configurazione dinamica per questo modello
+        return ModelConfig(
+            name=model_name,
+            provider=LLMProvider.LOCAL,
+            description=description,
+            max_tokens=4096,
+            temperature=0.7,
+            context_window=8192,
+            base_url=endpoint
+        )
+    
+    def refresh_local_models(self, force=False):
+        """Interroga in parallelo gli endpoint locali e aggiorna la cache dei modelli.
+
+        Gli endpoint che non rispondono restano esclusi per `LOCAL_ENDPOINT_COOLOFF`
+        secondi; `force=True` li interroga comunque.
+        """
+        targets = self._local_endpoints()
+        now = time.time()
+        with self._discovery_lock:
+            probe = [t for t in targets if force or self._unhealthy.get(t, 0) <= now]
         
-        # Controlla endpoints Ollama
-        for endpoint in all_endpoints["ollama"]:
-            try:
-                response = requests.get(f"{endpoint}/api/tags", timeout=5)
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    for model in models:
-                        model_name = model["name"]
-                        # Crea un ID unico per ogni combinazione modello+endpoint
-                        endpoint_id = endpoint.split('/')[-1].replace(':', '_')
-                        model_id = f"ollama_{model_name.replace(':', '_')}_{endpoint_id}"
-                        
-                        # Crea una configurazione dinamica per questo modello
-                        available[model_id] = ModelConfig(
-                            name=model_name,
-                            provider=LLMProvider.LOCAL,
-                            description=f"Ollama: {model_name} su {endpoint}",
-                            max_tokens=4096,
-                            temperature=0.7,
-                            context_window=8192,
-                            base_url=endpoint
-                        )
-            except Exception as e:
-                print(f"Errore interrogando endpoint Ollama {endpoint}: {e}")
-                continue
+        results = {}
+        if probe:
+            with ThreadPoolExecutor(max_workers=len(probe), thread_name_prefix='slideguru-discovery') as executor:
+                futures = {target: executor.submit(self._probe_local_endpoint, *target) for target in probe}
+                for target, future in futures.items():
+                    try:
+                        results[target] = future.result()
+                    except Exception as e:
+                        print(f"Errore interrogando endpoint {target[0]} {target[1]}: {e}")
+                        results[target] = None
+        
+        with self._discovery_lock:
+            for target, models in results.items():
+                if models is None:
+                    self._unhealthy[target] = time.time() + LOCAL_ENDPOINT_COOLOFF
+                    self._endpoint_models.pop(target, None)
+                else:
+                    self._unhealthy.pop(target, None)
+                    self._endpoint_models[target] = models
+            available = {}
+            for target in targets:
+                available.update(self._endpoint_models.get(target, {}))
+            self._local_models = available
+            self._local_models_key = tuple(targets)
+            self._local_models_at = time.time()
+            return dict(available)
+    
+    def _refresh_local_models_background(self):
+        with self._discovery_lock:
+            if self._discovery_running:
+                return
+            self._discovery_running = True
         
-        # Controlla endpoints LM Studio
-        for endpoint in all_endpoints["lmstudio"]:
+        def run():
             try:
-                response = requests.get(f"{endpoint}/v1/internal/model/all", timeout=5)
-                if response.status_code == 200:
-                    models = response.json().get("data", [])
-                    for model in models:
-                        model_name = model["modelId"]
-                        # Crea un ID unico per ogni combinazione modello+endpoint
-                        endpoint_id = endpoint.split('/')[-1].replace(':', '_')
-                        model_id = f"lmstudio_{model_name.replace('/', '_').replace(':', '_')}_{endpoint_id}"
-                        
-                        # Crea una configurazione dinamica per questo modello
-                        available[model_id] = ModelConfig(
-                            name=model_name,
-                            provider=LLMProvider.LOCAL,
-                            description=f"LM Studio: {model_name} su {endpoint}",
-                            max_tokens=4096,
-                            temperature=0.7,
-                            context_window=8192,
-                            base_url=endpoint
-                        )
-            except Exception as e:
-                print(f"Errore interrogando endpoint LM Studio {endpoint}: {e}")
-                continue
+                self.refresh_local_models()
+            finally:
+                with self._discovery_lock:
+                    self._discovery_running = False
         
-        return available
+        threading.Thread(target=run, name='slideguru-discovery-refresh', daemon=True).start()
+    
+    def available_local_models(self, refresh=False):
+        """Restituisce tutti i modelli locali disponibili su tutti gli endpoint configurati.
+
+        Serve l'ultimo elenco noto senza attendere la rete: se è più vecchio di
+        `LOCAL_DISCOVERY_TTL` lo aggiorna in background. L'interrogazione è
+        sincrona solo al primo uso, se cambia l'elenco degli endpoint o con `refresh=True`.
+        """
+        with self._discovery_lock:
+            known = self._local_models is not None and self._local_models_key == tuple(self._local_endpoints())
+            fresh = known and time.time() - self._local_models_at < LOCAL_DISCOVERY_TTL
+            cached = dict(self._local_models) if known else None
+        
+        if refresh or not known:
+            return self.refresh_local_models(force=refresh)
+        if not fresh:
+            self._refresh_local_models_background()
+        return cached
+    
+    def discovery_stats(self):
+        """Stato della scoperta dei modelli locali"""
+        with self._discovery_lock:
+            now = time.time()
+            return {
+                'models': len(self._local_models or {}),
+                'age_seconds': round(now - self._local_models_at, 1) if self._local_models is not None else None,
+                'unhealthy': [f"{backend} {endpoint}" for (backend, endpoint), until in self._unhealthy.items() if until > now],
+            }
 
 # Istanza globale del servizio LLM
 llm_service = LLMService()
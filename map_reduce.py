@@ -0,0 +1,99 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from extractor import DOCUMENT_SEPARATOR
+from token_budget import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Quota del context window lasciata libera per le imprecisioni della stima
+CONTEXT_SAFETY_MARGIN = 0.9
+
+# Separatori usati per dividere il testo, dal più significativo al meno significativo
+SPLIT_SEPARATORS = [DOCUMENT_SEPARATOR, '\n\n', '\n', '. ', ' ']
+
+# Passate di riassunto massime prima di troncare il testo ridotto
+MAX_REDUCE_ROUNDS = 3
+
+SUMMARY_PROMPT = (
+    "Questa è la parte {index} di {total} di un insieme di documenti da trasformare in una presentazione. "
+    "Riassumi i contenuti in italiano in al massimo {words} parole, conservando dati numerici, nomi, "
+    "conclusioni e la struttura degli argomenti. Rispondi solo con il riassunto.\n\n{text}"
+)
+
+def input_budget_chars(model_config, overhead_chars=0):
+    """Caratteri di input che entrano nel context window del modello, al netto della risposta"""
+    tokens = (model_config.context_window - model_config.max_tokens) * CONTEXT_SAFETY_MARGIN
+    return max(1000, int(tokens * CHARS_PER_TOKEN) - overhead_chars)
+
+def summary_words(total, target_chars=None):
+    """Lunghezza dei riassunti scelta perché la loro unione entri nel budget della passata finale"""
+    return max(100, int((target_chars or 6000 * total) / total / 6))
+
+def split_text(text, max_chars, separators=SPLIT_SEPARATORS):
+    """Divide il testo in parti di al più `max_chars` caratteri, tagliando sui separatori più significativi"""
+    if len(text) <= max_chars:
+        return [text]
+    for i, separator in enumerate(separators):
+        if separator in text:
+            break
+    else:
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    chunks = []
+    current = ''
+    for piece in text.split(separator):
+        if len(piece) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.extend(split_text(piece, max_chars, separators[i + 1:]))
+            continue
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            if current:
+                chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def summarize_chunks(chunks, generate, max_workers=4, target_chars=None, on_chunk=None):
+    """Riassume le parti in parallelo (al più `max_workers` chiamate contemporanee).
+
+    `generate(prompt)` restituisce il testo del modello; `on_chunk(done, total)`
+    viene chiamata a ogni parte completata. I riassunti mantengono l'ordine delle parti.
+    """
+    total = len(chunks)
+    words = summary_words(total, target_chars)
+
+    def summarize(index):
+        return generate(SUMMARY_PROMPT.format(index=index + 1, total=total, words=words, text=chunks[index]))
+
+    summaries = [None] * total
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total)), thread_name_prefix='slideguru-map') as executor:
+        futures = {executor.submit(summarize, i): i for i in range(total)}
+        for done, future in enumerate(as_completed(futures), 1):
+            summaries[futures[future]] = future.result()
+            if on_chunk:
+                on_chunk(done, total)
+    return summaries
+
+def reduce_text(text, budget_chars, generate, max_workers=4, on_chunk=None):
+    """Riduce `text` entro `budget_chars` con passate map-reduce di riassunti.
+
+    Restituisce (testo ridotto, numero di parti della prima passata, passate eseguite).
+    """
+    first_chunks = 0
+    rounds = 0
+    while len(text) > budget_chars and rounds < MAX_REDUCE_ROUNDS:
+        chunks = split_text(text, budget_chars)
+        first_chunks = first_chunks or len(chunks)
+        summaries = summarize_chunks(chunks, generate, max_workers, budget_chars, on_chunk)
+        text = '\n\n'.join(f"[Parte {i + 1}]\n{summary.strip()}" for i, summary in enumerate(summaries))
+        rounds += 1
+    if len(text) > budget_chars:
+        logger.error(f"Testo ancora oltre il budget dopo {rounds} passate: troncato a {budget_chars} caratteri")
+        text = text[:budget_chars]
+    return text, first_chunks, rounds
@@ -0,0 +1,204 @@
+import time
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Riduzione della frequenza dopo un rate limit e recupero a ogni chiamata riuscita
+BACKOFF_FACTOR = 0.5
+RECOVERY_STEP = 0.1
+MIN_RATE_FACTOR = 0.1
+
+# Pausa massima (s) senza Retry-After, raddoppiata a ogni rate limit consecutivo
+MAX_BACKOFF = 60.0
+
+# Nomi delle eccezioni SDK che indicano rate limit o sovraccarico del provider
+_RATE_LIMIT_ERRORS = ('RateLimitError', 'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'OverloadedError')
+_RATE_LIMIT_STATUS = (429, 503, 529)
+
+class RateLimitedError(Exception):
+    """Il provider ha risposto con un rate limit o è sovraccarico"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(value):
+    """Secondi indicati dall'header Retry-After (numero o data HTTP), oppure None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def rate_limit_info(error):
+    """(rate limit?, secondi di Retry-After) risalendo la catena di eccezioni"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, RateLimitedError):
+            return True, error.retry_after
+        response = getattr(error, 'response', None)
+        status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+        if status in _RATE_LIMIT_STATUS or type(error).__name__ in _RATE_LIMIT_ERRORS:
+            headers = getattr(response, 'headers', None) or {}
+            return True, parse_retry_after(headers.get('retry-after'))
+        error = error.__cause__ or error.__context__
+    return False, None
+
+class TokenBucket:
+    """Token bucket: al più `rate` richieste al secondo, con raffiche fino a `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Prenota un token e restituisce i secondi da attendere prima di usarlo"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+class RateLimiter:
+    """Limite di frequenza e di concorrenza per un endpoint, con backoff adattivo.
+
+    `requests_per_minute` (0 = illimitato) alimenta un token bucket;
+    `max_concurrency` (0 = illimitato) limita le chiamate contemporanee.
+    Dopo un rate limit la frequenza viene dimezzata e le nuove chiamate
+    attendono il Retry-After; ogni chiamata riuscita la riporta gradualmente
+    al valore configurato.
+    """
+
+    def __init__(self, name, requests_per_minute=0, max_concurrency=0):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.rate_factor = 1.0
+        self.blocked_until = 0.0
+        self.consecutive_limits = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.in_flight = 0
+        self._bucket = TokenBucket(requests_per_minute / 60.0) if requests_per_minute else None
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        """Attende il proprio turno; restituisce i secondi passati in coda"""
+        start = time.monotonic()
+        with self._lock:
+            pause = self.blocked_until - time.time()
+        if pause > 0:
+            time.sleep(pause)
+        if self._semaphore:
+            self._semaphore.acquire()
+        try:
+            if self._bucket:
+                delay = self._bucket.reserve()
+                if delay > 0:
+                    time.sleep(delay)
+            waited = time.monotonic() - start
+            with self._lock:
+                self.calls += 1
+                self.in_flight += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                yield waited
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        finally:
+            if self._semaphore:
+                self._semaphore.release()
+
+    def on_success(self):
+        with self._lock:
+            self.consecutive_limits = 0
+            if self.rate_factor < 1.0:
+                self._set_rate_factor(min(1.0, self.rate_factor + RECOVERY_STEP))
+
+    def on_rate_limited(self, retry_after=None):
+        """Registra un rate limit: pausa per Retry-After (o backoff esponenziale) e frequenza ridotta"""
+        with self._lock:
+            self.rate_limited += 1
+            self.consecutive_limits += 1
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF, 2 ** (self.consecutive_limits - 1))
+            self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+            self._set_rate_factor(max(MIN_RATE_FACTOR, self.rate_factor * BACKOFF_FACTOR))
+            return retry_after
+
+    def _set_rate_factor(self, factor):
+        self.rate_factor = factor
+        if self._bucket:
+            self._bucket.rate = self.requests_per_minute / 60.0 * factor
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests_per_minute': self.requests_per_minute,
+                'effective_rpm': round(self.requests_per_minute * self.rate_factor, 1) if self.requests_per_minute else None,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'rate_limited': self.rate_limited,
+                'avg_wait_seconds': round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+                'max_wait_seconds': round(self.max_wait, 3),
+                'blocked_for': round(max(0.0, self.blocked_until - time.time()), 1),
+            }
+
+class CallTimings:
+    """Tempi accumulati delle chiamate ai modelli di una generazione: attesa in coda, generazione e token in input"""
+
+    def __init__(self):
+        self.calls = 0
+        self.queue_wait = 0.0
+        self.generation = 0.0
+        self.rate_limited = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+        self.first_token = 0.0
+        self.streams = 0
+        self._lock = threading.Lock()
+
+    def add(self, queue_wait=0.0, generation=0.0, rate_limited=0, calls=0,
+            input_tokens=0, cached_tokens=0, cache_write_tokens=0, first_token=None):
+        with self._lock:
+            self.calls += calls
+            self.queue_wait += queue_wait
+            self.generation += generation
+            self.rate_limited += rate_limited
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.cache_write_tokens += cache_write_tokens
+            if first_token is not None:
+                self.first_token += first_token
+                self.streams += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'queue_wait_seconds': round(self.queue_wait, 3),
+                'generation_seconds': round(self.generation, 3),
+                'rate_limited': self.rate_limited,
+                'input_tokens': self.input_tokens,
+                'cached_tokens': self.cached_tokens,
+                'cache_write_tokens': self.cache_write_tokens,
+                'avg_first_token_seconds': round(self.first_token / self.streams, 3) if self.streams else None,
+            }
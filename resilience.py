@@ -0,0 +1,80 @@
+import time
+import threading
+from collections import deque
+
+# Stati del circuit breaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """Circuit breaker per un endpoint.
+
+    Dopo `failure_threshold` errori consecutivi il circuito si apre e le
+    chiamate vengono saltate per `reset_timeout` secondi; poi una sola chiamata
+    di prova (half-open) decide se richiuderlo o riaprirlo.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True se una chiamata può partire (nello stato half-open ne passa una sola)"""
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.time() - self.opened_at)), 1)
+            return {'state': self.state, 'failures': self.failures, 'retry_in': retry_in}
+
+class LatencyWindow:
+    """Ultime `size` latenze di un modello, per calcolarne i percentili"""
+
+    def __init__(self, size=50):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p, min_samples=5):
+        """Percentile `p` (0-100) delle latenze, oppure None con meno di `min_samples` campioni"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
@@ -0,0 +1,217 @@
+import re
+import json
+from itertools import islice
+
+# Schema delle slide richiesto ai provider con output strutturato (JSON mode / response schema)
+SLIDES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "slides": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "content": {"type": "string"}},
+                "required": ["title", "content"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["slides"],
+    "additionalProperties": False,
+}
+
+# Lunghezza massima del titolo di una slide
+MAX_TITLE_CHARS = 200
+
+# Chiavi accettate per titolo e contenuto, nell'ordine di preferenza
+TITLE_KEYS = ('title', 'titolo', 'heading', 'name')
+CONTENT_KEYS = ('content', 'contenuto', 'bullets', 'points', 'punti', 'body', 'text', 'testo')
+
+_CODE_FENCE = re.compile(r"^\s*```[\w-]*\s*$", re.MULTILINE)
+_JSON_START = re.compile(r"[\[{]")
+
+# Parentesi di apertura da cui tentare al più il recupero del JSON
+MAX_JSON_STARTS = 20
+
+class IncrementalSlideParser:
+    """Estrae gli oggetti slide da una risposta JSON che arriva a frammenti.
+
+    Cerca l'inizio dell'array ('[') e restituisce ogni oggetto di primo livello
+    appena la sua parentesi graffa si chiude, senza attendere la fine della
+    risposta. Il testo completo resta disponibile in `text` per il parsing
+    di ripiego.
+    """
+
+    def __init__(self):
+        self.slides = []
+        self._parts = []
+        self._current = []
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self):
+        return ''.join(self._parts)
+
+    def feed(self, fragment):
+        """Aggiunge un frammento di testo e restituisce le slide completate"""
+        self._parts.append(fragment)
+        completed = []
+        for ch in fragment:
+            if not self._started:
+                self._started = ch == '['
+                continue
+            if self._depth:
+                self._current.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._depth > 0
+            elif ch == '{':
+                if not self._depth:
+                    self._current = ['{']
+                self._depth += 1
+            elif ch == '}' and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    slide = self._decode(''.join(self._current))
+                    if slide is not None:
+                        self.slides.append(slide)
+                        completed.append(slide)
+        return completed
+
+    @staticmethod
+    def _decode(candidate):
+        try:
+            value = repair_json(candidate)
+        except ValueError:
+            return None
+        return value if isinstance(value, dict) else None
+
+def _strip_trailing_comma(out):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ',':
+        del out[i:]
+
+def _close(out, stack):
+    """Testo JSON chiuso: virgole e separatori pendenti rimossi, parentesi aperte chiuse"""
+    text = ''.join(out).rstrip().rstrip(',:').rstrip()
+    return text + ''.join(reversed(stack))
+
+def _repair_from(text):
+    """Candidati JSON riparati per il valore che inizia all'inizio di `text`"""
+    out = []
+    stack = []
+    in_string = escape = False
+    safe = None  # (caratteri, parentesi aperte) dopo l'ultimo oggetto o array completo
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == '\n':
+                ch = '\\n'
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '[{':
+            stack.append(']' if ch == '[' else '}')
+        elif ch in ']}':
+            _strip_trailing_comma(out)
+            ch = stack.pop()  # la parentesi attesa, anche se il modello ne ha usata un'altra
+            if not stack:
+                out.append(ch)
+                break
+            safe = (len(out) + 1, list(stack))
+        out.append(ch)
+    
+    candidates = [''.join(out)]
+    if stack or in_string:
+        # Risposta troncata: chiusura diretta, altrimenti dall'ultimo elemento completo
+        candidates = [_close(out + ['"'] if in_string else out, stack)]
+        if safe:
+            candidates.append(_close(out[:safe[0]], safe[1]))
+    return candidates
+
+def repair_json(text):
+    """Estrae e ripara il primo valore JSON di una risposta.
+
+    Ignora code fence e testo prima e dopo il JSON, rimuove le virgole finali,
+    converte gli a capo dentro le stringhe e chiude array e oggetti troncati
+    (al più tornando all'ultimo elemento completo). Se dalla prima parentesi
+    non si ottiene JSON valido (es. "[formato JSON]" nel testo introduttivo)
+    riprova dalle successive, fino a `MAX_JSON_STARTS`. Solleva ValueError se
+    non c'è un valore JSON recuperabile.
+    """
+    text = _CODE_FENCE.sub('', text)
+    starts = [match.start() for match in islice(_JSON_START.finditer(text), MAX_JSON_STARTS)]
+    if not starts:
+        raise ValueError("Nessun JSON nella risposta")
+    for start in starts:
+        for candidate in _repair_from(text[start:]):
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+    raise ValueError("JSON non recuperabile")
+
+def _as_text(value, separator):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '\n'.join(part for part in (_as_text(item, ' ') for item in value) if part)
+    if isinstance(value, dict):
+        return separator.join(part for part in (_as_text(item, ' ') for item in value.values()) if part)
+    return str(value).strip()
+
+def _first_key(item, keys):
+    for key in keys:
+        if item.get(key) not in (None, ''):
+            return item[key]
+    return None
+
+def validate_slides(value):
+    """Normalizza un valore JSON in una lista di slide {'title': str, 'content': str}.
+
+    Accetta una lista di slide, un oggetto con la lista (es. {"slides": [...]}),
+    chiavi alternative per titolo e contenuto e contenuti come elenco di punti.
+    Le slide vuote vengono scartate.
+    """
+    if isinstance(value, dict):
+        items = value.get('slides')
+        if not isinstance(items, list):
+            lists = [item for item in value.values() if isinstance(item, list)]
+            items = lists[0] if lists else [value]
+    elif isinstance(value, list):
+        items = value
+    else:
+        items = [value]
+    
+    slides = []
+    for item in items:
+        if isinstance(item, dict):
+            title, content = _first_key(item, TITLE_KEYS), _first_key(item, CONTENT_KEYS)
+        else:
+            title, content = None, item
+        title = ' '.join(_as_text(title, ' ').split())[:MAX_TITLE_CHARS]
+        content = _as_text(content, '\n')
+        if title or content:
+            slides.append({'title': title or 'Slide', 'content': content})
+    return slides
+
+def parse_slides(text):
+    """Slide validate dalla risposta del modello; solleva ValueError se non contiene JSON recuperabile"""
+    return validate_slides(repair_json(text))
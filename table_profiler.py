@@ -0,0 +1,197 @@
+import math
+import warnings
+import numpy as np
+
+# Numero minimo di righe perché un foglio venga riassunto invece che riportato per intero
+PROFILE_MIN_ROWS = 30
+
+# Quota minima di valori numerici perché una colonna sia considerata numerica
+NUMERIC_RATIO = 0.8
+
+# Elementi mostrati nelle classifiche top-N e righe di esempio nel digest
+TOP_N = 5
+SAMPLE_ROWS = 3
+
+# Punti massimi di un grafico generato dal profilo
+CHART_MAX_POINTS = 12
+
+def _to_float(value):
+    """Converte una cella testuale in numero (anche formato italiano 1.234,56), altrimenti NaN.
+
+    Valori non finiti come "inf", "nan" o "Infinity" restano testo (es. nomi di prodotto).
+    """
+    value = value.strip()
+    if not value:
+        return math.nan
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+        if ',' in value:
+            try:
+                number = float(value.replace('.', '').replace(',', '.'))
+            except ValueError:
+                pass
+    return number if math.isfinite(number) else math.nan
+
+def _format_number(value):
+    if abs(value) >= 1e9:
+        return f"{value / 1e9:.2f} mld"
+    if abs(value) >= 1e6:
+        return f"{value / 1e6:.2f} mln"
+    if float(value).is_integer():
+        return f"{int(value):,}".replace(',', '.')
+    return f"{value:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def _is_header(row):
+    """Una riga è un'intestazione se nessuna delle sue celle è numerica"""
+    return all(math.isnan(_to_float(cell)) for cell in row if cell.strip())
+
+def profile_table(sheet_name, rows):
+    """Calcola aggregati colonnari (totali, trend, top-N, statistiche) di un foglio.
+
+    `rows` è una lista di righe (liste di stringhe). Restituisce un dizionario
+    serializzabile in JSON, oppure None se il foglio non ha colonne numeriche.
+    """
+    if not rows:
+        return None
+    header = rows[0] if _is_header(rows[0]) else None
+    body = rows[1:] if header else rows
+    if not body:
+        return None
+    width = max(len(row) for row in body)
+    names = [(header[i].strip() if header and i < len(header) and header[i].strip() else f"Colonna {i + 1}")
+             for i in range(width)]
+
+    # Matrice di celle (righe x colonne) e sua versione numerica con NaN per i non numeri:
+    # la conversione delle celle è una sola passata in Python, gli aggregati sono calcolati con NumPy
+    cells = np.array([row + [''] * (width - len(row)) for row in body], dtype=object)
+    numeric = np.fromiter((_to_float(cell) for cell in cells.flat), dtype=float, count=cells.size).reshape(cells.shape)
+    filled = np.fromiter((bool(cell.strip()) for cell in cells.flat), dtype=bool, count=cells.size).reshape(cells.shape)
+
+    filled_count = filled.sum(axis=0)
+    numeric_count = (~np.isnan(numeric)).sum(axis=0)
+    is_numeric = (numeric_count > 0) & (numeric_count >= NUMERIC_RATIO * np.maximum(filled_count, 1))
+    if not is_numeric.any():
+        return None
+
+    with warnings.catch_warnings():
+        # Le medie di gruppi senza valori numerici producono NaN senza warning
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return _build_profile(sheet_name, header, body, names, cells, numeric, filled, filled_count, is_numeric)
+
+def _build_profile(sheet_name, header, body, names, cells, numeric, filled, filled_count, is_numeric):
+    width = len(names)
+    columns = []
+    third = max(1, len(body) // 3)
+    for i, name in enumerate(names):
+        column = {'name': name, 'count': int(filled_count[i]), 'missing': int(len(body) - filled_count[i])}
+        if is_numeric[i]:
+            values = numeric[:, i]
+            first, last = np.nanmean(values[:third]), np.nanmean(values[-third:])
+            column.update({
+                'type': 'numeric',
+                'sum': float(np.nansum(values)),
+                'mean': float(np.nanmean(values)),
+                'min': float(np.nanmin(values)),
+                'max': float(np.nanmax(values)),
+                'std': float(np.nanstd(values)),
+                # Variazione percentuale della media dell'ultimo terzo rispetto al primo
+                'trend': float((last - first) / abs(first) * 100) if first and not np.isnan(first) and not np.isnan(last) else None,
+            })
+        else:
+            labels, counts = np.unique(cells[filled[:, i], i].astype(str), return_counts=True)
+            order = np.argsort(-counts)[:TOP_N]
+            column.update({
+                'type': 'text',
+                'distinct': int(len(labels)),
+                'top_values': [[str(labels[j]), int(counts[j])] for j in order],
+            })
+        columns.append(column)
+
+    profile = {
+        'sheet': sheet_name,
+        'rows': len(body),
+        'columns': columns,
+        'sample': [list(row) for row in ([header] if header else []) + body[:SAMPLE_ROWS]],
+        'top': None,
+        'series': None,
+    }
+
+    # Colonna numerica principale (totale assoluto maggiore) e colonna di etichette
+    numeric_idx = np.flatnonzero(is_numeric)
+    main = int(numeric_idx[np.argmax([abs(columns[i]['sum']) for i in numeric_idx])])
+    label_candidates = [i for i in range(width) if not is_numeric[i] and 1 < columns[i]['distinct'] < len(body)]
+    if label_candidates:
+        # Somma per etichetta (group-by vettoriale) e classifica top-N
+        label_idx = label_candidates[0]
+        labels, inverse = np.unique(cells[:, label_idx].astype(str), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.nan_to_num(numeric[:, main]), minlength=len(labels))
+        order = np.argsort(-totals)
+        order = order[labels[order] != '']
+        profile['top'] = {
+            'label': names[label_idx],
+            'value': names[main],
+            'items': [[str(labels[j]), float(totals[j])] for j in order[:max(TOP_N, CHART_MAX_POINTS)]],
+        }
+
+    # Andamento per gruppi di righe consecutive delle prime colonne numeriche
+    buckets = np.array_split(np.arange(len(body)), min(CHART_MAX_POINTS, len(body)))
+    profile['series'] = {
+        'categories': [f"{b[0] + 1}-{b[-1] + 1}" if len(b) > 1 else str(b[0] + 1) for b in buckets],
+        'values': {names[i]: [float(np.nan_to_num(np.nanmean(numeric[b, i]))) for b in buckets] for i in numeric_idx[:3]},
+    }
+    return profile
+
+def format_profile(profile, truncated=False):
+    """Digest testuale compatto del profilo, da inserire nel prompt al posto delle righe"""
+    lines = [f"\n--- {profile['sheet']} ({profile['rows']} righe{', troncato' if truncated else ''}, "
+             f"{len(profile['columns'])} colonne) ---"]
+    for row in profile['sample']:
+        lines.append('\t'.join(row))
+    lines.append("Statistiche per colonna:")
+    for column in profile['columns']:
+        if column['type'] == 'numeric':
+            trend = f", trend {column['trend']:+.1f}%" if column['trend'] is not None else ""
+            lines.append(f"- {column['name']}: totale {_format_number(column['sum'])}, media {_format_number(column['mean'])}, "
+                         f"min {_format_number(column['min'])}, max {_format_number(column['max'])}{trend}")
+        else:
+            top = ', '.join(f"{label} ({count})" for label, count in column['top_values'][:3])
+            lines.append(f"- {column['name']}: {column['distinct']} valori distinti, più frequenti: {top}")
+    if profile['top']:
+        top = profile['top']
+        shown = top['items'][:TOP_N]
+        items = ', '.join(f"{label} ({_format_number(value)})" for label, value in shown)
+        lines.append(f"Top {len(shown)} {top['label']} per {top['value']}: {items}")
+    return '\n'.join(lines) + '\n'
+
+def charts_from_documents(documents):
+    """Specifiche di grafico per tutti i fogli profilati dei documenti estratti"""
+    charts = []
+    for document in documents:
+        for chunk in document.chunks:
+            if chunk.kind == 'table' and chunk.data:
+                chart = chart_from_profile(chunk.data, chunk.source)
+                if chart:
+                    charts.append(chart)
+    return charts
+
+def chart_from_profile(profile, source=None):
+    """Specifica di grafico (titolo, categorie, serie) ricavata dagli aggregati del profilo"""
+    title = f"{profile['sheet']}" + (f" ({source})" if source else "")
+    if profile['top'] and len(profile['top']['items']) > 1:
+        items = profile['top']['items'][:CHART_MAX_POINTS]
+        return {
+            'title': f"{title}: {profile['top']['value']} per {profile['top']['label']}",
+            'type': 'bar',
+            'categories': [label for label, _ in items],
+            'series': {profile['top']['value']: [value for _, value in items]},
+        }
+    if profile['series'] and len(profile['series']['categories']) > 1:
+        return {
+            'title': f"{title}: andamento per righe",
+            'type': 'line',
+            'categories': profile['series']['categories'],
+            'series': profile['series']['values'],
+        }
+    return None
@@ -0,0 +1,108 @@
+import io
+import os
+import logging
+import threading
+from pptx import Presentation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_DIR = os.getenv('SLIDEGURU_TEMPLATE_DIR', 'static')
+DEFAULT_TEMPLATE_NAME = 'template'
+
+# Layout cercati per nome nel template, con l'indice di ripiego del template standard di PowerPoint
+CONTENT_LAYOUT = ('Title and Content', 1)
+TITLE_ONLY_LAYOUT = ('Title Only', 5)
+
+class TemplateNotFoundError(Exception):
+    """Il template richiesto non esiste nella cartella dei template"""
+
+class PresentationTemplate:
+    """Un template letto una volta: contenuto del file in memoria e indici dei layout usati"""
+
+    def __init__(self, path, data, mtime_ns):
+        self.path = path
+        self.data = data
+        self.mtime_ns = mtime_ns
+        prs = Presentation(io.BytesIO(data))
+        names = [layout.name for layout in prs.slide_layouts]
+        self.layouts = {
+            'content': self._find(names, *CONTENT_LAYOUT),
+            'title_only': self._find(names, *TITLE_ONLY_LAYOUT),
+        }
+
+    @staticmethod
+    def _find(names, name, fallback):
+        if name in names:
+            return names.index(name)
+        return fallback if fallback < len(names) else min(1, len(names) - 1)
+
+    def new_presentation(self):
+        """Copia nuova e indipendente del template, letta dai byte in memoria senza accedere al disco"""
+        return Presentation(io.BytesIO(self.data))
+
+class TemplateCache:
+    """Template PPTX con nome (nome del file senza estensione) letti una sola volta.
+
+    Ogni `get` controlla solo la data di modifica del file: se è cambiata il
+    template viene riletto, altrimenti si riusano byte e layout già pronti.
+    """
+
+    def __init__(self, template_dir=DEFAULT_TEMPLATE_DIR, default_path=None):
+        self.template_dir = template_dir
+        self.default_path = default_path or os.path.join(template_dir, f"{DEFAULT_TEMPLATE_NAME}.pptx")
+        self.hits = 0
+        self.loads = 0
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def names(self):
+        """Nomi dei template disponibili, quello predefinito per primo"""
+        names = set()
+        if os.path.isdir(self.template_dir):
+            names.update(os.path.splitext(entry.name)[0] for entry in os.scandir(self.template_dir)
+                         if entry.is_file() and entry.name.lower().endswith('.pptx'))
+        names.discard(DEFAULT_TEMPLATE_NAME)
+        return [DEFAULT_TEMPLATE_NAME] + sorted(names)
+
+    def path(self, name=None):
+        if not name or name == DEFAULT_TEMPLATE_NAME:
+            return self.default_path
+        # Solo file della cartella dei template, senza percorsi
+        if os.path.basename(name) != name or name.startswith('.'):
+            raise TemplateNotFoundError(f"Template non valido: {name}")
+        return os.path.join(self.template_dir, f"{name}.pptx")
+
+    def get(self, name=None):
+        """Template `name` (default: quello predefinito), riletto solo se il file è cambiato"""
+        path = self.path(name)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            raise TemplateNotFoundError(f"Template non trovato: {name or DEFAULT_TEMPLATE_NAME}")
+        with self._lock:
+            template = self._templates.get(path)
+            if template is not None and template.mtime_ns == mtime_ns:
+                self.hits += 1
+                return template
+        with open(path, 'rb') as f:
+            template = PresentationTemplate(path, f.read(), mtime_ns)
+        with self._lock:
+            self._templates[path] = template
+            self.loads += 1
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'templates': len(self._templates),
+                'hits': self.hits,
+                'loads': self.loads,
+                'bytes': sum(len(t.data) for t in self._templates.values()),
+            }
+
+# Istanza globale della cache dei template
+template_cache = TemplateCache()
@@ -183,6 +183,922 @@ def test_single_active_model():
         print(f"❌ Errore test singolo modello: {e}")
         return False
 
+def test_extraction_cache():
+    """Testa la cache di estrazione indirizzata per contenuto"""
+    print("🧪 Test cache di estrazione...")
+    try:
+        from extraction_cache import ExtractionCache
+        
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = ExtractionCache(cache_dir, max_bytes=200)
+            
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
+                f.write("contenuto di prova")
+                temp_file = f.name
+            
+            key = cache.make_key(temp_file, 1)
+            assert cache.get(key) is None, "Cache non vuota"
+            cache.put(key, {"text": "contenuto di prova"})
+            assert cache.get(key) == {"text": "contenuto di prova"}, "Valore in cache errato"
+            
+            # Stesso contenuto, stessa chiave; versione diversa, chiave diversa
+            assert cache.make_key(temp_file, 1) == key, "Chiave non deterministica"
+            assert cache.make_key(temp_file, 2) != key, "La versione non invalida la chiave"
+            
+            # Eviction LRU oltre la dimensione massima
+            for i in range(10):
+                cache.put(f"voce{i}", {"text": "x" * 50})
+            stats = cache.stats()
+            assert stats['size_bytes'] <= 200, "Dimensione massima superata"
+            assert stats['evictions'] > 0, "Nessuna eviction eseguita"
+            assert stats['hits'] == 1 and stats['misses'] == 1, "Contatori hit/miss errati"
+            
+            # L'indice viene ricostruito da disco
+            assert ExtractionCache(cache_dir, max_bytes=200).stats()['entries'] == stats['entries'], "Cache non persistente"
+            
+            os.unlink(temp_file)
+            print(f"✅ Cache di estrazione funzionante ({stats['entries']} voci, {stats['evictions']} eviction)")
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        
+        return True
+    except Exception as e:
+        print(f"❌ Errore test cache di estrazione: {e}")
+        return False
+
+def test_llm_response_cache():
+    """Testa la cache delle risposte LLM (memoria, disco, bypass)"""
+    print("🧪 Test cache risposte LLM...")
+    try:
+        import llm_service as llm_service_module
+        from llm_cache import LLMResponseCache
+        from config import ModelConfig, LLMProvider, llm_config
+        
+        cache_dir = tempfile.mkdtemp()
+        original_cache = llm_service_module.llm_cache
+        try:
+            cache = LLMResponseCache(cache_dir, memory_entries=2)
+            llm_service_module.llm_cache = cache
+            service = llm_service_module.LLMService()
+            model = ModelConfig("modello-test", LLMProvider.LOCAL, "Modello test")
+            calls = []
+            service.resolve_model = lambda model_id=None: model
+            service._generate_local = lambda system_prompt, prompt, model_config, schema=None: calls.append(prompt) or '[{"title": "A", "content": "B"}]'
+            
+            first = service.generate_content("stesso testo")
+            assert service.generate_content("stesso testo") == first, "Risposta in cache diversa"
+            assert len(calls) == 1, "Il provider è stato richiamato per una richiesta identica"
+            service.generate_content("stesso testo", use_cache=False)
+            assert len(calls) == 2, "Il bypass non ha richiamato il provider"
+            
+            # Temperatura diversa, chiave diversa
+            model.temperature = 0.1
+            service.generate_content("stesso testo")
+            assert len(calls) == 3, "La temperatura non fa parte della chiave"
+            
+            # Il livello su disco sopravvive al riavvio; le voci scadute vengono ignorate
+            key = cache.make_key(model, llm_config.get_system_prompt(), "stesso testo")
+            assert LLMResponseCache(cache_dir).get(key) is not None, "Cache su disco non persistente"
+            assert LLMResponseCache(cache_dir, ttl=-1).get(key) is None, "TTL non rispettato"
+            
+            stats = cache.stats()
+            assert stats['memory_hits'] == 1 and stats['bypassed'] == 1, f"Statistiche errate: {stats}"
+            print(f"✅ Cache risposte LLM funzionante (hit rate {stats['hit_rate']})")
+        finally:
+            llm_service_module.llm_cache = original_cache
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        
+        return True
+    except Exception as e:
+        print(f"❌ Errore test cache risposte LLM: {e}")
+        return False
+
+def test_client_registry():
+    """Testa il riuso di sessioni HTTP e client SDK"""
+    print("🧪 Test registro dei client...")
+    try:
+        from llm_service import ClientRegistry
+        
+        registry = ClientRegistry(pool_maxsize=3)
+        session = registry.session("http://localhost:11434")
+        assert registry.session("http://localhost:11434/api/tags") is session, "Sessione non riutilizzata"
+        assert registry.session("http://localhost:1234") is not session, "Endpoint diversi condividono la sessione"
+        
+        created = []
+        factory = lambda: created.append(1) or object()
+        client = registry.sdk("openai", "chiave-1", factory)
+        assert registry.sdk("openai", "chiave-1", factory) is client and len(created) == 1, "Client SDK non riutilizzato"
+        
+        # Cambio chiave: il vecchio client viene scartato
+        registry.retain({"openai": "chiave-2"})
+        assert registry.sdk("openai", "chiave-2", factory) is not client, "Client con chiave vecchia riutilizzato"
+        assert registry.stats()['sdk_clients'] == 1, "Client obsoleti non rimossi"
+        registry.close()
+        
+        print("✅ Registro dei client funzionante")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test registro dei client: {e}")
+        return False
+
+def test_local_model_discovery():
+    """Testa la scoperta concorrente e in cache dei modelli locali"""
+    print("🧪 Test scoperta modelli locali...")
+    try:
+        import time
+        from llm_service import LLMService
+        
+        service = LLMService()
+        probes = []
+        
+        def fake_probe(backend, endpoint):
+            probes.append(backend)
+            time.sleep(0.3)
+            if backend == "lmstudio":
+                raise ConnectionError("endpoint non raggiungibile")
+            return {f"ollama_test_{backend}": service._local_model_config("test", "Ollama: test", endpoint)}
+        
+        service._probe_local_endpoint = fake_probe
+        start = time.perf_counter()
+        models = service.available_local_models()
+        elapsed = time.perf_counter() - start
+        assert list(models) == ["ollama_test_ollama"], f"Modelli errati: {models}"
+        assert elapsed < 0.55, f"Sonde non concorrenti ({elapsed:.2f}s)"
+        
+        # Elenco servito dalla cache, senza nuove sonde
+        start = time.perf_counter()
+        assert service.available_local_models() == models, "Cache non utilizzata"
+        assert time.perf_counter() - start < 0.05 and len(probes) == 2, "Endpoint interrogati di nuovo"
+        
+        # L'endpoint non raggiungibile resta escluso durante il cool-off
+        service.refresh_local_models()
+        assert probes.count("lmstudio") == 1, "Endpoint non raggiungibile interrogato durante il cool-off"
+        assert service.discovery_stats()['unhealthy'], "Endpoint non segnato come non raggiungibile"
+        
+        # Un modello sconosciuto non forza le sonde: al più una per cool-off, senza gli endpoint esclusi
+        for _ in range(3):
+            try:
+                service.resolve_model("lmstudio_sconosciuto")
+                raise AssertionError("Modello sconosciuto risolto")
+            except ValueError:
+                pass
+        assert probes.count("lmstudio") == 1 and probes.count("ollama") == 3, f"Sonde ripetute: {probes}"
+        
+        print(f"✅ Scoperta modelli locali funzionante ({elapsed:.2f}s per due endpoint)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test scoperta modelli locali: {e}")
+        return False
+
+def test_local_warmup():
+    """Testa preriscaldamento, keep-alive e heartbeat dei modelli locali"""
+    print("🧪 Test preriscaldamento modelli locali...")
+    try:
+        import time
+        from llm_service import LLMService, OLLAMA_KEEP_ALIVE
+        
+        service = LLMService()
+        model = service._local_model_config("test", "Ollama: test", "http://ollama.test:11434")
+        requests_sent = []
+        
+        class FakeResponse:
+            status_code = 200
+            def raise_for_status(self):
+                pass
+            def json(self):
+                return {"response": "testo"}
+        
+        class FakeSession:
+            def post(self, url, json=None, **kwargs):
+                requests_sent.append(json)
+                return FakeResponse()
+        
+        service.clients.session = lambda endpoint: FakeSession()
+        service.resolve_model = lambda model_id=None: model
+        
+        result = service.warm_up()
+        assert result['status'] == 'warm', f"Preriscaldamento fallito: {result}"
+        assert requests_sent[0] == {"model": "test", "keep_alive": OLLAMA_KEEP_ALIVE}, "Richiesta di caricamento errata"
+        
+        service._generate_local("system", "prompt", model)
+        assert requests_sent[-1]["keep_alive"] == OLLAMA_KEEP_ALIVE, "keep_alive non inviato con le richieste"
+        
+        # Il heartbeat riscalda il modello solo dopo un periodo di inattività
+        service._local_activity.clear()
+        service.start_heartbeat(0.1)
+        time.sleep(0.35)
+        service.stop_heartbeat()
+        heartbeats = len(requests_sent) - 2
+        assert 1 <= heartbeats <= 3, f"Heartbeat errato ({heartbeats} richieste)"
+        assert service.warmup_stats()['models'], "Esito del preriscaldamento non registrato"
+        
+        print(f"✅ Preriscaldamento modelli locali funzionante ({heartbeats} heartbeat)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test preriscaldamento modelli locali: {e}")
+        return False
+
+def test_map_reduce():
+    """Testa la riduzione map-reduce dei testi più grandi del context window"""
+    print("🧪 Test generazione map-reduce...")
+    try:
+        import time
+        import threading
+        from map_reduce import split_text, reduce_text
+        
+        text = "\n\n".join(f"Paragrafo {i}: " + "parola " * 50 for i in range(40))
+        chunks = split_text(text, 1000)
+        assert all(len(chunk) <= 1000 for chunk in chunks), "Parte oltre il limite"
+        assert "".join(chunks).replace("\n", "") == text.replace("\n", ""), "Testo perso nella divisione"
+        
+        active = []
+        peak = []
+        lock = threading.Lock()
+        
+        def fake_generate(prompt):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            return "Riassunto breve."
+        
+        progress = []
+        reduced, parts, rounds = reduce_text(text, 1000, fake_generate, max_workers=3,
+                                             on_chunk=lambda done, total: progress.append((done, total)))
+        assert len(reduced) <= 1000 and rounds == 1, f"Riduzione errata ({len(reduced)} caratteri, {rounds} passate)"
+        assert parts == len(split_text(text, 1000)) and progress[-1] == (parts, parts), "Avanzamento errato"
+        assert max(peak) <= 3, "Parallelismo non limitato"
+        assert reduced.startswith("[Parte 1]"), "Ordine dei riassunti non preservato"
+        
+        print(f"✅ Generazione map-reduce funzionante ({parts} parti, parallelismo massimo {max(peak)})")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test map-reduce: {e}")
+        return False
+
+def test_token_budget():
+    """Testa stima dei token, preventivo di costo e riduzione al budget"""
+    print("🧪 Test budget di token...")
+    try:
+        from config import ModelConfig, LLMProvider
+        from token_budget import estimate_tokens, estimate_call, parallel_estimates, sequential_estimates, trim_to_tokens, record_latency
+        from app import app
+        
+        text = "Il fatturato del 2023 è cresciuto del 12,5% rispetto al 2022.\n\n" * 200
+        tokens = estimate_tokens(text)
+        assert len(text) / 6 < tokens < len(text) / 2, f"Stima dei token non plausibile: {tokens}"
+        
+        model = ModelConfig("modello-test", LLMProvider.OPENAI, "Modello test", 1000, 0.7, 4000, 0.01)
+        estimate = estimate_call(model, tokens)
+        assert not estimate['fits'] and estimate['overflow_tokens'] == tokens - 3000, "Overflow non rilevato"
+        assert estimate['cost_usd'] == round((tokens + 1000) / 1000 * 0.01, 6), "Costo stimato errato"
+        
+        # Due ondate di map in parallelo più la chiamata finale
+        total = sequential_estimates([parallel_estimates([estimate_call(model, 100)] * 4, 2), estimate_call(model, 100)])
+        assert total['calls'] == 5 and total['latency_seconds'] > estimate_call(model, 100)['latency_seconds'] * 2, "Latenza complessiva errata"
+        
+        # Le latenze osservate correggono la stima
+        before = estimate_call(model, 100, 100)['latency_seconds']
+        record_latency(model, 100, 100, before * 2)
+        assert estimate_call(model, 100, 100)['latency_seconds'] > before * 1.5, "Latenze osservate ignorate"
+        
+        trimmed = trim_to_tokens(text, 500)
+        assert estimate_tokens(trimmed) <= 500 and text.startswith(trimmed[:100]), "Riduzione al budget errata"
+        
+        with app.test_client() as client:
+            response = client.post('/api/estimate', json={"text": text})
+            assert response.status_code == 200 and response.get_json()['estimate']['input_tokens'] > tokens, "Preventivo API errato"
+        
+        print(f"✅ Budget di token funzionante ({tokens} token stimati, {estimate['cost_usd']} USD)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test budget di token: {e}")
+        return False
+
+def test_outline_generation():
+    """Testa la generazione a scaletta con slide espanse in parallelo"""
+    print("🧪 Test generazione a scaletta...")
+    try:
+        import time
+        import threading
+        import app as app_module
+        
+        titles = [f"Titolo {i}" for i in range(8)]
+        active = []
+        peak = []
+        lock = threading.Lock()
+        
+        contexts = set()
+        
+        def fake_generate_content(prompt, model_id=None, use_cache=True, timings=None, context=None):
+            if "scaletta di una presentazione" in prompt:
+                return "```json\n" + json.dumps(titles) + "\n```"
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            contexts.add(context)
+            index = int(prompt.split("Scrivi il contenuto della slide ")[1].split()[0]) - 1
+            time.sleep(0.01 * (8 - index))  # le ultime slide terminano per prime
+            with lock:
+                active.pop()
+            return f"- Punto della slide {index + 1}"
+        
+        original = app_module.llm_service.generate_content
+        app_module.llm_service.generate_content = fake_generate_content
+        app_module.app.config['OUTLINE_WORKERS'] = 3
+        try:
+            notified = []
+            slides = app_module.generate_slide_content_outline("Testo di prova", on_slide=lambda s: notified.append(s['title']))
+        finally:
+            app_module.llm_service.generate_content = original
+            app_module.app.config['OUTLINE_WORKERS'] = 6
+        
+        assert [s['title'] for s in slides] == titles and notified == titles, "Ordine delle slide non preservato"
+        assert slides[4]['content'] == "- Punto della slide 5", "Contenuto associato alla slide sbagliata"
+        assert 1 < max(peak) <= 3, f"Parallelismo errato ({max(peak)})"
+        assert len(contexts) == 1 and "Testo di prova" in contexts.pop(), "Contesto delle slide non condiviso"
+        assert app_module.parse_outline_response("1. Introduzione\n2. Conclusioni") == ["Introduzione", "Conclusioni"], "Scaletta testuale non letta"
+        fenced = '```json\n["Intro", "Mercato",\n]\n```'
+        assert app_module.parse_outline_response(fenced) == ["Intro", "Mercato"], "Scaletta JSON con code fence non riparata"
+        assert app_module.parse_outline_response('1. Intro\n{"nota": \n```\n2. Mercato') == ["Intro", "Mercato"], "Residui JSON letti come titoli"
+        
+        print(f"✅ Generazione a scaletta funzionante ({len(slides)} slide, parallelismo massimo {max(peak)})")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test generazione a scaletta: {e}")
+        return False
+
+def test_failover_and_hedging():
+    """Testa failover tra modelli, circuit breaker e richieste hedged"""
+    print("🧪 Test failover e hedging...")
+    try:
+        import time
+        from llm_service import LLMService
+        from config import ModelConfig, LLMProvider
+        
+        service = LLMService()
+        primary = ModelConfig("primario", LLMProvider.LOCAL, "Ollama: primario", base_url="http://primario:11434")
+        backup = ModelConfig("riserva", LLMProvider.LOCAL, "Ollama: riserva", base_url="http://riserva:11434")
+        models = {"primario": primary, "riserva": backup}
+        service.resolve_model = lambda model_id=None: models.get(model_id, primary)
+        service.fallback_models = ["riserva"]
+        behaviour = {"primario": "errore", "riserva": "ok"}
+        calls = []
+        
+        def fake_generate(system_prompt, prompt, model_config, schema=None):
+            calls.append(model_config.name)
+            if behaviour[model_config.name] == "errore":
+                raise ConnectionError("endpoint non raggiungibile")
+            if behaviour[model_config.name] == "lento":
+                time.sleep(0.5)
+            return f"risposta {model_config.name}"
+        
+        service._generate_local = fake_generate
+        
+        # Failover sul modello di riserva; dopo 3 errori il circuito del primario si apre
+        for i in range(4):
+            assert service.generate_content(f"prompt {i}", use_cache=False) == "risposta riserva", "Failover non eseguito"
+        assert calls.count("primario") == 3, f"Circuito non aperto: {calls}"
+        assert service.resilience_stats()['breakers']['http://primario:11434']['state'] == 'open', "Stato del circuito errato"
+        
+        # Hedging: il primario lento viene superato dalla riserva
+        service._breakers.clear()
+        service.hedging = True
+        behaviour["primario"] = "lento"
+        for _ in range(5):
+            service._latency_window(primary).add(0.05)
+        start = time.perf_counter()
+        response = service.generate_content("prompt hedged", use_cache=False)
+        elapsed = time.perf_counter() - start
+        assert response == "risposta riserva" and elapsed < 0.4, f"Hedging non eseguito ({response}, {elapsed:.2f}s)"
+        
+        print(f"✅ Failover e hedging funzionanti (risposta hedged in {elapsed:.2f}s)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test failover e hedging: {e}")
+        return False
+
+def test_rate_limiting():
+    """Testa limiti di concorrenza, token bucket e rispetto del Retry-After"""
+    print("🧪 Test limitazione delle richieste...")
+    try:
+        import time
+        import threading
+        from rate_limit import RateLimiter, RateLimitedError, CallTimings, parse_retry_after
+        from llm_service import LLMService
+        from config import ModelConfig, LLMProvider
+        
+        # Al più 2 chiamate contemporanee
+        limiter = RateLimiter("test", max_concurrency=2)
+        active, peak = [], []
+        lock = threading.Lock()
+        
+        def call():
+            with limiter.acquire():
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.pop()
+        
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert max(peak) == 2, f"Concorrenza non limitata: {max(peak)}"
+        assert limiter.stats()['max_wait_seconds'] > 0.04, "Attesa in coda non misurata"
+        
+        # Token bucket: 600 richieste/minuto = una ogni 0,1 s dopo la raffica iniziale
+        bucket_limiter = RateLimiter("bucket", requests_per_minute=600)
+        start = time.perf_counter()
+        for _ in range(13):
+            with bucket_limiter.acquire():
+                pass
+        assert time.perf_counter() - start >= 0.25, "Frequenza non limitata"
+        
+        assert parse_retry_after("2") == 2.0 and parse_retry_after("data non valida") is None, "Retry-After non interpretato"
+        
+        # Un 429 con Retry-After viene atteso e la chiamata ripetuta sullo stesso modello
+        service = LLMService()
+        model = ModelConfig("limitato", LLMProvider.LOCAL, "Ollama: limitato", base_url="http://limitato:11434")
+        service.resolve_model = lambda model_id=None: model
+        attempts = []
+        
+        def fake_generate(system_prompt, prompt, model_config, schema=None):
+            attempts.append(time.perf_counter())
+            if len(attempts) == 1:
+                raise RateLimitedError("troppe richieste", retry_after=0.2)
+            return "ok"
+        
+        service._generate_local = fake_generate
+        timings = CallTimings()
+        assert service.generate_content("prompt", use_cache=False, timings=timings) == "ok", "Chiamata non ripetuta"
+        assert attempts[1] - attempts[0] >= 0.19, "Retry-After non rispettato"
+        result = timings.to_dict()
+        assert result['rate_limited'] == 1 and result['queue_wait_seconds'] >= 0.19, f"Tempi errati: {result}"
+        assert service.resilience_stats()['rate_limits']['http://limitato:11434']['rate_limited'] == 1, "Statistiche errate"
+        
+        print(f"✅ Limitazione delle richieste funzionante (attesa in coda {result['queue_wait_seconds']}s)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test limitazione delle richieste: {e}")
+        return False
+
+def test_table_profiling():
+    """Testa il profilo colonnare dei fogli di calcolo e i grafici derivati"""
+    print("🧪 Test profilo fogli di calcolo...")
+    try:
+        from table_profiler import profile_table, format_profile, chart_from_profile
+        
+        rows = [["Regione", "Ricavi"]] + [["Nord" if i % 2 else "Sud", str(100 + i)] for i in range(40)]
+        profile = profile_table("Vendite", rows)
+        assert profile is not None, "Profilo non generato"
+        assert profile['rows'] == 40, "Numero di righe errato"
+        
+        ricavi = profile['columns'][1]
+        assert ricavi['type'] == 'numeric', "Colonna numerica non riconosciuta"
+        assert ricavi['sum'] == sum(100 + i for i in range(40)), "Totale errato"
+        assert ricavi['trend'] > 0, "Trend crescente non rilevato"
+        assert [label for label, _ in profile['top']['items']] == ["Nord", "Sud"], "Classifica top-N errata"
+        
+        digest = format_profile(profile)
+        assert "Ricavi" in digest and len(digest) < sum(len('\t'.join(r)) for r in rows), "Digest non compatto"
+        
+        chart = chart_from_profile(profile)
+        assert chart['type'] == 'bar' and chart['categories'] == ["Nord", "Sud"], "Grafico non valido"
+        
+        # Prodotti chiamati come valori non finiti restano testo
+        products = [["Prodotto", "Ricavi"]] + [["Infinity" if i % 2 else "inf", str(100 + i)] for i in range(40)]
+        product_profile = profile_table("Prodotti", products)
+        assert product_profile['columns'][0]['type'] != 'numeric', "Testo 'Infinity' letto come numero"
+        assert product_profile['columns'][1]['sum'] == ricavi['sum'], "Totale alterato da valori non finiti"
+        
+        # Un foglio solo testuale non viene profilato
+        assert profile_table("Note", [["a"], ["b"]]) is None, "Profilo generato per foglio testuale"
+        
+        print(f"✅ Profilo fogli di calcolo funzionante ({len(digest)} caratteri di digest)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test profilo fogli di calcolo: {e}")
+        return False
+
+def test_docx_fast_path():
+    """Testa l'estrazione rapida DOCX via XML, incluse le tabelle"""
+    print("🧪 Test estrazione rapida DOCX...")
+    try:
+        import docx
+        from extractor import extract_document, ExtractionOptions
+        
+        temp_dir = tempfile.mkdtemp()
+        try:
+            filepath = os.path.join(temp_dir, "tabella.docx")
+            document = docx.Document()
+            document.add_paragraph("Introduzione")
+            table = document.add_table(rows=2, cols=2)
+            for r, row in enumerate([["Regione", "Ricavi"], ["Nord", "100"]]):
+                for c, value in enumerate(row):
+                    table.cell(r, c).text = value
+            document.add_paragraph("Conclusioni")
+            document.save(filepath)
+            
+            fast = extract_document(filepath)
+            assert fast.text == "Introduzione\nRegione\tRicavi\nNord\t100\nConclusioni\n", "Testo estratto errato"
+            assert [c.kind for c in fast.chunks] == ['paragraph', 'table_row', 'table_row', 'paragraph'], "Tipi di chunk errati"
+            
+            # La libreria resta disponibile come percorso alternativo
+            library = extract_document(filepath, ExtractionOptions(xml_fast_path=False))
+            assert library.text == "Introduzione\nConclusioni\n", "Estrazione con libreria errata"
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        
+        print("✅ Estrazione rapida DOCX funzionante (tabelle incluse)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test estrazione rapida DOCX: {e}")
+        return False
+
+def test_background_jobs():
+    """Testa la generazione in background tramite job"""
+    print("🧪 Test job di generazione in background...")
+    try:
+        import io
+        import time
+        from app import app, job_manager
+        
+        with app.test_client() as client:
+            response = client.post('/api/jobs', data={
+                'file': (io.BytesIO("Contenuto di prova per il job".encode('utf-8')), 'job_test.txt')
+            }, content_type='multipart/form-data')
+            assert response.status_code == 202, f"Job non accettato: {response.status_code}"
+            job_id = response.get_json()['job_id']
+            
+            # Attende la fine del job
+            for _ in range(120):
+                status = client.get(f'/api/jobs/{job_id}').get_json()
+                if status['status'] in ('done', 'error'):
+                    break
+                time.sleep(0.5)
+            assert status['status'] == 'done', f"Job non completato: {status}"
+            assert status['progress'] == 100, "Avanzamento non completo"
+            assert all(stage['status'] == 'done' for stage in status['stages'].values()), "Stadi non completati"
+            
+            download = client.get(status['download_url'])
+            assert download.status_code == 200 and len(download.data) > 0, "Download non riuscito"
+            download.close()
+            
+            assert client.get('/api/jobs/inesistente').status_code == 404, "Job inesistente trovato"
+            
+            shutil.rmtree(job_manager.get(job_id).session_path, ignore_errors=True)
+        
+        print(f"✅ Job di generazione completato ({job_id})")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test job in background: {e}")
+        return False
+
+def test_in_memory_download():
+    """Testa il download diretto dalla memoria, senza copie in uploads/ e con una sola scrittura in archivio"""
+    print("🧪 Test download della presentazione dalla memoria...")
+    try:
+        import io
+        from app import app, archive_writer
+        
+        uploads_before = set(os.listdir(app.config['UPLOAD_FOLDER']))
+        with app.test_client() as client:
+            response = client.post('/', data={
+                'file': (io.BytesIO("Contenuto di prova per il download".encode('utf-8')), 'download_test.txt')
+            }, content_type='multipart/form-data')
+            assert response.status_code == 200 and response.data[:2] == b'PK', f"Presentazione non inviata: {response.status_code}"
+            filename = response.headers['Content-Disposition'].split('filename=')[1].strip('"')
+            data = response.data
+            response.close()
+        
+        assert set(os.listdir(app.config['UPLOAD_FOLDER'])) == uploads_before, "Copia della presentazione in uploads/"
+        archive_writer.submit(lambda: None).result()  # attende le scritture in archivio
+        session_path = os.path.join(app.config['ARCHIVE_FOLDER'], filename[:-len("_presentation.pptx")])
+        with open(os.path.join(session_path, filename), 'rb') as f:
+            assert f.read() == data, "Copia in archivio diversa dalla presentazione inviata"
+        assert not any(name.endswith('.tmp') for name in os.listdir(session_path)), "File temporaneo rimasto in archivio"
+        shutil.rmtree(session_path, ignore_errors=True)
+        
+        print(f"✅ Download dalla memoria funzionante ({len(data)} byte)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test download dalla memoria: {e}")
+        return False
+
+def test_incremental_slide_parser():
+    """Testa il parsing delle slide da una risposta in streaming"""
+    print("🧪 Test parsing incrementale delle slide...")
+    try:
+        from slide_parser import IncrementalSlideParser
+        
+        response = 'Ecco le slide:\n[{"title": "Intro {1}", "content": "Testo con \\"virgolette\\""}, {"title": "Fine", "content": "Ciao"}]'
+        parser = IncrementalSlideParser()
+        completed = []
+        for i in range(0, len(response), 7):
+            completed.extend(parser.feed(response[i:i + 7]))
+        
+        assert [s['title'] for s in completed] == ["Intro {1}", "Fine"], f"Slide errate: {completed}"
+        assert completed[0]['content'] == 'Testo con "virgolette"', "Escape non gestiti"
+        assert parser.text == response, "Testo completo non conservato"
+        
+        print("✅ Parsing incrementale delle slide funzionante")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test parsing incrementale: {e}")
+        return False
+
+def test_structured_output():
+    """Testa riparazione e validazione del JSON delle slide e la richiesta di output strutturato"""
+    print("🧪 Test output strutturato...")
+    try:
+        from slide_parser import parse_slides, SLIDES_SCHEMA
+        from llm_service import LLMService
+        
+        fenced = '```json\n[{"title": "A", "content": "Uno",}, {"title": "B", "content": "Due"},]\n```'
+        assert parse_slides(fenced) == [{"title": "A", "content": "Uno"}, {"title": "B", "content": "Due"}], "Virgole finali non rimosse"
+        
+        truncated = 'Ecco il JSON: {"slides": [{"title": "A", "content": ["Punto 1", "Punto 2"]}, {"title": "B", "conte'
+        assert parse_slides(truncated) == [{"title": "A", "content": "Punto 1\nPunto 2"}], "Risposta troncata non recuperata"
+        
+        multiline = '[{"titolo": "C", "contenuto": "riga 1\nriga 2"}] Spero sia utile!'
+        assert parse_slides(multiline) == [{"title": "C", "content": "riga 1\nriga 2"}], "Chiavi alternative non normalizzate"
+        
+        bracketed = 'Ecco le slide [formato JSON]:\n[{"title":"A","content":"B"}]'
+        assert parse_slides(bracketed) == [{"title": "A", "content": "B"}], "Parentesi nel testo introduttivo non ignorate"
+        
+        service = LLMService()
+        model = service._local_model_config("test", "Ollama: test", "http://ollama.test:11434")
+        payloads = []
+        
+        class FakeResponse:
+            status_code = 200
+            def json(self):
+                return {"response": '{"slides": []}'}
+        
+        class FakeSession:
+            def post(self, url, json=None, **kwargs):
+                payloads.append(json)
+                return FakeResponse()
+        
+        service.clients.session = lambda endpoint: FakeSession()
+        service._generate_local("system", "prompt", model, SLIDES_SCHEMA)
+        service._generate_local("system", "prompt", model)
+        assert payloads[0]["format"] == SLIDES_SCHEMA and "format" not in payloads[1], "Schema non inviato a Ollama"
+        
+        print("✅ Output strutturato funzionante")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test output strutturato: {e}")
+        return False
+
+def test_deduplication():
+    """Testa la rimozione di pagine, paragrafi e righe quasi duplicati tra documenti"""
+    print("🧪 Test deduplicazione tra documenti...")
+    try:
+        from extractor import ExtractedDocument, TextChunk
+        from dedup import deduplicate_documents
+        
+        paragraphs = [f"Paragrafo {i}: il fatturato della divisione {i} è cresciuto grazie ai nuovi contratti firmati nel trimestre." for i in range(6)]
+        first = ExtractedDocument("v1.pdf", [
+            TextChunk("v1.pdf", "page", 1, "\n\n".join(paragraphs[:3])),
+            TextChunk("v1.pdf", "page", 2, "\n\n".join(paragraphs[3:])),
+        ])
+        # Seconda versione: pagina 1 con una parola cambiata, un paragrafo nuovo, le righe di un foglio
+        edited = paragraphs[0].replace("nuovi", "recenti")
+        rows = "Regione | Anno | Vendite registrate nel periodo di riferimento\nNord | 2023 | 1000 unità vendute nel periodo di riferimento"
+        second = ExtractedDocument("v2.pdf", [
+            TextChunk("v2.pdf", "page", 1, "\n\n".join([edited] + paragraphs[1:3])),
+            TextChunk("v2.pdf", "page", 2, paragraphs[4] + "\n\nConclusioni nuove: il piano proseguirà anche nel prossimo esercizio."),
+            TextChunk("v2.pdf", "rows", "Foglio1", rows + "\n" + rows.split("\n")[1]),
+        ])
+        third = ExtractedDocument("dati.xlsx", [TextChunk("dati.xlsx", "rows", "Foglio1", rows)])
+        
+        documents, stats = deduplicate_documents([first, second, third])
+        assert documents[0].text == first.text, "Il primo documento non deve cambiare"
+        assert "Paragrafo 0" not in documents[1].text and "Conclusioni nuove" in documents[1].text, "Duplicati non rimossi"
+        assert documents[1].text.count("Nord | 2023") == 2, "Righe ripetute nello stesso foglio rimosse"
+        assert "Nord" not in documents[2].text, "Righe ripetute da un altro documento non rimosse"
+        assert stats["chunks_dropped"] >= 2 and stats["near"] >= 1, f"Conteggi errati: {stats}"
+        assert stats["saved_tokens"] > 0 and stats["output_tokens"] < stats["input_tokens"], "Token risparmiati non riportati"
+        
+        # Cartella di lavoro con lo stesso blocco di righe ripetuto: i dati dello stesso documento restano
+        block = rows + "\n" + rows.split("\n")[1].replace("Nord", "Sud")
+        workbook = ExtractedDocument("ripetuto.xlsx", [
+            TextChunk("ripetuto.xlsx", "rows", "Foglio1", block),
+            TextChunk("ripetuto.xlsx", "rows", "Foglio1", block),
+        ])
+        documents, _ = deduplicate_documents([workbook])
+        assert documents[0].text == workbook.text, "Blocchi di righe ripetuti nello stesso documento rimossi"
+        
+        print(f"✅ Deduplicazione funzionante ({stats['saved_tokens']} token su {stats['input_tokens']} risparmiati)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test deduplicazione: {e}")
+        return False
+
+def test_extractive_summary():
+    """Testa la compressione estrattiva: quota di token, ordine delle frasi e titoli conservati"""
+    print("🧪 Test compressione estrattiva...")
+    try:
+        from extractive import extractive_summary
+        from token_budget import estimate_tokens
+        
+        central = [f"Il fatturato della divisione {name} è cresciuto grazie ai contratti con i clienti europei." for name in ("nord", "sud", "est", "ovest")]
+        noise = ["Il meteo di ieri era piacevole al mare.", "Una ricetta di cucina prevede basilico fresco."]
+        text = ("1. Risultati commerciali\n" + " ".join(central[:2] + noise[:1]) + "\n\n"
+                "2. Prospettive\n" + " ".join(noise[1:] + central[2:]))
+        
+        compressed, stats = extractive_summary(text, ratio=0.85)
+        assert "1. Risultati commerciali" in compressed and "2. Prospettive" in compressed, "Titoli di sezione persi"
+        assert all(sentence not in compressed for sentence in noise), f"Frasi poco rilevanti conservate: {compressed}"
+        positions = [compressed.index(sentence) for sentence in central]
+        assert positions == sorted(positions), "Ordine del documento non mantenuto"
+        assert stats["output_tokens"] <= stats["input_tokens"] * 0.85, f"Quota di token superata: {stats}"
+        assert extractive_summary(text, ratio=0.85, max_tokens=60)[1]["kept_sentences"] < stats["kept_sentences"], "max_tokens ignorato"
+        assert extractive_summary("Testo breve.", ratio=1.0)[0] == "Testo breve.", "Testo entro la quota modificato"
+        
+        # Paragrafi andati a capo: le righe spezzate non sono titoli e le frasi vengono riunite
+        wrapped = "Relazione annuale\n\n" + "\n\n".join(
+            sentence.replace(" grazie", "\ngrazie") + " " + other.replace(" era", "\nera")
+            for sentence, other in zip(central, noise * 2))
+        compressed, wrapped_stats = extractive_summary(wrapped, ratio=0.9, max_tokens=60)
+        assert wrapped_stats["sentences"] == 8 and wrapped_stats["kept_headings"] <= 1, f"Righe spezzate lette come titoli: {wrapped_stats}"
+        assert wrapped_stats["output_tokens"] <= 60 and estimate_tokens(compressed) <= 60, f"max_tokens superato: {wrapped_stats}"
+        assert any(sentence in compressed for sentence in central), "Frasi riunite non conservate"
+        
+        # Solo titoli: contano nel budget come le frasi
+        outline = "\n\n".join(f"Capitolo {i} della relazione" for i in range(40))
+        assert extractive_summary(outline, ratio=0.5)[1]["output_tokens"] <= estimate_tokens(outline) * 0.5, "Titoli fuori budget"
+        
+        print(f"✅ Compressione estrattiva funzionante ({stats['output_tokens']} token su {stats['input_tokens']})")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test compressione estrattiva: {e}")
+        return False
+
+def test_template_cache():
+    """Testa la cache dei template PPTX: lettura unica, invalidazione per data di modifica e template con nome"""
+    print("🧪 Test cache dei template...")
+    try:
+        import shutil
+        from template_cache import TemplateCache, TemplateNotFoundError
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copy2(os.path.join("static", "template.pptx"), os.path.join(temp_dir, "template.pptx"))
+            shutil.copy2(os.path.join("static", "template.pptx"), os.path.join(temp_dir, "aziendale.pptx"))
+            cache = TemplateCache(temp_dir)
+            assert cache.names() == ["template", "aziendale"], f"Template elencati: {cache.names()}"
+            
+            template = cache.get()
+            assert cache.get() is template and cache.get("aziendale") is not template, "Template non riusato"
+            assert cache.stats()["loads"] == 2 and cache.stats()["hits"] == 1, f"Statistiche errate: {cache.stats()}"
+            
+            # Ogni render parte da una copia nuova del template
+            base_slides = len(template.new_presentation().slides)
+            first = template.new_presentation()
+            first.slides.add_slide(first.slide_layouts[template.layouts["content"]])
+            assert len(template.new_presentation().slides) == base_slides, "Copie del template non indipendenti"
+            
+            stat = os.stat(os.path.join(temp_dir, "template.pptx"))
+            os.utime(os.path.join(temp_dir, "template.pptx"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            assert cache.get() is not template and cache.stats()["loads"] == 3, "Template modificato non riletto"
+            
+            for name in ("../template", "inesistente"):
+                try:
+                    cache.get(name)
+                    raise AssertionError(f"Template {name} accettato")
+                except TemplateNotFoundError:
+                    pass
+        
+        print("✅ Cache dei template funzionante")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test cache dei template: {e}")
+        return False
+
+def test_prompt_caching():
+    """Testa l'invio del system prompt come parte separata e il conteggio dei token in cache"""
+    print("🧪 Test cache dei prompt dei provider...")
+    try:
+        from types import SimpleNamespace
+        from llm_service import LLMService
+        from config import ModelConfig, LLMProvider
+        from rate_limit import CallTimings
+        
+        service = LLMService()
+        requests_sent = []
+        
+        def fake_create(**kwargs):
+            requests_sent.append(kwargs)
+            usage = {"input_tokens": 20, "cache_read_input_tokens": 1000, "cache_creation_input_tokens": 0}
+            return SimpleNamespace(content=[SimpleNamespace(text="ok")], usage=SimpleNamespace(**usage))
+        
+        service.anthropic_client = SimpleNamespace(messages=SimpleNamespace(create=fake_create))
+        model = ModelConfig("claude-test", LLMProvider.ANTHROPIC, "Claude test")
+        service.resolve_model = lambda model_id=None: model
+        service.fallback_models = []
+        
+        timings = CallTimings()
+        for i in range(2):
+            service.generate_content(f"slide {i}", use_cache=False, timings=timings, context="Documento comune")
+        systems = [request["system"] for request in requests_sent]
+        assert systems[0] == systems[1], "Prefisso di sistema diverso tra le chiamate"
+        assert systems[0][0]["cache_control"] == {"type": "ephemeral"}, "Prefisso non marcato come cacheable"
+        assert "Documento comune" in systems[0][0]["text"], "Contesto non incluso nel prefisso"
+        assert requests_sent[1]["messages"] == [{"role": "user", "content": "slide 1"}], "Prompt utente errato"
+        
+        result = timings.to_dict()
+        assert result["input_tokens"] == 2040 and result["cached_tokens"] == 2000, f"Token in cache non riportati: {result}"
+        stats = service.prompt_cache_stats()["models"]["claude-test"]
+        assert stats["calls"] == 2 and stats["cached_ratio"] == 0.98, f"Statistiche errate: {stats}"
+        
+        # OpenAI: system prompt come primo messaggio, token in cache da prompt_tokens_details
+        assert service._chat_messages("sistema", "utente")[0] == {"role": "system", "content": "sistema"}
+        openai_model = ModelConfig("gpt-test", LLMProvider.OPENAI, "GPT test")
+        service._report_openai_usage(openai_model, {"prompt_tokens": 1500, "prompt_tokens_details": {"cached_tokens": 1024}})
+        assert service._take_usage() == {"input_tokens": 1500, "cached_tokens": 1024, "cache_write_tokens": 0}
+        
+        print(f"✅ Cache dei prompt funzionante ({stats['cached_ratio']:.0%} dei token in input dalla cache)")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test cache dei prompt: {e}")
+        return False
+
+def test_batch_cli():
+    """Testa la generazione in batch con checkpoint e ripresa"""
+    print("🧪 Test generazione in batch...")
+    try:
+        import threading
+        import batch
+        import app as app_module
+        
+        calls = []
+        
+        def fake_generate_content(prompt, model_id=None, use_cache=True, timings=None, schema=None):
+            calls.append(prompt)
+            if "Errore simulato" in prompt:
+                raise Exception("modello non disponibile")
+            return '[{"title": "Titolo", "content": "Contenuto"}]'
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source = os.path.join(temp_dir, "report")
+            os.makedirs(source)
+            for i in range(3):
+                with open(os.path.join(source, f"report_{i}.txt"), "w", encoding="utf-8") as f:
+                    f.write(f"Report numero {i}: fatturato in crescita del {i + 10}%.")
+            with open(os.path.join(source, "rotto.txt"), "w", encoding="utf-8") as f:
+                f.write("Errore simulato")
+            output = os.path.join(temp_dir, "out")
+            summary_path = os.path.join(temp_dir, "summary.json")
+            
+            original = app_module.llm_service.generate_content
+            original_streaming = app_module.app.config['LLM_STREAMING']
+            original_archive = app_module.app.config['ARCHIVE_FOLDER']
+            app_module.llm_service.generate_content = fake_generate_content
+            app_module.app.config['LLM_STREAMING'] = False
+            try:
+                args = [source, "--output", output, "--llm-workers", "2", "--no-cache", "--summary", summary_path]
+                exit_code = batch.main(args)
+                with open(summary_path, encoding="utf-8") as f:
+                    summary = json.load(f)
+                assert exit_code == 1 and summary['done'] == 3 and summary['failed'] == 1, f"Riepilogo errato: {summary}"
+                assert summary['latency_seconds']['generation']['p50'] is not None, "Latenze mancanti"
+                decks = [name for root, dirs, files in os.walk(output) for name in files if name.endswith('.pptx')]
+                assert len(decks) == 3, f"Presentazioni generate: {len(decks)}"
+                
+                # Ripresa: solo il documento fallito viene rielaborato
+                first_run_calls = len(calls)
+                batch.main(args)
+                with open(summary_path, encoding="utf-8") as f:
+                    summary = json.load(f)
+                assert summary['skipped'] == 3 and len(calls) == first_run_calls + 1, "Checkpoint non rispettato"
+                
+                # Zero worker: il batch usa comunque un worker e termina
+                checkpoint = batch.Checkpoint(os.path.join(temp_dir, "zero.jsonl"))
+                paths = batch.collect_inputs(source, False)
+                outcome = {}
+                worker = threading.Thread(target=lambda: outcome.update(batch.run_batch(paths, checkpoint, 0, 0, use_cache=False, log=lambda message: None)), daemon=True)
+                worker.start()
+                worker.join(30)
+                assert not worker.is_alive() and outcome['done'] == 3, "Batch bloccato con zero worker"
+            finally:
+                app_module.llm_service.generate_content = original
+                app_module.app.config['LLM_STREAMING'] = original_streaming
+                app_module.app.config['ARCHIVE_FOLDER'] = original_archive
+        
+        print("✅ Generazione in batch funzionante")
+        return True
+    except Exception as e:
+        print(f"❌ Errore test generazione in batch: {e}")
+        return False
+
 def main():
     """Esegue tutti i test avanzati"""
     print("🚀 Test Avanzati SlideGuru\n")
@@ -193,7 +1109,28 @@ def main():
         test_api_key_persistence,
         test_archive_folder_creation,
         test_model_availability,
-        test_single_active_model
+        test_single_active_model,
+        test_extraction_cache,
+        test_llm_response_cache,
+        test_client_registry,
+        test_local_model_discovery,
+        test_local_warmup,
+        test_map_reduce,
+        test_token_budget,
+        test_outline_generation,
+        test_failover_and_hedging,
+        test_rate_limiting,
+        test_table_profiling,
+        test_docx_fast_path,
+        test_background_jobs,
+        test_in_memory_download,
+        test_incremental_slide_parser,
+        test_structured_output,
+        test_deduplication,
+        test_extractive_summary,
+        test_template_cache,
+        test_prompt_caching,
+        test_batch_cli
     ]
     
     passed = 0
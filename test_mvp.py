@@ -101,6 +101,45 @@ def test_file_processing():
         print(f"❌ Errore elaborazione file: {e}")
         return False
 
+def test_parallel_extraction():
+    """Testa l'estrazione parallela di più file"""
+    print("🧪 Test estrazione parallela...")
+    try:
+        from extractor import extract_documents, combine_documents, select_pdf_pages
+        
+        temp_files = []
+        for i in range(3):
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
+                f.write(f"Documento numero {i}")
+                temp_files.append(f.name)
+        
+        try:
+            documents = extract_documents(temp_files, max_workers=2)
+            assert [d.filepath for d in documents] == temp_files, "Ordine dei file non preservato"
+            assert [d.text for d in documents] == [f"Documento numero {i}" for i in range(3)], "Testo estratto errato"
+            assert all(d.seconds >= 0 for d in documents), "Tempi di estrazione non validi"
+            assert all(c.source == os.path.basename(d.filepath) for d in documents for c in d.chunks), "Provenienza chunk errata"
+            print(f"✅ Estrazione parallela funzionante ({len(documents)} file)")
+            
+            # Il testo combinato rispetta il budget di caratteri
+            combined = combine_documents(documents, max_chars=30)
+            assert len(combined) <= 30, "Budget di caratteri non rispettato"
+            assert combined.startswith("Documento numero 0"), "Ordine dei documenti non preservato"
+            
+            # Campionamento delle pagine dei PDF lunghi
+            assert select_pdf_pages(10) == list(range(10)), "Selezione pagine senza limite errata"
+            assert select_pdf_pages(1000, 4, 'head') == [0, 1, 2, 3], "Politica head errata"
+            assert select_pdf_pages(1000, 4, 'uniform') == [0, 250, 500, 750], "Politica uniform errata"
+            assert select_pdf_pages(1000, 4, 'head_tail') == [0, 1, 998, 999], "Politica head_tail errata"
+        finally:
+            for temp_file in temp_files:
+                os.unlink(temp_file)
+        
+        return True
+    except Exception as e:
+        print(f"❌ Errore estrazione parallela: {e}")
+        return False
+
 def test_template_exists():
     """Testa che il template PowerPoint esista"""
     print("🧪 Test template PowerPoint...")
@@ -147,6 +186,7 @@ def main():
         test_config_loading,
         test_llm_service,
         test_file_processing,
+        test_parallel_extraction,
         test_template_exists,
         test_flask_app
     ]
@@ -0,0 +1,135 @@
+import re
+import math
+import threading
+
+# Stima prudente dei caratteri per token (testo italiano/inglese, tokenizer BPE)
+CHARS_PER_TOKEN = 3.5
+
+# Token di risposta attesi quando il modello può arrivare a max_tokens
+EXPECTED_OUTPUT_TOKENS = 1500
+
+# Latenza iniziale (s) e velocità (token/s) di lettura del prompt e di generazione per provider
+PROVIDER_SPEED = {
+    'openai': (0.6, 3000, 60),
+    'anthropic': (0.8, 3000, 50),
+    'google': (0.6, 4000, 80),
+    'local': (0.3, 400, 20),
+}
+DEFAULT_SPEED = (1.0, 1000, 30)
+
+# Peso delle latenze osservate nella correzione delle stime (media mobile esponenziale)
+LATENCY_EMA_ALPHA = 0.3
+
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]")
+_latency_factors = {}
+_latency_lock = threading.Lock()
+
+class TokenBudgetError(Exception):
+    """La richiesta supera il context window del modello"""
+
+def estimate_tokens(text):
+    """Stima il numero di token di un testo senza tokenizer.
+
+    Usa il massimo tra la stima per caratteri e il numero di parole e simboli,
+    così da non sottostimare testi con molta punteggiatura o numeri.
+    """
+    if not text:
+        return 0
+    return math.ceil(max(len(text) / CHARS_PER_TOKEN, len(_WORD_PIECES.findall(text))))
+
+def _provider_name(model_config):
+    return str(getattr(model_config.provider, 'value', model_config.provider))
+
+def _latency_key(model_config):
+    return (_provider_name(model_config), model_config.name)
+
+def expected_latency(model_config, input_tokens, output_tokens):
+    """Secondi attesi per una chiamata, corretti con le latenze osservate per il modello"""
+    base, read_speed, write_speed = PROVIDER_SPEED.get(_provider_name(model_config), DEFAULT_SPEED)
+    seconds = base + input_tokens / read_speed + output_tokens / write_speed
+    with _latency_lock:
+        return seconds * _latency_factors.get(_latency_key(model_config), 1.0)
+
+def record_latency(model_config, input_tokens, output_tokens, seconds):
+    """Registra la durata reale di una chiamata per affinare le stime successive"""
+    base, read_speed, write_speed = PROVIDER_SPEED.get(_provider_name(model_config), DEFAULT_SPEED)
+    predicted = base + input_tokens / read_speed + output_tokens / write_speed
+    key = _latency_key(model_config)
+    with _latency_lock:
+        factor = _latency_factors.get(key)
+        observed = seconds / predicted
+        _latency_factors[key] = observed if factor is None else factor + LATENCY_EMA_ALPHA * (observed - factor)
+
+def estimate_call(model_config, input_tokens, output_tokens=None):
+    """Preventivo di una singola chiamata: token, spazio nel context window, costo e latenza"""
+    if output_tokens is None:
+        output_tokens = min(model_config.max_tokens, EXPECTED_OUTPUT_TOKENS)
+    available = model_config.context_window - model_config.max_tokens
+    rate = model_config.cost_per_1k_tokens or 0.0
+    return {
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'context_window': model_config.context_window,
+        'max_input_tokens': available,
+        'fits': input_tokens <= available,
+        'overflow_tokens': max(0, input_tokens - available),
+        'cost_usd': round((input_tokens + output_tokens) / 1000 * rate, 6),
+        'max_cost_usd': round((input_tokens + model_config.max_tokens) / 1000 * rate, 6),
+        'latency_seconds': round(expected_latency(model_config, input_tokens, output_tokens), 2),
+    }
+
+def estimate_prompt(model_config, system_prompt, prompt, output_tokens=None):
+    """Preventivo di una chiamata a partire dal system prompt e dal prompt"""
+    return estimate_call(model_config, estimate_tokens(system_prompt) + estimate_tokens(prompt), output_tokens)
+
+def _sum_estimates(estimates, latency):
+    return {
+        'calls': sum(e.get('calls', 1) for e in estimates),
+        'input_tokens': sum(e['input_tokens'] for e in estimates),
+        'output_tokens': sum(e['output_tokens'] for e in estimates),
+        'cost_usd': round(sum(e['cost_usd'] for e in estimates), 6),
+        'max_cost_usd': round(sum(e['max_cost_usd'] for e in estimates), 6),
+        'fits': all(e['fits'] for e in estimates),
+        'latency_seconds': round(latency, 2),
+    }
+
+def parallel_estimates(estimates, parallelism=1):
+    """Preventivo di chiamate eseguite a ondate di `parallelism` contemporanee"""
+    waves = math.ceil(len(estimates) / max(1, parallelism))
+    slowest = max((e['latency_seconds'] for e in estimates), default=0.0)
+    return _sum_estimates(estimates, waves * slowest)
+
+def sequential_estimates(estimates):
+    """Preventivo di chiamate (o gruppi di chiamate) eseguite una dopo l'altra"""
+    return _sum_estimates(estimates, sum(e['latency_seconds'] for e in estimates))
+
+def compress_text(text):
+    """Compressione senza perdita di contenuto: spazi ridondanti e righe ripetute"""
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = ' '.join(line.split())
+        if line and line in seen and len(line) > 20:
+            continue  # righe lunghe duplicate (intestazioni e piè di pagina ripetuti)
+        seen.add(line)
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return '\n'.join(lines)
+
+def trim_to_tokens(text, max_tokens):
+    """Riduce il testo entro `max_tokens`: prima lo comprime, poi lo tronca su un confine di paragrafo"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    text = compress_text(text)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Ricerca binaria della lunghezza massima che rientra nel budget
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text.rfind('\n\n', 0, low)
+    return text[:cut if cut > low * 0.8 else low]